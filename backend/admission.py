@@ -0,0 +1,125 @@
+"""
+Controle de admissão das verificações de acesso.
+
+Numa rajada (troca de turno), todas as verificações pagariam o pipeline
+completo e ficariam na fila do pool até o cliente desistir. O controlador
+olha a carga do pool de reconhecimento (verificações pendentes por worker)
+e há quanto tempo o item mais antigo espera na fila, e escolhe um nível
+para cada requisição:
+
+- normal: o perfil pedido, sem mudanças;
+- reduced: só a rotação 0, sem jitter e detecção em imagem menor;
+- minimal: além disso, sem melhoria de imagem e só propostas Haar na cascata;
+- shed: recusa na hora com 503 e Retry-After.
+
+Os limiares de aceitação (tolerância e confiança mínima) do perfil nunca
+mudam: degradar pode negar quem seria liberado, mas não libera ninguém a
+mais. O nível vai na resposta (campo degradation) e em
+admission_decisions_total.
+"""
+import logging
+import math
+import threading
+from dataclasses import dataclass, replace
+from typing import Optional, Tuple
+
+import config
+import metrics
+from recognition_profiles import RecognitionProfile
+
+
+NORMAL = "normal"
+REDUCED = "reduced"
+MINIMAL = "minimal"
+SHED = "shed"
+
+LEVELS = (NORMAL, REDUCED, MINIMAL, SHED)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AdmissionDecision:
+    level: str
+    load: float  # verificações pendentes por worker
+    queue_wait: float  # espera do item mais antigo da fila (s)
+    retry_after: int = 0
+
+    @property
+    def degradation(self) -> Optional[str]:
+        """Nível informado na resposta (None quando o pipeline não mudou)"""
+        return self.level if self.level in (REDUCED, MINIMAL) else None
+
+
+def degrade(profile: RecognitionProfile, level: str,
+            reduced_face_size: int = config.ADMISSION_REDUCED_FACE_SIZE,
+            minimal_face_size: int = config.ADMISSION_MINIMAL_FACE_SIZE) -> RecognitionProfile:
+    """Versão mais barata do perfil para o nível (nunca mais cara que o próprio perfil)"""
+    if level not in (REDUCED, MINIMAL):
+        return profile
+    angles = profile.rotation_angles if profile.rotation_angles is not None else config.ROTATION_ANGLES
+    target = profile.detect_target_face_size or config.DETECT_TARGET_FACE_SIZE
+    changes = {
+        "rotation_angles": list(angles[:1]) or [0],
+        "num_jitters": 1,
+        "detect_target_face_size": min(target, reduced_face_size if level == REDUCED else minimal_face_size),
+    }
+    if level == MINIMAL:
+        changes.update(enhance=False, hog_upsample=0)
+        if (profile.detect_method or config.DETECT_METHOD) == "cascade":
+            changes["proposal_detector"] = "haar"
+    return replace(profile, **changes)
+
+
+class AdmissionController:
+    """Escolhe o nível de cada verificação pela carga e pela espera na fila do pool"""
+
+    def __init__(self, pool, enabled: bool = config.ADMISSION_ENABLED,
+                 load_limits: Tuple[float, float, float] = (config.ADMISSION_REDUCED_LOAD, config.ADMISSION_MINIMAL_LOAD,
+                                                            config.ADMISSION_SHED_LOAD),
+                 wait_limits: Tuple[float, float, float] = (config.ADMISSION_REDUCED_WAIT, config.ADMISSION_MINIMAL_WAIT,
+                                                            config.ADMISSION_SHED_WAIT),
+                 retry_after: int = config.ADMISSION_RETRY_AFTER_SECONDS):
+        """
+        Args:
+            load_limits: verificações pendentes por worker a partir das quais vale
+                reduced, minimal e shed
+            wait_limits: espera na fila (s) a partir da qual vale cada nível
+        """
+        self.pool = pool
+        self.enabled = enabled
+        self.load_limits = load_limits
+        self.wait_limits = wait_limits
+        self.retry_after = retry_after
+        self.active = 0  # verificações admitidas ainda sem resposta
+        self.last_level = NORMAL
+        self._lock = threading.Lock()
+
+    def _level(self, load: float, queue_wait: float) -> str:
+        level = 0
+        for index, (load_limit, wait_limit) in enumerate(zip(self.load_limits, self.wait_limits), start=1):
+            if (load_limit > 0 and load >= load_limit) or (wait_limit > 0 and queue_wait >= wait_limit):
+                level = index
+        return LEVELS[level]
+
+    def admit(self) -> AdmissionDecision:
+        """Decide o nível da próxima verificação; se não for shed, ela conta como ativa até release()"""
+        if not self.enabled:
+            return AdmissionDecision(NORMAL, 0.0, 0.0)
+        with self._lock:
+            load = max(self.pool.outstanding(), self.active) / self.pool.max_workers
+            queue_wait = self.pool.oldest_wait()
+            level = self._level(load, queue_wait)
+            if level != SHED:
+                self.active += 1
+            changed, self.last_level = level != self.last_level, level
+        if changed:
+            logger.warning(f"Admissão: nível {level} (carga {load:.2f} por worker, espera na fila {queue_wait:.2f}s)")
+        metrics.ADMISSION_DECISIONS.labels(level).inc()
+        retry_after = max(self.retry_after, math.ceil(queue_wait)) if level == SHED else 0
+        return AdmissionDecision(level, load, queue_wait, retry_after)
+
+    def release(self, decision: AdmissionDecision):
+        if self.enabled and decision.level != SHED:
+            with self._lock:
+                self.active -= 1
@@ -0,0 +1,275 @@
+"""
+Agregados de access_logs para o dashboard.
+
+Cada AccessLog gravado incrementa, na mesma transação, uma linha por hora e
+uma por dia (UTC) em access_rollup_hourly/access_rollup_daily, chaveadas por
+usuário, tipo de acesso, decisão e documento. As consultas do dashboard
+(série de tentativas, usuários mais frequentes, picos de negação, mapa de
+acesso a documentos) leem só os agregados, cujo tamanho depende do período
+e não do volume de tentativas.
+
+O incremento é feito por um listener after_flush registrado no
+SessionLocal ao importar este módulo, o que cobre todos os pontos que gravam
+AccessLog. O histórico anterior (ou um período a corrigir) é recalculado por
+backfill(), um dia por transação; a API faz isso sozinha na inicialização
+quando os agregados estão vazios e já existem registros.
+"""
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, event, func
+from sqlalchemy.dialects.sqlite import insert
+
+from database import AccessLog, AccessRollupDaily, AccessRollupHourly, AuthorizedUser, Document, SessionLocal
+
+
+ROLLUPS = {"hour": AccessRollupHourly, "day": AccessRollupDaily}
+STEPS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+KEY_COLUMNS = ("bucket", "user_id", "access_type", "access_granted", "document_id")
+DEFAULT_ACCESS_TYPE = "facial_recognition"  # default da coluna AccessLog.access_type
+
+# Chave de um agregado sem o bucket: (user_id, access_type, access_granted, document_id)
+RollupKey = Tuple[int, str, bool, int]
+
+logger = logging.getLogger(__name__)
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """Datas com fuso são convertidas para UTC; o SQLite guarda sem fuso"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def bucket_start(value: datetime, granularity: str) -> datetime:
+    value = to_utc_naive(value).replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if granularity == "day" else value
+
+
+def rollup_key(user_id, access_type, access_granted, document_id) -> RollupKey:
+    return (user_id or 0, access_type or DEFAULT_ACCESS_TYPE, bool(access_granted), document_id or 0)
+
+
+def add_attempts(connection, granularity: str, counts: Dict[Tuple[datetime, RollupKey], int]):
+    """Soma as contagens nos agregados (insere a linha ou incrementa a existente)"""
+    if not counts:
+        return
+    table = ROLLUPS[granularity].__table__
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(KEY_COLUMNS),
+        set_={"attempts": table.c.attempts + statement.excluded.attempts},
+    )
+    connection.execute(statement, [
+        {"bucket": bucket, "user_id": key[0], "access_type": key[1], "access_granted": key[2],
+         "document_id": key[3], "attempts": attempts}
+        for (bucket, key), attempts in counts.items()
+    ])
+
+
+def count_logs(logs: Iterable[AccessLog]) -> Dict[str, Dict[Tuple[datetime, RollupKey], int]]:
+    counts = {granularity: {} for granularity in ROLLUPS}
+    for log in logs:
+        timestamp = log.timestamp or datetime.now(timezone.utc)
+        key = rollup_key(log.user_id, log.access_type, log.access_granted, log.document_id)
+        for granularity, granularity_counts in counts.items():
+            bucket = (bucket_start(timestamp, granularity), key)
+            granularity_counts[bucket] = granularity_counts.get(bucket, 0) + 1
+    return counts
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _count_new_logs(session, flush_context):
+    """Incrementa os agregados com os AccessLog recém-inseridos, na mesma transação"""
+    logs = [obj for obj in session.new if isinstance(obj, AccessLog)]
+    if not logs:
+        return
+    connection = session.connection()
+    for granularity, counts in count_logs(logs).items():
+        add_attempts(connection, granularity, counts)
+
+
+def rebuild_range(db, start: datetime, stop: datetime) -> int:
+    """
+    Recalcula os agregados de [start, stop) (dias inteiros) a partir de access_logs
+
+    O DELETE vem primeiro para que a transação segure a escrita do SQLite:
+    registros gravados durante o recálculo esperam e não são perdidos nem
+    contados duas vezes.
+    """
+    for model in ROLLUPS.values():
+        db.execute(delete(model).where(model.bucket >= start, model.bucket < stop))
+
+    hour = func.strftime("%Y-%m-%d %H:00:00", AccessLog.timestamp)
+    rows = db.query(hour, AccessLog.user_id, AccessLog.access_type, AccessLog.access_granted,
+                    AccessLog.document_id, func.count()) \
+        .filter(AccessLog.timestamp >= start, AccessLog.timestamp < stop) \
+        .group_by(hour, AccessLog.user_id, AccessLog.access_type, AccessLog.access_granted, AccessLog.document_id) \
+        .all()
+
+    counts = {granularity: {} for granularity in ROLLUPS}
+    total = 0
+    for hour_text, user_id, access_type, access_granted, document_id, attempts in rows:
+        hour_start = datetime.strptime(hour_text, "%Y-%m-%d %H:%M:%S")
+        key = rollup_key(user_id, access_type, access_granted, document_id)
+        for granularity, granularity_counts in counts.items():
+            bucket = (bucket_start(hour_start, granularity), key)
+            granularity_counts[bucket] = granularity_counts.get(bucket, 0) + attempts
+        total += attempts
+
+    connection = db.connection()
+    for granularity, granularity_counts in counts.items():
+        add_attempts(connection, granularity, granularity_counts)
+    db.commit()
+    return total
+
+
+def backfill(since: Optional[datetime] = None) -> int:
+    """
+    Recalcula os agregados a partir de access_logs (todo o histórico, ou a
+    partir de since), um dia por transação
+
+    Returns:
+        int: registros contados
+    """
+    db = SessionLocal()
+    try:
+        first, last = db.query(func.min(AccessLog.timestamp), func.max(AccessLog.timestamp)).one()
+        if first is None:
+            return 0
+        start = bucket_start(max(first, to_utc_naive(since)) if since else first, "day")
+        last = to_utc_naive(last)
+        total = 0
+        while start <= last:
+            stop = start + STEPS["day"]
+            total += rebuild_range(db, start, stop)
+            start = stop
+        logger.info(f"Agregados de acesso recalculados: {total} registros")
+        return total
+    finally:
+        db.close()
+
+
+def backfill_if_empty() -> int:
+    """Preenche os agregados a partir do histórico na primeira inicialização com esta versão"""
+    db = SessionLocal()
+    try:
+        if db.query(AccessRollupHourly.id).first() is not None or db.query(AccessLog.id).first() is None:
+            return 0
+    finally:
+        db.close()
+    return backfill()
+
+
+def buckets(since: datetime, until: datetime, granularity: str) -> List[datetime]:
+    step = STEPS[granularity]
+    current = bucket_start(since, granularity)
+    result = []
+    while current < until:
+        result.append(current)
+        current += step
+    return result
+
+
+def granted_columns(model):
+    """Somas de tentativas liberadas e negadas"""
+    return (
+        func.sum(case((model.access_granted == True, model.attempts), else_=0)),
+        func.sum(case((model.access_granted == True, 0), else_=model.attempts)),
+    )
+
+
+def attempts_over_time(db, granularity: str, since: datetime, until: datetime,
+                       access_type: Optional[str] = None) -> List[dict]:
+    """Tentativas liberadas/negadas por hora ou dia, com zeros nos períodos sem registros"""
+    model = ROLLUPS[granularity]
+    granted, denied = granted_columns(model)
+    query = db.query(model.bucket, granted, denied).filter(model.bucket >= bucket_start(since, granularity),
+                                                           model.bucket < until)
+    if access_type:
+        query = query.filter(model.access_type == access_type)
+    found = {bucket: (granted_count, denied_count)
+             for bucket, granted_count, denied_count in query.group_by(model.bucket).all()}
+
+    series = []
+    for bucket in buckets(since, until, granularity):
+        granted_count, denied_count = found.get(bucket, (0, 0))
+        series.append({"bucket": bucket, "granted": granted_count, "denied": denied_count,
+                       "total": granted_count + denied_count})
+    return series
+
+
+def top_users(db, since: datetime, until: datetime, limit: int = 10,
+              access_type: Optional[str] = None) -> List[dict]:
+    """Usuários identificados com mais tentativas no período (dias inteiros)"""
+    model = AccessRollupDaily
+    granted, denied = granted_columns(model)
+    total = func.sum(model.attempts)
+    query = db.query(model.user_id, granted, denied, total) \
+        .filter(model.bucket >= bucket_start(since, "day"), model.bucket < until, model.user_id != 0)
+    if access_type:
+        query = query.filter(model.access_type == access_type)
+    rows = query.group_by(model.user_id).order_by(total.desc()).limit(limit).all()
+
+    names = dict(db.query(AuthorizedUser.id, AuthorizedUser.name)
+                 .filter(AuthorizedUser.id.in_([row[0] for row in rows])).all())
+    return [{"user_id": user_id, "name": names.get(user_id), "granted": granted_count,
+             "denied": denied_count, "total": total_count}
+            for user_id, granted_count, denied_count, total_count in rows]
+
+
+def denial_spikes(db, until: datetime, hours: int = 24, baseline_hours: int = 168, factor: float = 3.0,
+                  min_denials: int = 5, access_type: Optional[str] = None) -> dict:
+    """
+    Horas das últimas `hours` com negações bem acima do normal
+
+    O normal é a média e o desvio padrão das negações por hora nas
+    baseline_hours anteriores à janela; uma hora é pico se tiver pelo menos
+    min_denials negações e passar de média + factor * desvio.
+    """
+    window_start = bucket_start(until, "hour") - timedelta(hours=hours - 1)
+    series = attempts_over_time(db, "hour", window_start - timedelta(hours=baseline_hours),
+                                window_start + timedelta(hours=hours), access_type)
+    baseline = [point["denied"] for point in series[:baseline_hours]]
+    mean = sum(baseline) / len(baseline) if baseline else 0.0
+    std = math.sqrt(sum((value - mean) ** 2 for value in baseline) / len(baseline)) if baseline else 0.0
+    threshold = max(float(min_denials), mean + factor * std)
+
+    spikes = [{**point, "excess": point["denied"] - mean}
+              for point in series[baseline_hours:] if point["denied"] >= threshold]
+    return {"baseline_mean": mean, "baseline_std": std, "threshold": threshold, "spikes": spikes}
+
+
+def document_heatmap(db, since: datetime, until: datetime) -> dict:
+    """Acessos por documento e por dia (liberados e negados), para o mapa de calor"""
+    model = AccessRollupDaily
+    granted, denied = granted_columns(model)
+    days = buckets(since, until, "day")
+    rows = db.query(model.document_id, model.bucket, granted, denied) \
+        .filter(model.bucket >= bucket_start(since, "day"), model.bucket < until, model.document_id != 0) \
+        .group_by(model.document_id, model.bucket).all()
+
+    index = {day: position for position, day in enumerate(days)}
+    documents: Dict[int, dict] = {}
+    for document_id, bucket, granted_count, denied_count in rows:
+        if bucket not in index:
+            continue
+        entry = documents.setdefault(document_id, {"document_id": document_id, "title": None,
+                                                   "granted": [0] * len(days), "denied": [0] * len(days)})
+        entry["granted"][index[bucket]] = granted_count
+        entry["denied"][index[bucket]] = denied_count
+
+    titles = dict(db.query(Document.id, Document.title).filter(Document.id.in_(list(documents))).all())
+    for document_id, entry in documents.items():
+        entry["title"] = titles.get(document_id)
+        entry["total"] = sum(entry["granted"]) + sum(entry["denied"])
+    return {"days": days, "documents": sorted(documents.values(), key=lambda entry: -entry["total"])}
+
+
+def totals(db) -> Tuple[int, int]:
+    """(tentativas, liberadas) de todo o histórico, somando os agregados diários"""
+    granted, _ = granted_columns(AccessRollupDaily)
+    total_count, granted_count = db.query(func.sum(AccessRollupDaily.attempts), granted).one()
+    return total_count or 0, granted_count or 0
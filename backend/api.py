@@ -1,6 +1,11 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
+import time
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, Response
 from sqlalchemy.orm import Session
 import cv2
 import numpy as np
@@ -8,16 +13,32 @@ import base64
 import io
 import os
 import shutil
-from datetime import datetime, timedelta
-from typing import List, Optional
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
 import logging
 from functools import wraps
 
-from database import get_db, init_database, AuthorizedUser, AccessLog, Document, AccessLevel, DocumentLevel as ModelDocumentLevel, get_accessible_documents
+from database import get_db, init_database, SessionLocal, AuthorizedUser, AccessLog, Camera, Document, RegistrationJob, AccessLevel, DocumentLevel as ModelDocumentLevel, get_accessible_documents
 from models import (UserCreate, UserResponse, AccessResponse, UserUpdate, DocumentCreate, 
-                DocumentResponse, DocumentAccessResponse, AccessResponse, 
-                AccessLevel as ModelAccessLevel)
+                DocumentResponse, DocumentAccessResponse, AccessResponse, RegistrationJobResponse,
+                CameraCreate, CameraUpdate, CameraResponse, AccessLevel as ModelAccessLevel)
+from cameras import CameraConfig, CameraManager, open_source
 from face_recognition_module import FaceRecognitionSystem
+from face_quality import RETAKE_MESSAGES
+from frame_stream import FrameSession
+from registration_jobs import ACTIVE_STATUSES, FAILED, TERMINAL_STATUSES, RegistrationJobRunner
+from image_pipeline import decode_image, prepare_image
+from recognition_profiles import RecognitionProfile, get_profile, resolve_profile
+from workers import recognition_pool
+from profiling import profiler
+from readiness import StartupState
+from admission import SHED, AdmissionController, AdmissionDecision, degrade
+from snapshots import SnapshotSweeper, SnapshotWriter
+from logging_config import AccessLogger, setup_logging, stop_logging
+import analytics
+import config
+import metrics
 
 
 # Dicionário para rastrear tentativas falhas
@@ -25,9 +46,19 @@ failed_attempts = {}
 BLOCK_DURATION = timedelta(seconds=60)  # 1 minuto
 MAX_ATTEMPTS = 3
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Intervalo entre consultas do job no stream de eventos do cadastro
+REGISTRATION_EVENTS_POLL_SECONDS = 0.5
+
+# Maior número de períodos devolvido por uma série do /analytics
+MAX_ANALYTICS_POINTS = 2000
+
+# Frames por segundo do /camera/stream quando reaproveita o pipeline da câmera
+CAMERA_STREAM_FPS = 10
+
+# Configurar logging (fila + thread de escrita; ver logging_config)
+_, _access_logger = setup_logging()
 logger = logging.getLogger(__name__)
+access_logger = AccessLogger(_access_logger)
 
 
 # Inicializar FastAPI
@@ -43,15 +74,169 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Inicializar sistema de reconhecimento facial
-face_system = FaceRecognitionSystem()
+# Inicializar sistema de reconhecimento facial (modelos e galeria carregam no warm-up)
+face_system = FaceRecognitionSystem(lazy=True)
+startup_state = StartupState()
+registration_jobs = RegistrationJobRunner(face_system, recognition_pool)
+camera_manager = CameraManager(face_system, recognition_pool,
+                               recognize=lambda decoded, profile: recognize_profiled(decoded, profile),
+                               on_decision=lambda camera, result, decoded: record_camera_decision(camera, result, decoded))
+snapshot_writer = SnapshotWriter()
+admission = AdmissionController(recognition_pool)
+snapshot_sweeper = SnapshotSweeper()
+
+
+def run_warm_up():
+    """Carrega modelos e galeria e executa um encoding descartável (síncrono)"""
+    startup_state.run_phases(face_system.warm_up_phases())
+
+
+def require_ready():
+    """Recusa rapidamente requisições de reconhecimento antes do warm-up terminar"""
+    if not startup_state.is_ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Sistema iniciando, tente novamente em instantes",
+            headers={"Retry-After": str(config.READY_RETRY_AFTER_SECONDS)},
+        )
+
+
+async def admit_recognition():
+    """Nível da verificação pela carga do pool; acima do limite, 503 na hora em vez de esperar na fila"""
+    decision = admission.admit()
+    if decision.level == SHED:
+        raise HTTPException(
+            status_code=503,
+            detail="Sistema sobrecarregado, tente novamente em instantes",
+            headers={"Retry-After": str(decision.retry_after)},
+        )
+    try:
+        yield decision
+    finally:
+        admission.release(decision)
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Mede a duração de cada requisição, rotulada pelo template da rota"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.REQUEST_LATENCY.labels(
+            request.method, route.path if route else "unmatched", str(status)
+        ).observe(time.perf_counter() - start)
 
 
 @app.on_event("startup")
 async def startup_event():
     """Inicializar banco de dados ao iniciar a aplicação"""
+    startup_state.mark_started()
     init_database()
-    logger.info("Sistema de controle de acesso iniciado")
+    snapshot_writer.start()
+    asyncio.create_task(snapshot_sweeper.sweep_periodically())
+    startup_state.start_background(face_system.warm_up_phases())
+    # Jobs de registro interrompidos voltam à fila quando o warm-up terminar
+    asyncio.create_task(registration_jobs.resume_when_ready(startup_state))
+    asyncio.create_task(registration_jobs.cleanup_periodically())
+    asyncio.create_task(watch_gallery())
+    asyncio.create_task(backfill_analytics())
+    # Pipelines das câmeras registradas começam depois do warm-up
+    asyncio.create_task(camera_manager.start_when_ready(startup_state))
+    logger.info("Sistema de controle de acesso iniciado (warm-up em segundo plano)")
+
+
+async def watch_gallery(interval: float = config.GALLERY_WATCH_INTERVAL_SECONDS):
+    """Recarrega a galeria quando ela muda no banco (tools.rebuild_gallery ou outro worker)"""
+    while True:
+        await asyncio.sleep(interval)
+        if not startup_state.is_ready:
+            continue
+        try:
+            if await asyncio.to_thread(face_system.reload_gallery_if_changed):
+                access_logger.log_system_event("gallery_reloaded", f"{len(face_system.known_face_names)} faces")
+        except Exception as e:
+            logger.error(f"Erro ao recarregar a galeria: {e}")
+
+
+async def backfill_analytics():
+    """Preenche os agregados do dashboard a partir do histórico, se ainda estiverem vazios"""
+    try:
+        counted = await asyncio.to_thread(analytics.backfill_if_empty)
+        if counted:
+            access_logger.log_system_event("analytics_backfill", f"{counted} registros agregados")
+    except Exception as e:
+        logger.error(f"Erro ao preencher os agregados de acesso: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Parar as câmeras, encerrar o pool de reconhecimento, liberar as métricas deste worker e esvaziar a fila de logs"""
+    startup_state.mark_stopping()
+    await camera_manager.stop()
+    recognition_pool.shutdown()
+    snapshot_writer.stop()
+    metrics.mark_process_dead(os.getpid())
+    stop_logging()
+
+
+def recognition_profile_context(decoded=None):
+    """Metadados gravados junto com o perfil de um reconhecimento lento"""
+    def context(result):
+        return {
+            "image_size": list(result.image_size),
+            "processed_size": list(decoded.image.shape[1::-1]) if decoded is not None else None,
+            "detection_size": list(decoded.detection_image.shape[1::-1]) if decoded is not None else None,
+            "faces": result.faces,
+            "rotation_stages": result.rotation_stages,
+            "profile": result.profile,
+            "gallery_size": len(face_system.known_face_encodings),
+            "timings": result.timings,
+        }
+    return context
+
+
+def recognize_profiled(decoded, profile: RecognitionProfile):
+    """Reconhecimento com o profiler de requisições lentas (executado em um worker do pool)"""
+    return profiler.run(face_system.recognize, decoded, profile, context=recognition_profile_context(decoded))
+
+
+def add_access_log(db: Session, access_log: AccessLog, result, decoded=None) -> AccessLog:
+    """Grava o registro e entrega a imagem do reconhecimento ao gravador de snapshots (em segundo plano)"""
+    db.add(access_log)
+    db.flush()
+    log_id = access_log.id
+    db.commit()
+    if decoded is not None:
+        snapshot_writer.submit(log_id, access_log.access_granted, decoded.image, result.face_boxes)
+    return access_log
+
+
+def record_camera_decision(camera: CameraConfig, result, decoded=None):
+    """Grava a decisão de um pipeline de câmera (uma liberação por passagem ou uma negação confirmada)"""
+    access_granted, user_name, confidence = result.access_granted, result.user_name, result.confidence
+    db = SessionLocal()
+    try:
+        user = None
+        if access_granted:
+            user = db.query(AuthorizedUser).filter(AuthorizedUser.name == user_name).first()
+        add_access_log(db, AccessLog(
+            user_name=user_name,
+            user_id=user.id if user else None,
+            access_granted=access_granted,
+            confidence_score=f"{confidence:.1f}%" if confidence > 0 else None,
+            recognition_profile=result.profile,
+            recognition_ms=recognition_ms(result),
+            camera=camera.name
+        ), result, decoded)
+    finally:
+        db.close()
+    access_logger.log_access_attempt(user_name, access_granted, confidence, method=f"camera:{camera.name}")
+    metrics.ACCESS_DECISIONS.labels("pipeline", "granted" if access_granted else "denied").inc()
 
 
 @app.get("/")
@@ -66,7 +251,22 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.now()}
 
 
-@app.post("/users/register", response_model=UserResponse)
+@app.get("/ready")
+async def readiness_check():
+    """Prontidão para receber tráfego: fases do warm-up e orçamentos de inicialização"""
+    state = startup_state.snapshot()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=jsonable_encoder(state))
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas no formato de texto do Prometheus"""
+    data, content_type = metrics.render_latest()
+    return Response(content=data, media_type=content_type)
+
+
+@app.post("/users/register", response_model=RegistrationJobResponse, status_code=202,
+          dependencies=[Depends(require_ready)])
 async def register_user(
     name: str = Form(...),
     email: str = Form(...),
@@ -74,13 +274,24 @@ async def register_user(
     image: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
+    """
+    Registrar um novo usuário autorizado com sua foto e nível de acesso
+
+    A foto é gravada e o encoding roda em segundo plano; o job devolvido
+    pode ser acompanhado em /users/register/jobs/{job_id} (ou /events)
+    """
     logger.info(f"Recebendo cadastro: name= {name}, email{email}, access_level={access_level}")
-    """Registrar um novo usuário autorizado com sua foto e nível de acesso"""
     try:
         # Verificar se o usuário já existe
         existing_user = db.query(AuthorizedUser).filter(AuthorizedUser.email == email).first()
         if existing_user:
             raise HTTPException(status_code=400, detail="Usuário já registrado")
+
+        pending_job = db.query(RegistrationJob).filter(
+            RegistrationJob.email == email, RegistrationJob.status.in_(ACTIVE_STATUSES)
+        ).first()
+        if pending_job:
+            raise HTTPException(status_code=400, detail="Cadastro já em andamento para este email")
         
         #validar nivel de acesso
         try:
@@ -92,40 +303,25 @@ async def register_user(
         if not image.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
 
-        # Salvar imagem temporariamente
+        # Gravar a foto e criar o job
         image_content = await image.read()
-        temp_image_path = f"data/authorized_faces/temp_{email}_{datetime.now().timestamp()}.jpg"
-
-        with open(temp_image_path, "wb") as f:
-            f.write(image_content)
+        job_id = uuid.uuid4().hex
+        upload_path = await asyncio.to_thread(registration_jobs.store_upload, job_id, image_content)
 
-        # Registrar face no sistema
-        success, message, encoding_str = face_system.register_face(temp_image_path, name, email)
-
-        if not success:
-            # Remover imagem temporária em caso de erro
-            if os.path.exists(temp_image_path):
-                os.remove(temp_image_path)
-            raise HTTPException(status_code=400, detail=message)
-
-        # Salvar no banco de dados
-        final_image_path = f"data/authorized_faces/{email}_{datetime.now().timestamp()}.jpg"
-        os.rename(temp_image_path, final_image_path)
-
-        db_user = AuthorizedUser(
+        job = RegistrationJob(
+            id=job_id,
             name=name,
             email=email,
-            face_encoding=encoding_str,
-            image_path=final_image_path,
-            access_level=user_access_level.value
+            access_level=user_access_level.value,
+            upload_path=upload_path,
         )
-
-        db.add(db_user)
+        db.add(job)
         db.commit()
-        db.refresh(db_user)
+        db.refresh(job)
 
-        logger.info(f"Usuário registrado: {name} ({email})")
-        return db_user
+        registration_jobs.submit(job.id)
+        logger.info(f"Cadastro enfileirado: {name} ({email}) [job {job.id}]")
+        return job
 
     except HTTPException:
         raise
@@ -134,6 +330,56 @@ async def register_user(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 
+def get_registration_job(db: Session, job_id: str) -> RegistrationJob:
+    job = db.get(RegistrationJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job de registro não encontrado")
+    return job
+
+
+@app.get("/users/register/jobs/{job_id}", response_model=RegistrationJobResponse)
+async def get_registration_status(job_id: str, db: Session = Depends(get_db)):
+    """Situação de um cadastro: queued, running, succeeded ou failed"""
+    return get_registration_job(db, job_id)
+
+
+@app.get("/users/register/jobs/{job_id}/events")
+async def registration_events(job_id: str, db: Session = Depends(get_db)):
+    """Server-sent events com cada mudança do job, até ele terminar"""
+    get_registration_job(db, job_id)
+
+    async def generate():
+        # Sessão própria: a do Depends pode ser fechada antes do fim do stream
+        stream_db = SessionLocal()
+        last = None
+        try:
+            while True:
+                stream_db.expire_all()
+                job = stream_db.get(RegistrationJob, job_id)
+                data = RegistrationJobResponse.model_validate(job).model_dump_json()
+                if data != last:
+                    last = data
+                    yield f"event: {job.status}\ndata: {data}\n\n"
+                if job.status in TERMINAL_STATUSES:
+                    return
+                await asyncio.sleep(REGISTRATION_EVENTS_POLL_SECONDS)
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/users/register/jobs/{job_id}/retry", response_model=RegistrationJobResponse,
+          status_code=202, dependencies=[Depends(require_ready)])
+async def retry_registration(job_id: str, db: Session = Depends(get_db)):
+    """Reenfileirar um cadastro que falhou por erro temporário"""
+    job = get_registration_job(db, job_id)
+    if job.status != FAILED or not job.retryable or not job.upload_path or not os.path.exists(job.upload_path):
+        raise HTTPException(status_code=409, detail="Este cadastro não pode ser repetido; envie a foto novamente")
+    return registration_jobs.retry(db, job)
+
+
 @app.get("/users", response_model=List[UserResponse])
 async def get_users(db: Session = Depends(get_db)):
     """Listar todos os usuários autorizados"""
@@ -170,10 +416,83 @@ async def delete_user(user_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 
-@app.post("/access/check", response_model=AccessResponse)
-async def check_access(image: UploadFile = File(...), db: Session = Depends(get_db)):
-    """Verificar acesso baseado na imagem da câmera"""
+def lock_remaining(client_ip: str) -> Optional[int]:
+    """Segundos restantes de bloqueio do cliente, ou None se não estiver bloqueado"""
+    data = failed_attempts.get(client_ip)
+    now = datetime.now()
+    if data and data.get("blocked_until") and data["blocked_until"] > now:
+        return int((data["blocked_until"] - now).total_seconds())
+    return None
+
+
+def record_attempt(client_ip: str, access_granted: bool):
+    """Atualiza o controle de tentativas falhas após uma decisão de acesso"""
+    if access_granted:
+        # resetar tentativas em caso de sucesso
+        if client_ip in failed_attempts:
+            failed_attempts.pop(client_ip)
+    else:
+        data = failed_attempts.get(client_ip, {"count": 0, "blocked_until": None})
+        data["count"] += 1
+        if data["count"] >= MAX_ATTEMPTS:
+            data["blocked_until"] = datetime.now() + BLOCK_DURATION
+            data["count"] = 0  # reset contador após bloqueio
+            metrics.LOCKOUTS.inc()
+            logger.warning(f"IP {client_ip} bloqueado por {BLOCK_DURATION.seconds} segundos.")
+        failed_attempts[client_ip] = data
+    metrics.CACHE_SIZE.labels("failed_attempts").set(len(failed_attempts))
+
+
+def select_profile(name: Optional[str], camera: Optional[str] = None) -> RecognitionProfile:
+    """Perfil pedido na requisição, o da câmera registrada ou de FACE_CAMERA_PROFILES, ou o padrão; 400 se o nome não existir"""
+    registered = camera_manager.find(str(camera)) if camera is not None and not name else None
+    try:
+        if registered is not None:
+            return registered.recognition_profile()
+        return resolve_profile(name, camera)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def recognition_ms(result) -> float:
+    """Tempo total do reconhecimento (da decodificação à decisão) gravado no AccessLog"""
+    return round(sum(result.timings.values()) * 1000, 1)
+
+
+def retake_response(result, channel: str, degradation: Optional[str] = None) -> AccessResponse:
+    """
+    Resposta para foto reprovada no controle de qualidade: pede outra foto,
+    sem registrar tentativa de acesso nem contar para o bloqueio
+    """
+    metrics.ACCESS_DECISIONS.labels(channel, "retake").inc()
+    access_logger.log_quality_rejection(result.quality_reason, method=channel)
+    return AccessResponse(
+        access_granted=False,
+        message=RETAKE_MESSAGES.get(result.quality_reason, "Imagem de baixa qualidade - tente novamente"),
+        retake=True,
+        quality_reason=result.quality_reason,
+        recognition_profile=result.profile,
+        degradation=degradation,
+    )
+
+
+@app.post("/access/check", response_model=AccessResponse, dependencies=[Depends(require_ready)])
+async def check_access(
+    image: UploadFile = File(...),
+    profile: Optional[str] = Form(default=None),
+    camera: Optional[str] = Form(default=None),
+    db: Session = Depends(get_db),
+    admission_decision: AdmissionDecision = Depends(admit_recognition)
+):
+    """
+    Verificar acesso baseado na imagem da câmera
+
+    profile escolhe o perfil de reconhecimento (fast, balanced, accurate); sem
+    ele vale o perfil configurado para a câmera informada ou o padrão. Sob
+    carga o perfil é barateado (campo degradation) ou a requisição recebe 503
+    """
     user = None
+    recognition_profile = degrade(select_profile(profile, camera), admission_decision.level)
 
     client_ip = "default"
     try:
@@ -183,15 +502,12 @@ async def check_access(image: UploadFile = File(...), db: Session = Depends(get_
         pass
 
     # Verifica se o IP está bloqueado
-    now = datetime.now()
-    if client_ip in failed_attempts:
-        data = failed_attempts[client_ip]
-        if data.get("blocked_until") and data["blocked_until"] > now:
-            remaining = int((data["blocked_until"] - now).total_seconds())
-            raise HTTPException(
-                status_code=429,
-                detail=f"Acesso temporariamente bloqueado. Tente novamente em {remaining} segundos."
-            )
+    remaining = lock_remaining(client_ip)
+    if remaining is not None:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Acesso temporariamente bloqueado. Tente novamente em {remaining} segundos."
+        )
 
 
     try:
@@ -199,16 +515,22 @@ async def check_access(image: UploadFile = File(...), db: Session = Depends(get_
         if not image.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
 
-        # Processar imagem
+        # Processar imagem (decodificação reduzida conforme o tamanho da foto)
         image_content = await image.read()
-        nparr = np.frombuffer(image_content, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        target_face_size = face_system.settings(recognition_profile).detect_target_face_size
+        decoded = await recognition_pool.run(decode_image, image_content, target_face_size)
 
-        if img is None:
+        if decoded is None:
             raise HTTPException(status_code=400, detail="Imagem inválida")
 
         # Reconhecer face
-        access_granted, user_name, confidence = face_system.recognize_face(img)
+        result = await recognition_pool.run(
+            profiler.run, face_system.recognize, decoded, recognition_profile,
+            context=recognition_profile_context(decoded)
+        )
+        if result.quality_reason:
+            return retake_response(result, "upload", admission_decision.degradation)
+        access_granted, user_name, confidence = result.access_granted, result.user_name, result.confidence
         
         #Buscar dados do usuario se reconhecido
         user_access_level = None
@@ -225,33 +547,24 @@ async def check_access(image: UploadFile = File(...), db: Session = Depends(get_
             user_name=user_name,
             user_id=user_id,
             access_granted=access_granted,
-            confidence_score=f"{confidence:.1f}%" if confidence > 0 else None
+            confidence_score=f"{confidence:.1f}%" if confidence > 0 else None,
+            recognition_profile=result.profile,
+            recognition_ms=recognition_ms(result),
+            camera=camera
         )
-
-        db.add(access_log)
-        db.commit()
+        add_access_log(db, access_log, result, decoded)
 
         # Preparar resposta
         if access_granted:
             message = f"Acesso liberado para {user_name}"
-            logger.info(f"Acesso liberado: {user_name} (confiança: {confidence:.1f}%)")
         else:
             message = "Acesso negado - Pessoa não autorizada"
-            logger.warning("Acesso negado - Pessoa não autorizada")
+        access_logger.log_access_attempt(user_name, access_granted, confidence, method="upload")
         
+        metrics.ACCESS_DECISIONS.labels("upload", "granted" if access_granted else "denied").inc()
+
             # Controle de tentativas falhas
-        if access_granted:
-            # resetar tentativas em caso de sucesso
-            if client_ip in failed_attempts:
-                failed_attempts.pop(client_ip)
-        else:
-            data = failed_attempts.get(client_ip, {"count": 0, "blocked_until": None})
-            data["count"] += 1
-            if data["count"] >= MAX_ATTEMPTS:
-                data["blocked_until"] = now + BLOCK_DURATION
-                data["count"] = 0  # reset contador após bloqueio
-                logger.warning(f"IP {client_ip} bloqueado por {BLOCK_DURATION.seconds} segundos.")
-            failed_attempts[client_ip] = data
+        record_attempt(client_ip, access_granted)
 
 
         confidence_value= confidence if confidence is not None else 0.0
@@ -261,8 +574,9 @@ async def check_access(image: UploadFile = File(...), db: Session = Depends(get_
             user_name=user_name,
             message=message,
             confidence_score=f"{confidence_value:.1f}%",
-            user_email=user.email if user else None
-
+            user_email=user.email if user else None,
+            recognition_profile=result.profile,
+            degradation=admission_decision.degradation
         )
 
     except HTTPException:
@@ -272,41 +586,60 @@ async def check_access(image: UploadFile = File(...), db: Session = Depends(get_
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 
-@app.post("/access/check-camera")
-async def check_access_camera(db: Session = Depends(get_db)):
-    """Verificar acesso usando câmera do sistema"""
+@app.post("/access/check-camera", dependencies=[Depends(require_ready)])
+async def check_access_camera(camera_index: int = 0, profile: Optional[str] = None, db: Session = Depends(get_db),
+                              admission_decision: AdmissionDecision = Depends(admit_recognition)):
+    """
+    Verificar acesso usando câmera do sistema (perfil pedido, o da câmera ou o padrão)
+
+    Se a câmera tem um pipeline rodando, usa o frame mais recente dele em vez
+    de abrir o dispositivo de novo. Sob carga vale o mesmo controle de admissão do /access/check
+    """
+    recognition_profile = degrade(select_profile(profile, str(camera_index)), admission_decision.level)
     try:
         # Capturar frame da câmera
-        frame = face_system.get_camera_frame()
+        frame = camera_manager.latest_frame(str(camera_index))
+        if frame is None:
+            frame = await recognition_pool.run(face_system.get_camera_frame, camera_index)
         if frame is None:
             raise HTTPException(status_code=400, detail="Não foi possível acessar a câmera")
 
         # Reconhecer face
-        access_granted, user_name, confidence = face_system.recognize_face(frame)
+        decoded = prepare_image(frame, target_face_size=face_system.settings(recognition_profile).detect_target_face_size)
+        result = await recognition_pool.run(
+            profiler.run, face_system.recognize, decoded, recognition_profile,
+            context=recognition_profile_context(decoded)
+        )
+        if result.quality_reason:
+            return retake_response(result, "camera", admission_decision.degradation)
+        access_granted, user_name, confidence = result.access_granted, result.user_name, result.confidence
+        metrics.ACCESS_DECISIONS.labels("camera", "granted" if access_granted else "denied").inc()
 
         # Registrar log de acesso
         access_log = AccessLog(
             user_name=user_name,
             access_granted=access_granted,
-            confidence_score=f"{confidence:.1f}%" if confidence > 0 else None
+            confidence_score=f"{confidence:.1f}%" if confidence > 0 else None,
+            recognition_profile=result.profile,
+            recognition_ms=recognition_ms(result),
+            camera=str(camera_index)
         )
-
-        db.add(access_log)
-        db.commit()
+        add_access_log(db, access_log, result, decoded)
 
         # Preparar resposta
         if access_granted:
             message = f"Acesso liberado para {user_name}"
-            logger.info(f"Acesso liberado: {user_name} (confiança: {confidence:.1f}%)")
         else:
             message = "Acesso negado - Pessoa não autorizada"
-            logger.warning("Acesso negado - Pessoa não autorizada")
+        access_logger.log_access_attempt(user_name, access_granted, confidence, method="camera")
 
         return AccessResponse(
             access_granted=access_granted,
             user_name=user_name,
             message=message,
-            confidence_score=f"{confidence:.1f}%" if confidence > 0 else None
+            confidence_score=f"{confidence:.1f}%" if confidence > 0 else None,
+            recognition_profile=result.profile,
+            degradation=admission_decision.degradation
         )
 
     except HTTPException:
@@ -316,6 +649,173 @@ async def check_access_camera(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 
+def record_stream_decision(result, log: bool, camera: Optional[str] = None, decoded=None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Busca o usuário reconhecido e, se log, grava o registro, com uma sessão
+    própria (roda em uma thread, fora do event loop)
+
+    Returns:
+        (email, nível de acesso) do usuário liberado
+    """
+    db = SessionLocal()
+    try:
+        user_id = user_email = access_level = None
+        if result.access_granted:
+            user = db.query(AuthorizedUser).filter(AuthorizedUser.name == result.user_name).first()
+            if user:
+                user_id, user_email, access_level = user.id, user.email, user.access_level
+        if log:
+            add_access_log(db, AccessLog(
+                user_name=result.user_name,
+                user_id=user_id,
+                access_granted=result.access_granted,
+                confidence_score=f"{result.confidence:.1f}%" if result.confidence > 0 else None,
+                recognition_profile=result.profile,
+                recognition_ms=recognition_ms(result),
+                camera=camera
+            ), result, decoded)
+        return user_email, access_level
+    finally:
+        db.close()
+
+
+async def stream_response(status: str, result, session: FrameSession, client_ip: str,
+                          camera: Optional[str] = None, decoded=None) -> AccessResponse:
+    """Monta a decisão de um frame do stream; só "granted" (uma vez por trilha) e "denied" geram registro"""
+    if status == "retake":
+        return AccessResponse(
+            access_granted=False,
+            message=RETAKE_MESSAGES.get(result.quality_reason, "Imagem de baixa qualidade - tente novamente"),
+            retake=True,
+            quality_reason=result.quality_reason,
+            recognition_profile=result.profile,
+        )
+    if status == "no_face":
+        return AccessResponse(access_granted=False, message="Posicione o rosto diante da câmera",
+                              recognition_profile=result.profile)
+    if status == "pending":
+        return AccessResponse(access_granted=False, message="Verificando...", recognition_profile=result.profile)
+
+    access_granted, user_name, confidence = result.access_granted, result.user_name, result.confidence
+    log = not access_granted or session.first_grant()
+    user_email, access_level = await asyncio.to_thread(record_stream_decision, result, log, camera, decoded)
+    if log:
+        access_logger.log_access_attempt(user_name, access_granted, confidence, method="stream")
+        metrics.ACCESS_DECISIONS.labels("stream", "granted" if access_granted else "denied").inc()
+        record_attempt(client_ip, access_granted)
+
+    return AccessResponse(
+        access_granted=access_granted,
+        user_name=user_name,
+        user_email=user_email,
+        access_level=ModelAccessLevel(access_level) if access_level else None,
+        message=f"Acesso liberado para {user_name}" if access_granted else "Acesso negado - Pessoa não autorizada",
+        confidence_score=f"{confidence:.1f}%",
+        recognition_profile=result.profile,
+    )
+
+
+async def process_stream(websocket: WebSocket, session: FrameSession, client_ip: str,
+                         recognition_profile: RecognitionProfile, camera: Optional[str] = None):
+    """
+    Reconhece o frame mais recente da sessão e envia cada decisão assim que fica pronta
+
+    Cada frame passa pelo controle de admissão, como o /access/check: sob carga
+    o perfil é barateado e, acima do limite, o frame é descartado com status "shed"
+    """
+    while True:
+        frame = await session.next_frame()
+        if frame is None:
+            return
+        number, data = frame
+        start = time.perf_counter()
+
+        remaining = lock_remaining(client_ip)
+        if remaining is not None:
+            await websocket.send_json({
+                "status": "locked", "frame": number, "access_granted": False, "locked": True,
+                "lock_remaining_seconds": remaining,
+                "message": f"Acesso temporariamente bloqueado. Tente novamente em {remaining} segundos.",
+            })
+            continue
+
+        decision = admission.admit()
+        if decision.level == SHED:
+            await websocket.send_json({
+                "status": "shed", "frame": number, "access_granted": False, "retry_after": decision.retry_after,
+                "message": "Sistema sobrecarregado, tente novamente em instantes",
+            })
+            continue
+        try:
+            frame_profile = degrade(recognition_profile, decision.level)
+            target_face_size = face_system.settings(frame_profile).detect_target_face_size
+            decoded = await recognition_pool.run(decode_image, data, target_face_size)
+            if decoded is None:
+                await websocket.send_json({"status": "error", "frame": number, "message": "Imagem inválida"})
+                continue
+            if session.unchanged(decoded.detection_image):
+                continue
+            result = await recognition_pool.run(recognize_profiled, decoded, frame_profile)
+        finally:
+            admission.release(decision)
+
+        status = session.update(result)
+        payload = jsonable_encoder(await stream_response(status, result, session, client_ip, camera, decoded))
+        payload.update(status=status, frame=number, dropped=session.dropped, degradation=decision.degradation,
+                       latency_ms=round((time.perf_counter() - start) * 1000, 1))
+        await websocket.send_json(payload)
+
+
+@app.websocket("/access/stream")
+async def access_stream(websocket: WebSocket, profile: Optional[str] = None, camera: Optional[str] = None):
+    """
+    Verificação contínua: o quiosque envia frames JPEG como mensagens binárias
+    na mesma conexão e recebe uma mensagem JSON por decisão, com os campos de
+    AccessResponse mais status ("granted", "denied", "pending", "no_face",
+    "retake", "locked" ou "shed"), número do frame e latência. ?profile= e ?camera=
+    escolhem o perfil de reconhecimento da conexão
+    """
+    await websocket.accept()
+    if not startup_state.is_ready:
+        await websocket.send_json({"status": "not_ready", "retry_after": config.READY_RETRY_AFTER_SECONDS})
+        await websocket.close(code=1013)
+        return
+    try:
+        recognition_profile = select_profile(profile, camera)
+    except HTTPException as e:
+        await websocket.send_json({"status": "error", "message": e.detail})
+        await websocket.close(code=1008)
+        return
+
+    client_ip = "default"
+    session = FrameSession()
+    metrics.STREAM_CONNECTIONS.inc()
+    processor = asyncio.create_task(process_stream(websocket, session, client_ip, recognition_profile, camera))
+    try:
+        while not processor.done():
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("bytes")
+            if not data:
+                continue  # mensagens de texto (ex.: ping) são ignoradas
+            if len(data) > config.STREAM_MAX_FRAME_BYTES:
+                metrics.STREAM_FRAMES.labels("too_large").inc()
+                continue
+            session.submit(data)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Erro no stream de acesso: {e}")
+    finally:
+        session.close()
+        processor.cancel()
+        metrics.STREAM_CONNECTIONS.dec()
+        logger.info(f"Stream de acesso encerrado: {session.stats()}")
+    if processor.done() and not processor.cancelled() and processor.exception():
+        logger.error(f"Erro no processamento do stream: {processor.exception()}")
+
+
 @app.get("/users/email/{email}")
 async def get_user_by_email(email: str, db: Session = Depends(get_db)):
     """
@@ -354,17 +854,56 @@ async def get_access_logs(limit: int = 50, db: Session = Depends(get_db)):
             "access_granted": log.access_granted,
             "timestamp": log.timestamp,
             "confidence_score": log.confidence_score,
-            "access_type": log.access_type
+            "access_type": log.access_type,
+            "recognition_profile": log.recognition_profile,
+            "recognition_ms": log.recognition_ms,
+            "camera": log.camera,
+            "has_snapshot": bool(log.image_path)
         }
         for log in logs
     ]
 
 
+@app.get("/access/logs/{log_id}/snapshot")
+async def get_access_snapshot(log_id: int, db: Session = Depends(get_db)):
+    """Imagem gravada para uma tentativa de acesso (ver snapshots.py)"""
+    log = db.query(AccessLog).filter(AccessLog.id == log_id).first()
+    if not log:
+        raise HTTPException(status_code=404, detail="Registro não encontrado")
+    if not log.image_path or not os.path.exists(log.image_path):
+        raise HTTPException(status_code=404, detail="Sem imagem para este registro")
+    return FileResponse(log.image_path, media_type="image/jpeg")
+
+
+def mjpeg_part(frame: np.ndarray) -> bytes:
+    frame_data = cv2.imencode('.jpg', frame)[1].tobytes()
+    return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n'
+
+
 @app.get("/camera/stream")
-async def camera_stream():
-    """Stream da câmera para o frontend"""
+async def camera_stream(camera: str = "0"):
+    """
+    Stream da câmera para o frontend (nome ou fonte de uma câmera registrada,
+    ou índice USB); com o pipeline rodando, reaproveita os frames dele
+    """
+    if camera_manager.latest_frame(camera) is not None:
+        async def relay():
+            while True:
+                frame = camera_manager.latest_frame(camera)
+                if frame is None:
+                    break
+                yield mjpeg_part(frame)
+                await asyncio.sleep(1 / CAMERA_STREAM_FPS)
+        return StreamingResponse(relay(), media_type="multipart/x-mixed-replace; boundary=frame")
+
+    # Só câmeras registradas ou índices USB: outra fonte seria um arquivo local ou uma URL arbitrária
+    registered = camera_manager.find(camera)
+    if registered is None and not camera.isdigit():
+        raise HTTPException(status_code=404, detail="Câmera não encontrada")
+    source = registered.source if registered else camera
+
     def generate():
-        cap = cv2.VideoCapture(0)
+        cap = open_source(source)
         try:
             while True:
                 ret, frame = cap.read()
@@ -372,13 +911,7 @@ async def camera_stream():
                     break
 
                 # Codificar frame como JPEG
-                buffer = cv2.imencode('.jpg', frame)[1]
-                frame_data = buffer.tobytes()
-
-                yield (
-                    b'--frame\r\n'
-                    b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n'
-                )
+                yield mjpeg_part(frame)
         except Exception as e:
             logger.error(f"Erro no stream da câmera: {e}")
         finally:
@@ -387,12 +920,102 @@ async def camera_stream():
     return StreamingResponse(generate(), media_type="multipart/x-mixed-replace; boundary=frame")
 
 
+def validate_camera_profile(profile: Optional[str]):
+    if profile:
+        try:
+            get_profile(profile)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+def get_camera(db: Session, camera_id: int) -> Camera:
+    camera = db.query(Camera).filter(Camera.id == camera_id).first()
+    if not camera:
+        raise HTTPException(status_code=404, detail="Câmera não encontrada")
+    return camera
+
+
+@app.get("/cameras", response_model=List[CameraResponse])
+async def list_cameras(db: Session = Depends(get_db)):
+    """Listar as câmeras registradas"""
+    return db.query(Camera).order_by(Camera.id).all()
+
+
+@app.get("/cameras/stats")
+async def cameras_stats():
+    """Vazão, atraso, descartes e fatia do pool de cada câmera"""
+    return {"scheduler_slots": camera_manager.scheduler.slots, "cameras": camera_manager.stats()}
+
+
+@app.post("/cameras", response_model=CameraResponse, status_code=201)
+async def create_camera(camera: CameraCreate, db: Session = Depends(get_db)):
+    """Registrar uma câmera (índice USB, arquivo de vídeo ou URL RTSP); se ativa, o pipeline começa na hora"""
+    validate_camera_profile(camera.profile)
+    if db.query(Camera).filter(Camera.name == camera.name).first():
+        raise HTTPException(status_code=400, detail="Já existe uma câmera com esse nome")
+    db_camera = Camera(**camera.model_dump())
+    db.add(db_camera)
+    db.commit()
+    db.refresh(db_camera)
+    if startup_state.is_ready:
+        await camera_manager.reload(db_camera.id)
+    access_logger.log_system_event("camera_created", f"{db_camera.name} ({db_camera.source})")
+    return db_camera
+
+
+@app.put("/cameras/{camera_id}", response_model=CameraResponse)
+async def update_camera(camera_id: int, camera_update: CameraUpdate, db: Session = Depends(get_db)):
+    """Alterar uma câmera; o pipeline é reiniciado com a nova configuração"""
+    db_camera = get_camera(db, camera_id)
+    changes = camera_update.model_dump(exclude_unset=True)
+    validate_camera_profile(changes.get("profile"))
+    if changes.get("name") and changes["name"] != db_camera.name and \
+            db.query(Camera).filter(Camera.name == changes["name"]).first():
+        raise HTTPException(status_code=400, detail="Já existe uma câmera com esse nome")
+    for field, value in changes.items():
+        setattr(db_camera, field, value)
+    db_camera.updated_at = datetime.now(timezone.utc)
+    db.commit()
+    db.refresh(db_camera)
+    if startup_state.is_ready:
+        await camera_manager.reload(camera_id)
+    return db_camera
+
+
+@app.delete("/cameras/{camera_id}")
+async def delete_camera(camera_id: int, db: Session = Depends(get_db)):
+    """Remover uma câmera e parar o seu pipeline"""
+    db_camera = get_camera(db, camera_id)
+    name = db_camera.name
+    db.delete(db_camera)
+    db.commit()
+    await camera_manager.reload(camera_id)
+    access_logger.log_system_event("camera_deleted", name)
+    return {"message": f"Câmera {name} removida"}
+
+
+@app.get("/admin/profiles")
+async def list_profiles():
+    """Listar os perfis gravados de reconhecimentos lentos"""
+    return profiler.list_profiles()
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str, format: str = "json"):
+    """Baixar um perfil (json com contexto e pilhas, ou prof do cProfile)"""
+    extension = ".prof" if format == "prof" else ".json"
+    path = profiler.profile_path(profile_id, extension)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    media_type = "application/octet-stream" if extension == ".prof" else "application/json"
+    return FileResponse(path=path, filename=os.path.basename(path), media_type=media_type)
+
+
 @app.get("/stats")
 async def get_stats(db: Session = Depends(get_db)):
     """Obter estatísticas do sistema"""
     total_users = db.query(AuthorizedUser).filter(AuthorizedUser.is_active == True).count()
-    total_attempts = db.query(AccessLog).count()
-    granted_attempts = db.query(AccessLog).filter(AccessLog.access_granted == True).count()
+    total_attempts, granted_attempts = analytics.totals(db)
     denied_attempts = total_attempts - granted_attempts
     now = datetime.now()
     current_lockouts = sum(1 for ip, data in failed_attempts.items() if data.get("blocked_until") and data["blocked_until"] > now)
@@ -407,6 +1030,57 @@ async def get_stats(db: Session = Depends(get_db)):
         "current_lockouts": current_lockouts
     }
 
+def analytics_window(since: Optional[datetime], until: Optional[datetime],
+                     default: timedelta) -> Tuple[datetime, datetime]:
+    """Período de uma consulta do /analytics em UTC (padrão: `default` até agora)"""
+    until = analytics.to_utc_naive(until) if until else datetime.now(timezone.utc).replace(tzinfo=None)
+    since = analytics.to_utc_naive(since) if since else until - default
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since deve ser anterior a until")
+    return since, until
+
+
+@app.get("/analytics/attempts")
+async def analytics_attempts(granularity: str = "hour", since: Optional[datetime] = None,
+                             until: Optional[datetime] = None, access_type: Optional[str] = None,
+                             db: Session = Depends(get_db)):
+    """Tentativas liberadas e negadas por hora ou dia (padrão: últimas 48 horas ou 30 dias)"""
+    if granularity not in analytics.ROLLUPS:
+        raise HTTPException(status_code=400, detail="granularity deve ser hour ou day")
+    since, until = analytics_window(since, until, timedelta(hours=48) if granularity == "hour" else timedelta(days=30))
+    if (until - since) / analytics.STEPS[granularity] > MAX_ANALYTICS_POINTS:
+        raise HTTPException(status_code=400, detail="Período longo demais para esta granularidade")
+    return analytics.attempts_over_time(db, granularity, since, until, access_type)
+
+
+@app.get("/analytics/top-users")
+async def analytics_top_users(days: int = 7, limit: int = 10, access_type: Optional[str] = None,
+                              db: Session = Depends(get_db)):
+    """Usuários identificados com mais tentativas nos últimos dias"""
+    since, until = analytics_window(None, None, timedelta(days=max(1, days)))
+    return analytics.top_users(db, since, until, max(1, min(limit, 100)), access_type)
+
+
+@app.get("/analytics/denial-spikes")
+async def analytics_denial_spikes(hours: int = 24, baseline_hours: int = 168, factor: float = 3.0,
+                                  min_denials: int = 5, access_type: Optional[str] = None,
+                                  db: Session = Depends(get_db)):
+    """Horas recentes com negações acima de média + factor * desvio das baseline_hours anteriores"""
+    if hours < 1 or baseline_hours < 1 or hours + baseline_hours > MAX_ANALYTICS_POINTS:
+        raise HTTPException(status_code=400, detail="Janela inválida")
+    _, until = analytics_window(None, None, timedelta(hours=hours))
+    return analytics.denial_spikes(db, until, hours, baseline_hours, factor, min_denials, access_type)
+
+
+@app.get("/analytics/documents/heatmap")
+async def analytics_document_heatmap(days: int = 30, db: Session = Depends(get_db)):
+    """Acessos liberados e negados por documento e por dia"""
+    if not 1 <= days <= MAX_ANALYTICS_POINTS:
+        raise HTTPException(status_code=400, detail="Janela inválida")
+    since, until = analytics_window(None, None, timedelta(days=days))
+    return analytics.document_heatmap(db, since, until)
+
+
 def require_access_level(required_level: AccessLevel):
     """Decorator para verificar nível de acesso do usuário"""
     def decorator(func):
@@ -430,7 +1104,9 @@ async def update_user(
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
         # Atualizar campos
+        gallery_changed = False
         if user_update.name is not None:
+            gallery_changed = user_update.name != user.name
             user.name = user_update.name
         if user_update.access_level is not None:
             try:
@@ -439,10 +1115,16 @@ async def update_user(
             except ValueError:
                 raise HTTPException(status_code=400, detail="Nível de acesso inválido")
         if user_update.is_active is not None:
+            gallery_changed = gallery_changed or user_update.is_active != user.is_active
             user.is_active = user_update.is_active
+        if gallery_changed:
+            # Muda o gallery_marker: os workers recarregam a galeria com o nome novo
+            user.embedding_updated_at = datetime.now(timezone.utc)
 
         db.commit()
         db.refresh(user)
+        if gallery_changed:
+            await asyncio.to_thread(face_system.reload_gallery_if_changed)
 
         logger.info(f"Usuário atualizado: {user.name} ({user.email})")
         return user
@@ -657,4 +1339,7 @@ async def get_document_levels():
             {"value": "INTERMEDIARIO", "label": "Intermediário","description": "Acesso intermediário: documentos de nível livre e restrito"},
             {"value": "TOTAL", "label": "Total","description": "Acesso total: todos os níveis de documentos"}
         ]
-    }
\ No newline at end of file
+    }
+
+
+startup_state.mark_imported(time.perf_counter() - IMPORT_STARTED)
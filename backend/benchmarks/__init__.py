@@ -0,0 +1 @@
+"""Benchmarks offline do backend. Execute a partir de backend/ com python -m benchmarks.<nome>."""
@@ -0,0 +1,138 @@
+"""
+Compara a detecção antiga (HOG na imagem toda, Haar de reserva) com as
+variantes da detecção em cascata, em recall, falsos positivos e latência.
+
+Cada foto de --images (uma pessoa por foto) é colada, em várias escalas, em
+posições aleatórias de um fundo sintético; uma detecção conta como acerto se
+o seu centro cair dentro da área colada. Fundos sem face medem o custo e os
+falsos positivos quando ninguém está na porta.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_detection --images fotos/ --scales 0.5,1.0 --output deteccao.json
+"""
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+from benchmarks.common import (environment_info, load_images, measure, print_table, save_results, summarize,
+                               synthetic_image)
+
+
+# Variantes comparadas: nome -> campos de DetectionConfig
+VARIANTS = {
+    "antigo (hog)": {"method": "hog"},
+    "haar+hog": {"method": "cascade", "proposal_detector": "haar", "verify": "hog"},
+    "haar+landmarks": {"method": "cascade", "proposal_detector": "haar", "verify": "landmarks"},
+    "hog+hog+reserva": {"method": "cascade", "proposal_detector": "hog", "verify": "hog", "fallback_full": True},
+    "hog+hog": {"method": "cascade", "proposal_detector": "hog", "verify": "hog", "fallback_full": False},
+}
+
+
+def build_cases(images, scales, width, height, negatives, seed):
+    """Monta (imagem BGR, retângulo da face colada ou None) para cada caso"""
+    rng = np.random.default_rng(seed)
+    cases = []
+    for index, data in enumerate(images):
+        face = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if face is None:
+            continue
+        for scale in scales:
+            patch = cv2.resize(face, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            ph, pw = patch.shape[:2]
+            if pw >= width or ph >= height:
+                continue
+            x, y = int(rng.integers(0, width - pw)), int(rng.integers(0, height - ph))
+            canvas = synthetic_image(width, height, seed=seed + index)
+            canvas[y:y + ph, x:x + pw] = patch
+            cases.append((canvas, (x, y, x + pw, y + ph)))
+    for index in range(negatives):
+        cases.append((synthetic_image(width, height, seed=seed + 1000 + index), None))
+    return cases
+
+
+def evaluate(face_system, cases, iterations):
+    """
+    Latência de detect_faces (na imagem de detecção já preparada), separada entre
+    casos com e sem face, e recall/falsos positivos de locate_faces (inclui as
+    passadas rotacionadas de reserva)
+    """
+    from image_pipeline import prepare_image
+
+    hits = positives = false_positives = 0
+    samples = {"com face": [], "sem face": []}
+    for image, target in cases:
+        decoded = prepare_image(image)
+        contrast_mean = face_system.preprocessing.luminance_mean(decoded.detection_image)
+        small_rgb, _ = face_system.preprocessing.run(decoded.detection_image, contrast_mean=contrast_mean)
+        samples["com face" if target else "sem face"].extend(
+            measure(lambda: face_system.detect_faces(small_rgb), iterations, warmup=0))
+
+        found = False
+        for (x, y, w, h), _ in face_system.locate_faces(decoded, contrast_mean, {}):
+            cx, cy = x + w / 2, y + h / 2
+            if target and target[0] <= cx <= target[2] and target[1] <= cy <= target[3]:
+                found = True
+            else:
+                false_positives += 1
+        if target:
+            positives += 1
+            hits += int(found)
+
+    stats = {kind: summarize(values) for kind, values in samples.items()}
+    stats["recall"] = hits / positives if positives else None
+    stats["false_positives"] = false_positives
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="diretório com fotos de uma pessoa cada")
+    parser.add_argument("--scales", default="0.5,1.0", help="escalas aplicadas às fotos antes de colar")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--negatives", type=int, default=5, help="fundos sem face")
+    parser.add_argument("--iterations", type=int, default=3, help="repetições por caso na medição de latência")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="arquivo JSON de saída")
+    args = parser.parse_args()
+
+    images = load_images(os.path.abspath(args.images))
+    if not images:
+        raise SystemExit(f"Nenhuma imagem em {args.images}")
+    scales = [float(scale) for scale in args.scales.split(",") if scale]
+    cases = build_cases(images, scales, args.width, args.height, args.negatives, args.seed)
+
+    from face_recognition_module import DetectionConfig, FaceRecognitionSystem
+
+    face_system = FaceRecognitionSystem(lazy=True)
+    face_system.load_models()
+
+    variants = {}
+    for name, fields in VARIANTS.items():
+        face_system.detection = DetectionConfig(**fields)
+        variants[name] = evaluate(face_system, cases, args.iterations)
+
+    stages = {f"{name} [{kind}]": stats[kind]
+              for name, stats in variants.items() for kind in ("com face", "sem face")}
+    print_table(stages)
+    print(f"{'variante':<28} {'recall':>7} {'falsos +':>9}")
+    for name, stats in variants.items():
+        print(f"{name:<28} {stats['recall']:>7.2%} {stats['false_positives']:>9d}")
+
+    if args.output:
+        output = os.path.abspath(args.output)
+        save_results(output, {
+            "environment": environment_info(),
+            "config": {"images": args.images, "scales": scales, "size": [args.width, args.height],
+                       "cases": len(cases), "negatives": args.negatives, "seed": args.seed},
+            "stages": stages,
+            "accuracy": {name: {"recall": stats["recall"], "false_positives": stats["false_positives"]}
+                         for name, stats in variants.items()},
+        })
+        print(f"Resultados gravados em {output}")
+
+
+if __name__ == "__main__":
+    main()
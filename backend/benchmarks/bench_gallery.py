@@ -0,0 +1,142 @@
+"""
+Galeria quantizada (float16/int8 + re-rank exato) x galeria float32.
+
+Gera uma galeria sintética com a geometria dos encodings do dlib (mesma
+pessoa a ~0.3-0.6, pessoas diferentes a ~0.9), tentativas genuínas
+(cadastro + ruído) e impostoras (pessoas fora da galeria), e compara cada
+configuração com a comparação exata da API:
+
+- concordância: mesma decisão (liberado/negado) e mesmo cadastro escolhido;
+- recall do re-rank: o melhor cadastro exato estava entre os candidatos;
+- memória própria do worker (os vetores float32 ficam no mmap) e latência
+  por comparação.
+
+Encerra com código 1 se alguma configuração concordar com a comparação
+exata em menos de --min-agreement das tentativas.
+
+Uso (a partir de backend/):
+    python -m benchmarks.bench_gallery --sizes 10000,100000 --modes float16,int8 --rerank-k 8,32
+    python -m benchmarks.bench_gallery --sizes 1000000 --probes 100 --output gallery.json
+"""
+import argparse
+import itertools
+import sys
+import tempfile
+
+import numpy as np
+
+import config
+from benchmarks.common import environment_info, measure, save_results, summarize
+from quantized_gallery import QuantizedGallery, nearest
+
+
+# Parcela comum aos encodings: afasta pessoas diferentes a ~0.9, como no dlib
+SHARED_WEIGHT = np.sqrt(1.5)
+
+
+def unit(rows: np.ndarray) -> np.ndarray:
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def synthetic_identities(size: int, rng: np.random.Generator, shared: np.ndarray) -> np.ndarray:
+    return unit(SHARED_WEIGHT * shared + unit(rng.normal(size=(size, len(shared))))).astype(np.float32)
+
+
+def synthetic_probes(gallery: np.ndarray, count: int, rng: np.random.Generator, shared: np.ndarray):
+    """Metade genuína (cadastro + ruído de 0.2 a 0.6) e metade impostora; devolve (tentativas, cadastro ou -1)"""
+    genuine = count // 2
+    owners = rng.integers(0, len(gallery), size=genuine)
+    noise = unit(rng.normal(size=(genuine, gallery.shape[1]))) * rng.uniform(0.2, 0.6, size=(genuine, 1))
+    probes = np.vstack([unit(gallery[owners] + noise), synthetic_identities(count - genuine, rng, shared)])
+    truth = np.concatenate([owners, np.full(count - genuine, -1)])
+    return probes.astype(np.float32), truth
+
+
+def decisions(matches, tolerance: float, min_confidence: float) -> np.ndarray:
+    """Cadastro liberado por tentativa (-1 = negado), com a regra de match_encodings"""
+    result = []
+    for index, distance in matches:
+        confidence = max(0.0, (1 - distance) * 100)
+        result.append(index if distance <= tolerance and confidence >= min_confidence else -1)
+    return np.asarray(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000", help="tamanhos de galeria")
+    parser.add_argument("--modes", default="float16,int8")
+    parser.add_argument("--scales", default="vector,global", help="escalas do int8")
+    parser.add_argument("--rerank-k", default="8,32", help="candidatos re-comparados com os vetores exatos")
+    parser.add_argument("--probes", type=int, default=400, help="tentativas por galeria (metade genuínas)")
+    parser.add_argument("--tolerance", type=float, default=config.RECOGNITION_TOLERANCE)
+    parser.add_argument("--min-confidence", type=float, default=config.RECOGNITION_MIN_CONFIDENCE)
+    parser.add_argument("--min-agreement", type=float, default=0.999,
+                        help="concordância mínima com a comparação exata (senão, código 1)")
+    parser.add_argument("--iterations", type=int, default=50, help="comparações medidas por configuração")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="arquivo JSON com os resultados")
+    args = parser.parse_args()
+
+    sizes = [int(value) for value in args.sizes.split(",")]
+    modes = [value.strip() for value in args.modes.split(",") if value.strip()]
+    scales = [value.strip() for value in args.scales.split(",") if value.strip()]
+    rerank_ks = [int(value) for value in args.rerank_k.split(",")]
+    results = {"environment": environment_info(), "args": vars(args), "galleries": []}
+    failed = []
+
+    print(f"{'galeria':>9} {'config':<22} {'MiB':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} "
+          f"{'concord.':>9} {'recall':>7} {'dif. dist.':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            rng = np.random.default_rng(args.seed)
+            shared = unit(rng.normal(size=(1, 128)))[0]
+            gallery = synthetic_identities(size, rng, shared)
+            probes, truth = synthetic_probes(gallery, args.probes, rng, shared)
+
+            exact = nearest(gallery, probes)
+            exact_decisions = decisions(exact, args.tolerance, args.min_confidence)
+            exact_latency = summarize(measure(lambda: nearest(gallery, probes[:1]), args.iterations))
+            genuine = truth >= 0
+            entry = {"size": size, "configs": [], "float32": {
+                "mib": gallery.nbytes / 2**20, "latency": exact_latency,
+                # Referência da geometria sintética: genuínas liberadas para o dono, impostoras negadas
+                "genuine_granted": float(np.mean(exact_decisions[genuine] == truth[genuine])),
+                "impostor_denied": float(np.mean(exact_decisions[~genuine] == -1)),
+            }}
+            print(f"{size:>9} {'float32 (exato)':<22} {entry['float32']['mib']:>8.1f} "
+                  f"{exact_latency['p50_ms']:>9.2f} {exact_latency['p95_ms']:>9.2f}")
+
+            configs = [(mode, scale if mode == "int8" else "-", k)
+                       for mode, scale, k in itertools.product(modes, scales, rerank_ks)
+                       if mode == "int8" or scale == scales[0]]
+            for mode, scale, k in configs:
+                quantized = QuantizedGallery.build(gallery, mode, scale if scale != "-" else "vector", k, directory)
+                approximate = quantized.nearest(probes)
+                approximate_decisions = decisions(approximate, args.tolerance, args.min_confidence)
+                agreement = float(np.mean(approximate_decisions == exact_decisions))
+                candidates = quantized.candidates(probes, min(k, size))
+                recall = float(np.mean([index in candidates[:, column] for column, (index, _) in enumerate(exact)]))
+                distance_diff = float(max(abs(a[1] - b[1]) for a, b in zip(approximate, exact)))
+                latency = summarize(measure(lambda: quantized.nearest(probes[:1]), args.iterations))
+                name = f"{mode}/{scale}/k={k}"
+                print(f"{size:>9} {name:<22} {quantized.nbytes() / 2**20:>8.1f} {latency['p50_ms']:>9.2f} "
+                      f"{latency['p95_ms']:>9.2f} {agreement * 100:>8.2f}% {recall * 100:>6.1f}% {distance_diff:>10.2e}"
+                      + ("  <-- regressão" if agreement < args.min_agreement else ""))
+                entry["configs"].append({"mode": mode, "scale": scale, "rerank_k": k,
+                                         "mib": quantized.nbytes() / 2**20, "latency": latency,
+                                         "agreement": agreement, "rerank_recall": recall,
+                                         "max_distance_diff": distance_diff})
+                if agreement < args.min_agreement:
+                    failed.append(f"{size}:{name}")
+            results["galleries"].append(entry)
+
+    if args.output:
+        save_results(args.output, results)
+        print(f"Resultados gravados em {args.output}")
+    if failed:
+        print(f"Concordância abaixo de {args.min_agreement * 100:.1f}%: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
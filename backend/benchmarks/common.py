@@ -0,0 +1,129 @@
+"""Utilitários compartilhados pelos benchmarks: dados sintéticos, estatísticas e resultados em JSON."""
+import json
+import os
+import platform
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """Imagem BGR com gradientes e ruído suavizado, parecida com uma foto"""
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, size=(height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+    image = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+    ramp = np.linspace(0, 60, width, dtype=np.float32)[None, :, None]
+    return np.clip(image.astype(np.float32) * 0.7 + ramp, 0, 255).astype(np.uint8)
+
+
+def synthetic_gallery(size: int, seed: int = 0, dims: int = 128) -> np.ndarray:
+    """Encodings sintéticos com a mesma escala dos encodings do dlib (norma ~1)"""
+    rng = np.random.default_rng(seed)
+    gallery = rng.normal(0.0, 1.0, size=(size, dims))
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    return gallery
+
+
+def load_images(directory: Optional[str]) -> List[bytes]:
+    """Lê os arquivos de imagem de um diretório (ordenados, para reprodutibilidade)"""
+    if not directory:
+        return []
+    extensions = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+    return [
+        open(os.path.join(directory, name), "rb").read()
+        for name in sorted(os.listdir(directory))
+        if name.lower().endswith(extensions)
+    ]
+
+
+def encode_jpeg(image: np.ndarray, quality: int = 90) -> bytes:
+    """Codifica a imagem BGR como JPEG"""
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Resume amostras (em segundos) em percentis e vazão"""
+    values = np.asarray(samples, dtype=np.float64)
+    if values.size == 0:
+        return {"n": 0}
+    return {
+        "n": int(values.size),
+        "mean_ms": float(values.mean() * 1000),
+        "p50_ms": float(np.percentile(values, 50) * 1000),
+        "p95_ms": float(np.percentile(values, 95) * 1000),
+        "p99_ms": float(np.percentile(values, 99) * 1000),
+        "throughput_per_s": float(values.size / values.sum()) if values.sum() > 0 else 0.0,
+    }
+
+
+def measure(func: Callable[[], object], iterations: int, warmup: int = 1) -> List[float]:
+    """Executa func repetidamente e devolve a duração de cada chamada em segundos"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def environment_info() -> Dict[str, object]:
+    """Informações do ambiente para tornar resultados comparáveis"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def save_results(path: str, results: Dict[str, object]):
+    """Grava os resultados em JSON"""
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def print_table(stages: Dict[str, Dict[str, float]]):
+    """Imprime a tabela de percentis por etapa"""
+    print(f"{'etapa':<28} {'n':>5} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10} {'ops/s':>9}")
+    for name, stats in stages.items():
+        if not stats.get("n"):
+            print(f"{name:<28} {0:>5}")
+            continue
+        print(f"{name:<28} {stats['n']:>5} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f} "
+              f"{stats['p99_ms']:>10.2f} {stats['throughput_per_s']:>9.1f}")
+
+
+def compare_results(baseline: Dict[str, object], current: Dict[str, object],
+                    threshold: float = 0.10, metrics=("p50_ms", "p95_ms")) -> List[str]:
+    """
+    Compara duas execuções e imprime a variação por etapa
+
+    Returns:
+        List[str]: etapas que pioraram além do limite (ex.: 0.10 = 10%)
+    """
+    regressions = []
+    base_stages = baseline.get("stages", {})
+    print(f"{'etapa':<28} " + " ".join(f"{m + ' antes':>14} {m + ' agora':>14} {'var.':>7}" for m in metrics))
+    for name, stats in current.get("stages", {}).items():
+        base = base_stages.get(name)
+        if not base or not base.get("n") or not stats.get("n"):
+            continue
+        cells = []
+        regressed = False
+        for metric in metrics:
+            before, after = base[metric], stats[metric]
+            change = (after - before) / before if before > 0 else 0.0
+            regressed = regressed or change > threshold
+            cells.append(f"{before:>14.2f} {after:>14.2f} {change * 100:>+6.1f}%")
+        print(f"{name:<28} " + " ".join(cells) + ("  <-- regressão" if regressed else ""))
+        if regressed:
+            regressions.append(name)
+    return regressions
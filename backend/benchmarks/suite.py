@@ -0,0 +1,238 @@
+"""
+Benchmark offline dos caminhos críticos de reconhecimento e da API.
+
+Não usa câmera nem rede: as imagens são sintéticas (ou lidas de --images) e
+a galeria é formada por encodings sintéticos de 128 dimensões. Tudo roda em
+um diretório temporário, sem tocar em data/ nem no banco real.
+
+Uso (a partir de backend/):
+    python -m benchmarks.suite --gallery-sizes 100,1000,10000 --output atual.json
+    python -m benchmarks.suite --output novo.json --compare atual.json --threshold 0.10
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import (compare_results, encode_jpeg, environment_info, load_images, measure,
+                               print_table, save_results, summarize, synthetic_gallery, synthetic_image)
+
+
+def probe_images(images_dir, width, height):
+    """Imagens de teste: as do diretório informado ou uma imagem sintética"""
+    images = load_images(images_dir)
+    if images:
+        return images
+    return [encode_jpeg(synthetic_image(width, height, seed=seed)) for seed in range(3)]
+
+
+def write_gallery_rows(gallery):
+    """Grava a galeria sintética no banco, no formato de load_authorized_faces"""
+    from database import AuthorizedUser, SessionLocal
+    from embeddings import to_blob
+
+    db = SessionLocal()
+    try:
+        db.query(AuthorizedUser).delete()
+        db.add_all(AuthorizedUser(name=f"Usuário {index}", email=f"bench{index}@example.com",
+                                  face_embedding=to_blob(encoding), embedding_version="bench")
+                   for index, encoding in enumerate(gallery))
+        db.commit()
+    finally:
+        db.close()
+
+
+def bench_pipeline(face_system, images, gallery_sizes, iterations, seed):
+    """Etapas isoladas: decode, enhance, detect, encode e match"""
+    from image_pipeline import decode_image
+
+    stages = {}
+    payload = images[0]
+    decoded = decode_image(payload)
+    contrast_mean = face_system.preprocessing.luminance_mean(decoded.detection_image)
+
+    stages["decode"] = summarize(measure(lambda: decode_image(payload), iterations))
+    stages["enhance"] = summarize(measure(
+        lambda: face_system.preprocessing.run(decoded.detection_image, contrast_mean=contrast_mean), iterations))
+    stages["detect"] = summarize(measure(lambda: face_system.locate_faces(decoded, contrast_mean, {}), iterations))
+
+    # Encoding: usa a face detectada ou, em imagens sintéticas, uma caixa fixa no centro
+    located = face_system.locate_faces(decoded, contrast_mean, {})
+    if located:
+        box, angle = located[0]
+    else:
+        height, width = decoded.image.shape[:2]
+        side = min(width, height) // 3
+        box, angle = ((width - side) // 2, (height - side) // 2, side, side), 0
+    crop, location = face_system.extract_face_crop(decoded, box, angle, contrast_mean)
+    if location is None:
+        location = (0, crop.shape[1], crop.shape[0], 0)
+    stages["encode"] = summarize(measure(lambda: face_system.process_face_with_rotation(crop, location),
+                                         max(1, iterations // 5)))
+
+    import face_recognition
+    probe = face_recognition.face_encodings(crop, known_face_locations=[location])
+    probe = probe or [synthetic_gallery(1, seed=seed + 1)[0]]
+    for size in gallery_sizes:
+        gallery = synthetic_gallery(size, seed=seed)
+        face_system.known_face_encodings = gallery.astype(np.float32)
+        face_system.known_face_names = [f"Usuário {i}" for i in range(size)]
+        face_system.known_face_emails = [f"bench{i}@example.com" for i in range(size)]
+        stages[f"match[n={size}]"] = summarize(measure(lambda: face_system.match_encodings(probe), iterations))
+    return stages
+
+
+def bench_system(face_system, images, gallery_sizes, iterations, seed):
+    """Métodos públicos de ponta a ponta: recognize_face, register_face (com e sem cache) e load_authorized_faces"""
+    import cv2
+    from image_pipeline import decode_image
+
+    stages = {}
+    gallery = synthetic_gallery(max(gallery_sizes), seed=seed)
+    face_system.known_face_encodings = gallery.astype(np.float32)
+    face_system.known_face_names = [f"Usuário {i}" for i in range(len(gallery))]
+    face_system.known_face_emails = [f"bench{i}@example.com" for i in range(len(gallery))]
+
+    frame = cv2.imdecode(np.frombuffer(images[0], np.uint8), cv2.IMREAD_COLOR)
+    stages["recognize_face"] = summarize(measure(lambda: face_system.recognize_face(frame), max(1, iterations // 5)))
+    stages["recognize(upload)"] = summarize(measure(
+        lambda: face_system.recognize(decode_image(images[0])), max(1, iterations // 5)))
+
+    image_path = os.path.join(tempfile.gettempdir(), f"bench_register_{os.getpid()}.jpg")
+    with open(image_path, "wb") as f:
+        f.write(images[0])
+    # Sem o cache de encodings a medida é o cadastro de uma foto nova; com ele, uma foto já vista
+    cache_enabled = face_system.encoding_cache.enabled
+    for name, enabled in (("register_face", False), ("register_face(cache)", True)):
+        face_system.encoding_cache.enabled = enabled
+        stages[name] = summarize(measure(
+            lambda: face_system.register_face(image_path, "Benchmark", "benchmark@example.com"),
+            max(1, iterations // 5)))
+    face_system.encoding_cache.enabled = cache_enabled
+    os.remove(image_path)
+
+    for size in gallery_sizes:
+        write_gallery_rows(synthetic_gallery(size, seed=seed))
+        stages[f"load_authorized_faces[n={size}]"] = summarize(
+            measure(face_system.load_authorized_faces, max(1, iterations // 10)))
+    write_gallery_rows([])
+    return stages
+
+
+def bench_db_write(iterations):
+    """Gravação de um AccessLog com commit, como em check_access"""
+    from database import AccessLog, SessionLocal, init_database
+
+    init_database()
+    db = SessionLocal()
+    try:
+        def write():
+            db.add(AccessLog(user_name=None, access_granted=False, confidence_score=None))
+            db.commit()
+        return {"db_write": summarize(measure(write, iterations))}
+    finally:
+        db.close()
+
+
+def bench_endpoints(images, iterations):
+    """Endpoints pelo cliente ASGI em processo (sem servidor nem rede)"""
+    import httpx
+    import api
+
+    api.init_database()
+    api.run_warm_up()
+
+    async def run():
+        stages = {}
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def timed(method, path, **kwargs):
+                samples = []
+                for i in range(iterations + 1):
+                    api.failed_attempts.clear()  # evita que o bloqueio por tentativas distorça a medição
+                    start = asyncio.get_running_loop().time()
+                    response = await client.request(method, path, **kwargs)
+                    elapsed = asyncio.get_running_loop().time() - start
+                    if response.status_code >= 500:
+                        raise RuntimeError(f"{method} {path} retornou {response.status_code}")
+                    if i:
+                        samples.append(elapsed)
+                return summarize(samples)
+
+            stages["GET /health"] = await timed("GET", "/health")
+            stages["GET /stats"] = await timed("GET", "/stats")
+            stages["POST /access/check"] = await timed(
+                "POST", "/access/check", files={"image": ("probe.jpg", images[0], "image/jpeg")})
+        return stages
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="diretório com fotos de faces (padrão: imagens sintéticas)")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--gallery-sizes", default="100,1000,10000")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-endpoints", action="store_true")
+    parser.add_argument("--output", help="arquivo JSON de saída")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--threshold", type=float, default=0.10, help="piora máxima aceita (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    images_dir = os.path.abspath(args.images) if args.images else None
+    output = os.path.abspath(args.output) if args.output else None
+    compare = os.path.abspath(args.compare) if args.compare else None
+    gallery_sizes = [int(size) for size in args.gallery_sizes.split(",") if size]
+
+    # Isolar data/ e o banco SQLite em um diretório temporário
+    workdir = tempfile.mkdtemp(prefix="facebench_")
+    os.chdir(workdir)
+    os.makedirs("data/authorized_faces", exist_ok=True)
+
+    from database import init_database
+    from face_recognition_module import FaceRecognitionSystem
+
+    init_database()
+    images = probe_images(images_dir, args.width, args.height)
+    face_system = FaceRecognitionSystem()
+
+    stages = {}
+    stages.update(bench_pipeline(face_system, images, gallery_sizes, args.iterations, args.seed))
+    stages.update(bench_system(face_system, images, gallery_sizes, args.iterations, args.seed))
+    stages.update(bench_db_write(args.iterations))
+    if not args.skip_endpoints:
+        stages.update(bench_endpoints(images, args.iterations))
+
+    results = {
+        "environment": environment_info(),
+        "config": {
+            "images": images_dir or f"sintéticas {args.width}x{args.height}",
+            "gallery_sizes": gallery_sizes,
+            "iterations": args.iterations,
+            "seed": args.seed,
+        },
+        "stages": stages,
+    }
+    print_table(stages)
+    if output:
+        save_results(output, results)
+        print(f"Resultados gravados em {output}")
+
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.threshold)
+        if regressions:
+            print(f"Regressões acima de {args.threshold * 100:.0f}%: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Varredura de velocidade x precisão das configurações de reconhecimento.
+
+Conjunto rotulado (--images): um subdiretório por pessoa. A primeira foto de
+cada pessoa (ordem alfabética) é o cadastro e as demais são tentativas de
+acesso: genuínas contra o próprio cadastro e impostoras contra os demais.
+--unknown aponta para fotos de pessoas não cadastradas (só tentativas
+impostoras, para medir liberações indevidas em conjunto aberto).
+
+Parâmetros de encoding (produto de --rotations, --upsample, --contrast e
+--sharpness) mudam os encodings: cada foto é codificada uma vez por
+configuração, e os encodings e o tempo de CPU ficam em --cache-dir para as
+próximas execuções. Parâmetros de decisão (--tolerances, --min-confidences)
+só mudam o limiar: a matriz de distâncias tentativa x cadastro é calculada
+uma vez por configuração de encoding, vetorizada, e todos os limiares são
+avaliados sobre ela. O controle de qualidade não é aplicado.
+
+Saída: FAR (pares impostores aceitos) e FRR (tentativas genuínas não
+liberadas para a pessoa certa), curva ROC e EER por configuração de
+encoding, tempo de CPU por foto e a fronteira de Pareto (CPU x FRR entre as
+combinações com FAR <= --max-far).
+
+Uso (a partir de backend/):
+    python -m benchmarks.sweep --images rotulado/ --unknown desconhecidos/ \\
+        --rotations "0|0,-15,15|0,-15,15,-30,30" --upsample 0,1 --output sweep.json
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+from benchmarks.common import environment_info, save_results, summarize
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# Limiares da curva ROC gravada no resultado
+ROC_THRESHOLDS = np.round(np.arange(0.30, 0.801, 0.01), 2)
+
+_worker_system = None
+
+
+def load_labeled(directory: str) -> List[Tuple[str, str]]:
+    """[(pessoa, caminho)] com um subdiretório por pessoa"""
+    samples = []
+    for label in sorted(os.listdir(directory)):
+        person_dir = os.path.join(directory, label)
+        if not os.path.isdir(person_dir):
+            continue
+        for filename in sorted(os.listdir(person_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((label, os.path.join(person_dir, filename)))
+    return samples
+
+
+def load_unlabeled(directory: Optional[str]) -> List[str]:
+    if not directory:
+        return []
+    return [os.path.join(root, filename)
+            for root, _, files in sorted(os.walk(directory)) for filename in sorted(files)
+            if filename.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def parse_list(text: str, cast) -> list:
+    return [cast(item) for item in text.split(",") if item.strip()]
+
+
+def encoding_configs(args) -> List[Dict[str, object]]:
+    rotations = [parse_list(option, int) for option in args.rotations.split("|")]
+    return [{"rotations": angles, "upsample": upsample, "contrast": contrast, "sharpness": sharpness}
+            for angles, upsample, contrast, sharpness in itertools.product(
+                rotations, parse_list(args.upsample, int),
+                parse_list(args.contrast, float), parse_list(args.sharpness, float))]
+
+
+def apply_config(face_system, params: Dict[str, object]):
+    from image_pipeline import PreprocessingConfig, PreprocessingPipeline
+
+    face_system.rotation_angles = list(params["rotations"])
+    face_system.detection.hog_upsample = params["upsample"]
+    face_system.preprocessing = PreprocessingPipeline(
+        PreprocessingConfig(contrast=params["contrast"], sharpness=params["sharpness"]))
+
+
+def config_key(face_system, params: Dict[str, object]) -> str:
+    """Chave do cache: assinatura completa do pipeline (inclui o que não é varrido)"""
+    from embeddings import pipeline_version
+
+    apply_config(face_system, params)
+    return pipeline_version(face_system.pipeline_signature()).split(":")[-1]
+
+
+def _init_worker():
+    global _worker_system
+    from face_recognition_module import FaceRecognitionSystem
+
+    _worker_system = FaceRecognitionSystem(lazy=True)
+    _worker_system.load_models()
+
+
+def _encode(params: Dict[str, object], path: str) -> Dict[str, object]:
+    """Codifica uma foto com a configuração (roda nos processos do pool)"""
+    from image_pipeline import decode_image
+
+    apply_config(_worker_system, params)
+    with open(path, "rb") as f:
+        data = f.read()
+    start = time.process_time()
+    decoded = decode_image(data)
+    faces, encodings_per_face = (0, []) if decoded is None else _worker_system.encode_faces(decoded, {})
+    cpu = time.process_time() - start
+    return {"faces": faces, "encodings": [[encoding.tolist() for encoding in encodings]
+                                          for encodings in encodings_per_face], "cpu": cpu}
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def encode_all(params, key: str, paths: List[str], hashes: Dict[str, str], cache_dir: str,
+               executor) -> Tuple[Dict[str, dict], int]:
+    """Encodings de todas as fotos na configuração, usando e atualizando o cache"""
+    cache_path = os.path.join(cache_dir, f"{key}.json")
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            cache = json.load(f)["images"]
+
+    missing = [path for path in paths if hashes[path] not in cache]
+    if missing:
+        results = executor.map(_encode, itertools.repeat(params), missing)
+        for path, result in zip(missing, results):
+            cache[hashes[path]] = result
+        temp_path = f"{cache_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"params": params, "images": cache}, f)
+        os.replace(temp_path, cache_path)
+    return cache, len(paths) - len(missing)
+
+
+def distance_matrix(probes: np.ndarray, gallery: np.ndarray) -> np.ndarray:
+    """Distâncias euclidianas de todas as tentativas para todos os cadastros de uma vez"""
+    squared = (np.einsum("ij,ij->i", probes, probes)[:, None] + np.einsum("ij,ij->i", gallery, gallery)[None, :]
+               - 2.0 * probes @ gallery.T)
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def build_trials(samples: List[Tuple[str, str]], unknown: List[str], encoded: Dict[str, dict],
+                 hashes: Dict[str, str]):
+    """
+    Separa cadastros e tentativas e calcula a menor distância de cada tentativa
+    a cada cadastro (mínimo entre os encodings das rotações, como no reconhecimento)
+
+    Returns:
+        (distâncias tentativa x cadastro, índice do cadastro correto de cada
+        tentativa ou -1, pessoas sem cadastro válido)
+    """
+    gallery, gallery_labels, enroll_failures = [], [], []
+    probes = []
+    seen = set()
+    for label, path in samples:
+        if label in seen:
+            probes.append((label, path))
+            continue
+        seen.add(label)
+        result = encoded[hashes[path]]
+        if result["faces"] == 1 and result["encodings"][0]:
+            gallery.append(result["encodings"][0][0])
+            gallery_labels.append(label)
+        else:
+            enroll_failures.append(label)
+    probes.extend((None, path) for path in unknown)
+
+    index_of = {label: index for index, label in enumerate(gallery_labels)}
+    truth = np.array([index_of.get(label, -1) for label, _ in probes], dtype=np.int64)
+    flat, offsets, acquired = [], [], []
+    for number, (_, path) in enumerate(probes):
+        encodings = [encoding for face in encoded[hashes[path]]["encodings"] for encoding in face]
+        if encodings:
+            offsets.append(len(flat))
+            acquired.append(number)
+            flat.extend(encodings)
+
+    distances = np.full((len(probes), len(gallery)), np.inf)
+    if flat and gallery:
+        matrix = distance_matrix(np.asarray(flat, dtype=np.float64), np.asarray(gallery, dtype=np.float64))
+        distances[acquired] = np.minimum.reduceat(matrix, offsets, axis=0)
+    return distances, truth, enroll_failures
+
+
+def roc(distances: np.ndarray, truth: np.ndarray, thresholds: np.ndarray) -> Dict[str, object]:
+    """FAR/FRR por limiar sobre todos os pares tentativa x cadastro e EER"""
+    genuine_mask = np.zeros(distances.shape, dtype=bool)
+    rows = np.flatnonzero(truth >= 0)
+    genuine_mask[rows, truth[rows]] = True
+    genuine = np.sort(distances[genuine_mask])
+    impostor = np.sort(distances[~genuine_mask])
+
+    far = np.searchsorted(impostor, thresholds, side="right") / max(1, len(impostor))
+    frr = 1.0 - np.searchsorted(genuine, thresholds, side="right") / max(1, len(genuine))
+
+    dense = np.linspace(0.0, 1.2, 1201)
+    dense_far = np.searchsorted(impostor, dense, side="right") / max(1, len(impostor))
+    dense_frr = 1.0 - np.searchsorted(genuine, dense, side="right") / max(1, len(genuine))
+    eer_index = int(np.argmin(np.abs(dense_far - dense_frr)))
+    return {
+        "genuine_pairs": int(len(genuine)),
+        "impostor_pairs": int(len(impostor)),
+        "far": far,
+        "frr": frr,
+        "eer": float((dense_far[eer_index] + dense_frr[eer_index]) / 2),
+        "eer_threshold": float(dense[eer_index]),
+        "impostor_sorted": impostor,
+    }
+
+
+def decision_metrics(distances: np.ndarray, truth: np.ndarray, impostor_sorted: np.ndarray,
+                     tolerance: float, min_confidence: float) -> Dict[str, float]:
+    """Decisão do sistema: melhor cadastro, liberado se distância <= tolerância e confiança >= mínimo"""
+    threshold = min(tolerance, 1.0 - min_confidence / 100.0)
+    if distances.shape[1]:
+        best = np.argmin(distances, axis=1)
+        best_distance = distances[np.arange(len(distances)), best]
+    else:
+        best = np.full(len(distances), -1)
+        best_distance = np.full(len(distances), np.inf)
+    granted = best_distance <= threshold
+
+    genuine = truth >= 0
+    n_genuine, n_unknown = int(genuine.sum()), int((~genuine).sum())
+    correct = granted & genuine & (best == truth)
+    misidentified = granted & genuine & (best != truth)
+    return {
+        "threshold": float(threshold),
+        "far": float(np.searchsorted(impostor_sorted, threshold, side="right") / max(1, len(impostor_sorted))),
+        "frr": float(1.0 - correct.sum() / n_genuine) if n_genuine else None,
+        "misidentified": float(misidentified.sum() / n_genuine) if n_genuine else None,
+        "far_unknown": float((granted & ~genuine).sum() / n_unknown) if n_unknown else None,
+    }
+
+
+def pareto_frontier(points: List[Dict[str, object]], max_far: float) -> List[Dict[str, object]]:
+    """Combinações que nenhuma outra supera em CPU e FRR ao mesmo tempo, entre as com FAR aceitável"""
+    eligible = [point for point in points if point["far"] <= max_far and point["frr"] is not None]
+    frontier = []
+    for point in sorted(eligible, key=lambda p: (p["cpu_per_image"], p["frr"])):
+        if not frontier or point["frr"] < frontier[-1]["frr"]:
+            frontier.append(point)
+    return frontier
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="diretório com um subdiretório de fotos por pessoa")
+    parser.add_argument("--unknown", help="fotos de pessoas não cadastradas")
+    parser.add_argument("--rotations", default=",".join(map(str, config.ROTATION_ANGLES)),
+                        help='conjuntos de rotações separados por "|" (ex.: "0|0,-15,15")')
+    parser.add_argument("--upsample", default=str(config.DETECT_HOG_UPSAMPLE), help="ampliações do HOG (ex.: 0,1)")
+    parser.add_argument("--contrast", default=str(config.PREPROCESS_CONTRAST), help="fatores de contraste")
+    parser.add_argument("--sharpness", default=str(config.PREPROCESS_SHARPNESS), help="fatores de nitidez")
+    parser.add_argument("--tolerances", default="0.4,0.45,0.5,0.55,0.6,0.65", help="tolerâncias de distância")
+    parser.add_argument("--min-confidences", default="0,40,50,60", help="confianças mínimas (%%)")
+    parser.add_argument("--max-far", type=float, default=0.001, help="FAR máximo aceito na fronteira de Pareto")
+    parser.add_argument("--workers", type=int, default=1, help="processos de encoding")
+    parser.add_argument("--cache-dir", default="sweep_cache", help="cache de encodings por configuração")
+    parser.add_argument("--output", help="arquivo JSON de saída")
+    args = parser.parse_args()
+
+    samples = load_labeled(os.path.abspath(args.images))
+    unknown = load_unlabeled(os.path.abspath(args.unknown) if args.unknown else None)
+    if not samples:
+        raise SystemExit(f"Nenhuma foto rotulada em {args.images}")
+    paths = [path for _, path in samples] + unknown
+    hashes = {path: file_hash(path) for path in paths}
+    os.makedirs(args.cache_dir, exist_ok=True)
+
+    from face_recognition_module import FaceRecognitionSystem
+
+    key_system = FaceRecognitionSystem(lazy=True)
+    tolerances = parse_list(args.tolerances, float)
+    min_confidences = parse_list(args.min_confidences, float)
+
+    encodings_report, points = [], []
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), initializer=_init_worker) as executor:
+        for params in encoding_configs(args):
+            key = config_key(key_system, params)
+            start = time.perf_counter()
+            encoded, cached = encode_all(params, key, paths, hashes, args.cache_dir, executor)
+            cpu = [encoded[hashes[path]]["cpu"] for path in paths]
+
+            distances, truth, enroll_failures = build_trials(samples, unknown, encoded, hashes)
+            curve = roc(distances, truth, ROC_THRESHOLDS)
+            cpu_stats = summarize(cpu)
+            encodings_report.append({
+                "params": params,
+                "cache_key": key,
+                "cached_images": cached,
+                "seconds": time.perf_counter() - start,
+                "cpu_per_image": cpu_stats,
+                "enroll_failures": enroll_failures,
+                "failed_to_acquire": int(np.isinf(distances).all(axis=1).sum()) if distances.shape[1] else len(truth),
+                "genuine_pairs": curve["genuine_pairs"],
+                "impostor_pairs": curve["impostor_pairs"],
+                "eer": curve["eer"],
+                "eer_threshold": curve["eer_threshold"],
+                "roc": [{"threshold": float(t), "far": float(a), "frr": float(r)}
+                        for t, a, r in zip(ROC_THRESHOLDS, curve["far"], curve["frr"])],
+            })
+            print(f"{json.dumps(params)}: {cached}/{len(paths)} do cache, CPU/foto {cpu_stats['mean_ms']:.0f}ms, "
+                  f"EER {curve['eer']:.2%}")
+
+            for tolerance, min_confidence in itertools.product(tolerances, min_confidences):
+                point = {**params, "tolerance": tolerance, "min_confidence": min_confidence,
+                         "cpu_per_image": cpu_stats["mean_ms"] / 1000}
+                point.update(decision_metrics(distances, truth, curve["impostor_sorted"], tolerance, min_confidence))
+                point["current"] = (params["rotations"] == list(config.ROTATION_ANGLES)
+                                    and params["upsample"] == config.DETECT_HOG_UPSAMPLE
+                                    and params["contrast"] == config.PREPROCESS_CONTRAST
+                                    and params["sharpness"] == config.PREPROCESS_SHARPNESS
+                                    and tolerance == config.RECOGNITION_TOLERANCE
+                                    and min_confidence == config.RECOGNITION_MIN_CONFIDENCE)
+                points.append(point)
+
+    frontier = pareto_frontier(points, args.max_far)
+    print(f"\nFronteira de Pareto (FAR <= {args.max_far:g}):")
+    print(f"{'rotações':<22} {'ups':>3} {'contr':>5} {'nitid':>5} {'tol':>5} {'conf':>5} "
+          f"{'CPU/foto':>9} {'FAR':>8} {'FRR':>8}")
+    for point in frontier:
+        mark = " *" if point["current"] else ""
+        print(f"{','.join(map(str, point['rotations'])):<22} {point['upsample']:>3} {point['contrast']:>5.2f} "
+              f"{point['sharpness']:>5.2f} {point['tolerance']:>5.2f} {point['min_confidence']:>5.0f} "
+              f"{point['cpu_per_image'] * 1000:>7.0f}ms {point['far']:>8.4f} {point['frr']:>8.4f}{mark}")
+    current = [point for point in points if point["current"]]
+    if current:
+        print(f"Configuração atual: FAR {current[0]['far']:.4f}, FRR {current[0]['frr']:.4f}, "
+              f"CPU/foto {current[0]['cpu_per_image'] * 1000:.0f}ms" + ("" if current[0] in frontier else
+                                                                        " (fora da fronteira)"))
+
+    if args.output:
+        output = os.path.abspath(args.output)
+        save_results(output, {
+            "environment": environment_info(),
+            "config": {"images": args.images, "unknown": args.unknown, "people": len({l for l, _ in samples}),
+                       "labeled_images": len(samples), "unknown_images": len(unknown), "max_far": args.max_far},
+            "encodings": encodings_report,
+            "points": points,
+            "pareto": frontier,
+        })
+        print(f"Resultados gravados em {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,520 @@
+"""
+Pipelines de reconhecimento das câmeras registradas.
+
+Cada câmera ativa da tabela cameras (índice USB, arquivo de vídeo ou URL
+RTSP) tem:
+
+- uma thread de captura, que lê a fonte sem parar e guarda só o frame mais
+  recente, reabrindo a fonte se ela cair (arquivos de vídeo tocam em loop no
+  ritmo do próprio vídeo, o que permite testar sem câmera);
+- uma tarefa no event loop, que a cada 1/max_fps pega o frame mais novo,
+  pede uma vaga ao escalonador, pula cenas paradas, reconhece no pool e
+  acompanha a pessoa com o FrameSession, gravando uma liberação por
+  passagem e as negações confirmadas.
+
+O FairScheduler divide as vagas de reconhecimento entre as câmeras por fila
+justa ponderada: entre as que estão esperando, passa a que consumiu menos
+tempo de pool dividido pela prioridade. Sob sobrecarga, frames que
+envelhecem além de CAMERA_MAX_FRAME_AGE enquanto esperam são descartados em
+vez de atrasar as decisões seguintes.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import config
+import metrics
+from database import Camera, SessionLocal
+from frame_stream import FrameSession
+from image_pipeline import prepare_image
+from recognition_profiles import CAMERA_PROFILES, RecognitionProfile, get_profile, resolve_profile
+
+
+# Janela usada no cálculo de frames processados por segundo
+THROUGHPUT_WINDOW_SECONDS = 10.0
+
+# Peso da amostra mais recente nas médias móveis de atraso e espera
+EWMA_ALPHA = 0.2
+
+RUNNING = "running"
+CONNECTING = "connecting"
+RECONNECTING = "reconnecting"
+STOPPED = "stopped"
+
+
+@dataclass(frozen=True)
+class CameraConfig:
+    """Cópia imutável de uma linha da tabela cameras usada pelo pipeline"""
+    id: int
+    name: str
+    source: str
+    enabled: bool
+    priority: int
+    max_fps: float
+    profile: Optional[str]
+
+    @classmethod
+    def from_row(cls, camera: Camera) -> "CameraConfig":
+        return cls(
+            id=camera.id,
+            name=camera.name,
+            source=camera.source,
+            enabled=bool(camera.enabled),
+            priority=max(1, camera.priority or 1),
+            # 0 gravado por versões anteriores não desliga o limite: vale o padrão
+            max_fps=camera.max_fps if camera.max_fps and camera.max_fps > 0 else config.CAMERA_DEFAULT_MAX_FPS,
+            profile=camera.profile,
+        )
+
+    def recognition_profile(self) -> RecognitionProfile:
+        """Perfil da câmera, senão o de FACE_CAMERA_PROFILES (pelo nome ou pela fonte), senão o padrão"""
+        if self.profile:
+            return get_profile(self.profile)
+        return resolve_profile(camera=self.name if self.name in CAMERA_PROFILES else self.source)
+
+
+@dataclass
+class CameraStats:
+    state: str = CONNECTING
+    captured: int = 0
+    processed: int = 0
+    dropped: int = 0  # capturados e substituídos por um mais novo antes de serem usados
+    stale: int = 0  # envelhecidos esperando vaga
+    unchanged: int = 0
+    errors: int = 0
+    decisions: int = 0  # acessos gravados
+    last_lag: Optional[float] = None
+    lag_ewma: Optional[float] = None
+    wait_ewma: Optional[float] = None
+    processed_at: Deque[float] = field(default_factory=deque)
+
+    def observe(self, lag: float, wait: float):
+        now = time.monotonic()
+        self.processed += 1
+        self.last_lag = lag
+        self.lag_ewma = lag if self.lag_ewma is None else EWMA_ALPHA * lag + (1 - EWMA_ALPHA) * self.lag_ewma
+        self.wait_ewma = wait if self.wait_ewma is None else EWMA_ALPHA * wait + (1 - EWMA_ALPHA) * self.wait_ewma
+        self.processed_at.append(now)
+        while self.processed_at and now - self.processed_at[0] > THROUGHPUT_WINDOW_SECONDS:
+            self.processed_at.popleft()
+
+    def throughput(self) -> float:
+        now = time.monotonic()
+        recent = [at for at in self.processed_at if now - at <= THROUGHPUT_WINDOW_SECONDS]
+        return len(recent) / THROUGHPUT_WINDOW_SECONDS
+
+
+def open_source(source: str) -> cv2.VideoCapture:
+    """Índice USB ("0", "1"...) ou caminho/URL aceito pelo OpenCV"""
+    source = source.strip()
+    return cv2.VideoCapture(int(source) if source.isdigit() else source)
+
+
+class FrameSlot:
+    """Último frame capturado, passado da thread de captura para o event loop"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._frame: Optional[np.ndarray] = None
+        self._captured_at = 0.0
+        self._sequence = 0
+        self._event = asyncio.Event()
+
+    def put(self, frame: np.ndarray):
+        """Chamado pela thread de captura"""
+        with self._lock:
+            self._frame = frame
+            self._captured_at = time.monotonic()
+            self._sequence += 1
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass  # event loop já encerrado
+
+    def latest(self) -> Tuple[Optional[np.ndarray], float, int]:
+        """(frame, instante da captura, número de sequência)"""
+        with self._lock:
+            return self._frame, self._captured_at, self._sequence
+
+    async def wait_newer(self, sequence: int):
+        """Espera um frame com número de sequência maior que o dado"""
+        while self.latest()[2] <= sequence:
+            self._event.clear()
+            if self.latest()[2] > sequence:
+                break
+            await self._event.wait()
+
+
+class CameraCapture(threading.Thread):
+    """Lê a fonte continuamente e guarda o frame mais recente no FrameSlot"""
+
+    def __init__(self, camera: CameraConfig, slot: FrameSlot, stats: CameraStats,
+                 reconnect_seconds: float = config.CAMERA_RECONNECT_SECONDS):
+        super().__init__(name=f"camera-{camera.name}", daemon=True)
+        self.logger = logging.getLogger(__name__)
+        self.camera = camera
+        self.slot = slot
+        self.stats = stats
+        self.reconnect_seconds = reconnect_seconds
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            capture = open_source(self.camera.source)
+            if not capture.isOpened():
+                capture.release()
+                self.stats.state = RECONNECTING
+                metrics.CAMERA_FRAMES.labels(self.camera.name, "open_failed").inc()
+                self.logger.warning(f"Câmera {self.camera.name}: não foi possível abrir {self.camera.source}")
+                self._stopping.wait(self.reconnect_seconds)
+                continue
+
+            self.stats.state = RUNNING
+            try:
+                self._read_frames(capture)
+            except Exception as e:
+                self.logger.error(f"Câmera {self.camera.name}: erro na captura: {e}")
+            finally:
+                capture.release()
+            if not self._stopping.is_set():
+                self.stats.state = RECONNECTING
+                self.logger.warning(f"Câmera {self.camera.name}: fonte interrompida, reabrindo")
+                self._stopping.wait(self.reconnect_seconds)
+        self.stats.state = STOPPED
+
+    def _read_frames(self, capture: cv2.VideoCapture):
+        # Arquivos são lidos no ritmo do vídeo e recomeçam no fim, como uma câmera ao vivo
+        is_file = os.path.isfile(self.camera.source)
+        frame_interval = 1.0 / (capture.get(cv2.CAP_PROP_FPS) or 25.0) if is_file else 0.0
+        frames_since_rewind = 0
+        next_at = time.monotonic()
+        while not self._stopping.is_set():
+            ok, frame = capture.read()
+            if not ok:
+                if is_file and frames_since_rewind and capture.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                    frames_since_rewind = 0
+                    continue
+                return
+            frames_since_rewind += 1
+            self.stats.captured += 1
+            metrics.CAMERA_FRAMES.labels(self.camera.name, "captured").inc()
+            self.slot.put(frame)
+            if frame_interval:
+                next_at += frame_interval
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    self._stopping.wait(delay)
+                else:
+                    next_at = time.monotonic()
+
+
+class FairScheduler:
+    """
+    Vagas de reconhecimento divididas entre as câmeras por fila justa ponderada
+
+    Cada câmera acumula o tempo de pool que usou dividido pela sua prioridade;
+    quando uma vaga abre, passa a câmera em espera com o menor acumulado.
+    Uma câmera que volta a pedir vaga depois de ociosa entra no nível das que
+    estão esperando, sem crédito acumulado para monopolizar o pool. Como cada
+    câmera tem no máximo um frame esperando, a prioridade decide a ordem entre
+    as que disputam a vaga; o teto de vazão de cada uma é o max_fps.
+    """
+
+    def __init__(self, slots: int):
+        self.slots = max(1, slots)
+        self.busy = 0
+        self.usage: Dict[int, float] = {}  # tempo de pool / prioridade, base da ordem de atendimento
+        self.served: Dict[int, float] = {}  # tempo de pool de fato usado, em segundos
+        self._waiting: Dict[int, asyncio.Future] = {}
+
+    @asynccontextmanager
+    async def slot(self, camera_id: int, priority: int):
+        """Reserva uma vaga; devolve os segundos de espera"""
+        requested_at = time.perf_counter()
+        await self._acquire(camera_id)
+        started_at = time.perf_counter()
+        try:
+            yield started_at - requested_at
+        finally:
+            self._release(camera_id, priority, time.perf_counter() - started_at)
+
+    async def _acquire(self, camera_id: int):
+        floor = min((self.usage[waiting] for waiting in self._waiting), default=None)
+        usage = self.usage.get(camera_id, 0.0)
+        self.usage[camera_id] = max(usage, floor) if floor is not None else usage
+        if self.busy < self.slots and not self._waiting:
+            self.busy += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[camera_id] = future
+        try:
+            await future
+        except asyncio.CancelledError:
+            self._waiting.pop(camera_id, None)
+            if future.done() and not future.cancelled():
+                # A vaga já tinha sido entregue: repassar
+                self.busy -= 1
+                self._dispatch()
+            raise
+
+    def _release(self, camera_id: int, priority: int, seconds: float):
+        self.usage[camera_id] = self.usage.get(camera_id, 0.0) + seconds / max(1, priority)
+        self.served[camera_id] = self.served.get(camera_id, 0.0) + seconds
+        self.busy -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.busy < self.slots and self._waiting:
+            camera_id = min(self._waiting, key=lambda waiting: self.usage.get(waiting, 0.0))
+            future = self._waiting.pop(camera_id)
+            if future.done():
+                continue
+            self.busy += 1
+            future.set_result(None)
+
+    def forget(self, camera_id: int):
+        self.usage.pop(camera_id, None)
+        self.served.pop(camera_id, None)
+
+
+class CameraPipeline:
+    """Captura -> escalonador -> reconhecimento -> trilha -> registro, para uma câmera"""
+
+    def __init__(self, camera: CameraConfig, manager: "CameraManager"):
+        self.logger = logging.getLogger(__name__)
+        self.camera = camera
+        self.manager = manager
+        self.stats = CameraStats()
+        self.slot: Optional[FrameSlot] = None
+        self.capture: Optional[CameraCapture] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.slot = FrameSlot(asyncio.get_running_loop())
+        self.capture = CameraCapture(self.camera, self.slot, self.stats)
+        self.capture.start()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.capture is not None:
+            self.capture.stop()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if self.capture is not None:
+            await asyncio.to_thread(self.capture.join, self.manager.reconnect_seconds + 1.0)
+        self.stats.state = STOPPED
+
+    def latest_frame(self, max_age: float) -> Optional[np.ndarray]:
+        """Frame mais recente, se ainda for atual"""
+        if self.slot is None:
+            return None
+        frame, captured_at, _ = self.slot.latest()
+        if frame is None or time.monotonic() - captured_at > max_age:
+            return None
+        return frame
+
+    def _count(self, result: str, amount: int = 1):
+        if amount > 0:
+            metrics.CAMERA_FRAMES.labels(self.camera.name, result).inc(amount)
+
+    async def _run(self):
+        session = FrameSession(count_frame=lambda result: self._count(result))
+        profile = self.camera.recognition_profile()
+        target_face_size = self.manager.face_system.settings(profile).detect_target_face_size
+        interval = 1.0 / self.camera.max_fps if self.camera.max_fps > 0 else 0.0
+        sequence = 0
+        while True:
+            cycle_started = time.monotonic()
+            try:
+                sequence = await self._cycle(session, profile, target_face_size, sequence)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats.errors += 1
+                self._count("error")
+                self.logger.error(f"Câmera {self.camera.name}: erro no pipeline: {e}")
+                await asyncio.sleep(1.0)
+
+            # Vale também para frames velhos e cenas paradas: o loop nunca passa de max_fps
+            if interval:
+                await asyncio.sleep(max(0.0, cycle_started + interval - time.monotonic()))
+
+    def _prepare(self, frame: np.ndarray, target_face_size: int, session: FrameSession):
+        """Redimensiona o frame e descarta cenas paradas (fora do event loop); None se não mudou"""
+        decoded = prepare_image(frame, target_face_size=target_face_size)
+        return None if session.unchanged(decoded.detection_image) else decoded
+
+    async def _cycle(self, session: FrameSession, profile, target_face_size: int, sequence: int) -> int:
+        """Processa o frame mais recente; devolve o número dele"""
+        await self.slot.wait_newer(sequence)
+        async with self.manager.scheduler.slot(self.camera.id, self.camera.priority) as wait:
+            metrics.CAMERA_SCHEDULER_WAIT.labels(self.camera.name).observe(wait)
+            # A espera pela vaga pode ter trazido frames mais novos
+            frame, captured_at, newest = self.slot.latest()
+            self.stats.dropped += newest - sequence - 1
+            self._count("dropped", newest - sequence - 1)
+            if time.monotonic() - captured_at > self.manager.max_frame_age:
+                self.stats.stale += 1
+                self._count("stale")
+                return newest
+
+            decoded = await asyncio.to_thread(self._prepare, frame, target_face_size, session)
+            if decoded is None:
+                self.stats.unchanged += 1
+                return newest
+            result = await self.manager.pool.run(self.manager.recognize, decoded, profile)
+
+        lag = time.monotonic() - captured_at
+        self.stats.observe(lag, wait)
+        metrics.CAMERA_LAG.labels(self.camera.name).observe(lag)
+        status = session.update(result)
+        if status == "denied" or (status == "granted" and session.first_grant()):
+            self.stats.decisions += 1
+            if self.manager.on_decision is not None:
+                await asyncio.to_thread(self.manager.on_decision, self.camera, result, decoded)
+        return newest
+
+
+class CameraManager:
+    """Registro de câmeras em memória e seus pipelines"""
+
+    def __init__(self, face_system, pool, recognize: Optional[Callable[..., Any]] = None,
+                 on_decision: Optional[Callable[[CameraConfig, Any, Any], None]] = None,
+                 slots: int = config.CAMERA_SCHEDULER_SLOTS,
+                 max_frame_age: float = config.CAMERA_MAX_FRAME_AGE,
+                 reconnect_seconds: float = config.CAMERA_RECONNECT_SECONDS,
+                 enabled: bool = config.CAMERA_PIPELINES_ENABLED):
+        """
+        Args:
+            recognize: função (decoded, perfil) -> RecognitionResult executada no pool
+            on_decision: grava uma decisão (câmera, resultado, imagem decodificada); roda fora do event loop
+            slots: reconhecimentos simultâneos das câmeras (0 = workers do pool - 1,
+                deixando um worker para as requisições)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.face_system = face_system
+        self.pool = pool
+        self.recognize = recognize or face_system.recognize
+        self.on_decision = on_decision
+        self.scheduler = FairScheduler(slots or max(1, pool.max_workers - 1))
+        self.max_frame_age = max_frame_age
+        self.reconnect_seconds = reconnect_seconds
+        self.enabled = enabled
+        self.cameras: Dict[int, CameraConfig] = {}
+        self.pipelines: Dict[int, CameraPipeline] = {}
+
+    def _read(self, camera_id: Optional[int] = None) -> List[CameraConfig]:
+        db = SessionLocal()
+        try:
+            query = db.query(Camera)
+            if camera_id is not None:
+                query = query.filter(Camera.id == camera_id)
+            return [CameraConfig.from_row(camera) for camera in query.all()]
+        finally:
+            db.close()
+
+    async def start(self):
+        """Carrega o registro e inicia os pipelines das câmeras ativas"""
+        for camera in await asyncio.to_thread(self._read):
+            self.cameras[camera.id] = camera
+            if camera.enabled:
+                self._start_pipeline(camera)
+        if self.pipelines:
+            self.logger.info(f"{len(self.pipelines)} pipeline(s) de câmera iniciado(s), "
+                             f"{self.scheduler.slots} vaga(s) no escalonador")
+
+    async def start_when_ready(self, startup_state, poll_interval: float = 0.5):
+        """Espera o warm-up terminar (modelos e galeria) antes de iniciar os pipelines"""
+        while not startup_state.is_ready:
+            if startup_state.error or startup_state.stopping:
+                return
+            await asyncio.sleep(poll_interval)
+        await self.start()
+
+    def _start_pipeline(self, camera: CameraConfig):
+        if not self.enabled:
+            return
+        pipeline = CameraPipeline(camera, self)
+        pipeline.start()
+        self.pipelines[camera.id] = pipeline
+
+    async def reload(self, camera_id: int):
+        """Aplica uma alteração do registro: para o pipeline antigo e inicia o novo, se ativa"""
+        pipeline = self.pipelines.pop(camera_id, None)
+        if pipeline is not None:
+            await pipeline.stop()
+        cameras = await asyncio.to_thread(self._read, camera_id)
+        if not cameras:
+            self.cameras.pop(camera_id, None)
+            self.scheduler.forget(camera_id)
+            return
+        camera = cameras[0]
+        self.cameras[camera_id] = camera
+        if camera.enabled:
+            self._start_pipeline(camera)
+
+    async def stop(self):
+        pipelines = list(self.pipelines.values())
+        self.pipelines.clear()
+        await asyncio.gather(*(pipeline.stop() for pipeline in pipelines), return_exceptions=True)
+
+    def find(self, key: str) -> Optional[CameraConfig]:
+        """Câmera registrada pelo nome ou pela fonte"""
+        for camera in self.cameras.values():
+            if key in (camera.name, camera.source):
+                return camera
+        return None
+
+    def latest_frame(self, key: str) -> Optional[np.ndarray]:
+        """Frame atual de uma câmera com pipeline rodando (evita abrir o mesmo dispositivo duas vezes)"""
+        camera = self.find(key)
+        pipeline = self.pipelines.get(camera.id) if camera else None
+        return pipeline.latest_frame(self.max_frame_age) if pipeline else None
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Vazão, atraso e descartes por câmera"""
+        total_served = sum(self.scheduler.served.values()) or 1.0
+        result = []
+        for camera in self.cameras.values():
+            pipeline = self.pipelines.get(camera.id)
+            stats = pipeline.stats if pipeline else CameraStats(state=STOPPED)
+            result.append({
+                "id": camera.id,
+                "name": camera.name,
+                "enabled": camera.enabled,
+                "priority": camera.priority,
+                "max_fps": camera.max_fps,
+                "profile": camera.recognition_profile().name,
+                "state": stats.state,
+                "captured": stats.captured,
+                "processed": stats.processed,
+                "dropped": stats.dropped,
+                "stale": stats.stale,
+                "unchanged": stats.unchanged,
+                "errors": stats.errors,
+                "decisions": stats.decisions,
+                "throughput_fps": round(stats.throughput(), 2),
+                "lag_ms": round(stats.lag_ewma * 1000, 1) if stats.lag_ewma is not None else None,
+                "last_lag_ms": round(stats.last_lag * 1000, 1) if stats.last_lag is not None else None,
+                "scheduler_wait_ms": round(stats.wait_ewma * 1000, 1) if stats.wait_ewma is not None else None,
+                "pool_share": round(self.scheduler.served.get(camera.id, 0.0) / total_served, 3),
+            })
+        return result
@@ -0,0 +1,165 @@
+import os
+
+
+def env_str(name: str, default: str) -> str:
+    """Lê uma string de variável de ambiente"""
+    return os.getenv(name, default)
+
+
+def env_int(name: str, default: int) -> int:
+    """Lê um inteiro de variável de ambiente, usando o padrão se inválido"""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """Lê um float de variável de ambiente, usando o padrão se inválido"""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_int_list(name: str, default: str) -> list:
+    """Lê uma lista de inteiros separados por vírgula, usando o padrão se inválida"""
+    try:
+        return [int(item) for item in os.getenv(name, default).split(",") if item.strip()]
+    except ValueError:
+        return [int(item) for item in default.split(",")]
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Lê um booleano de variável de ambiente (1/true/yes/on)"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Pré-processamento de imagem
+PREPROCESS_CONTRAST = env_float("FACE_PREPROCESS_CONTRAST", 1.2)
+PREPROCESS_SHARPNESS = env_float("FACE_PREPROCESS_SHARPNESS", 1.1)
+PREPROCESS_CLAHE = env_bool("FACE_PREPROCESS_CLAHE", False)
+PREPROCESS_CLAHE_CLIP_LIMIT = env_float("FACE_PREPROCESS_CLAHE_CLIP_LIMIT", 2.0)
+PREPROCESS_CLAHE_TILE_SIZE = env_int("FACE_PREPROCESS_CLAHE_TILE_SIZE", 8)
+PREPROCESS_MAX_SIDE = env_int("FACE_PREPROCESS_MAX_SIDE", 0)  # 0 = sem redimensionamento
+
+# Decisão e encoding (avaliar mudanças com benchmarks.sweep antes de alterar)
+RECOGNITION_TOLERANCE = env_float("FACE_RECOGNITION_TOLERANCE", 0.6)  # distância máxima para um match
+RECOGNITION_MIN_CONFIDENCE = env_float("FACE_RECOGNITION_MIN_CONFIDENCE", 60.0)  # (1 - distância) * 100 para liberar
+ROTATION_ANGLES = env_int_list("FACE_ROTATION_ANGLES", "0,-15,15,-30,30")  # rotações testadas no encoding (graus)
+DETECT_HOG_UPSAMPLE = env_int("FACE_DETECT_HOG_UPSAMPLE", 1)  # ampliações da imagem antes do HOG
+
+# Perfis de reconhecimento (ver recognition_profiles.py)
+RECOGNITION_PROFILE = env_str("FACE_RECOGNITION_PROFILE", "balanced")  # perfil padrão: fast, balanced ou accurate
+CAMERA_PROFILES = env_str("FACE_CAMERA_PROFILES", "")  # perfil por câmera, ex.: "0:fast,sala-servidores:accurate"
+
+# Decodificação e detecção em resolução reduzida
+DETECT_TARGET_FACE_SIZE = env_int("FACE_DETECT_TARGET_FACE_SIZE", 100)  # lado da menor face esperada na detecção (px)
+DETECT_MIN_FACE_FRACTION = env_float("FACE_DETECT_MIN_FACE_FRACTION", 0.1)  # menor face esperada / menor lado da foto
+ENCODE_MIN_FACE_SIZE = env_int("FACE_ENCODE_MIN_FACE_SIZE", 150)  # resolução mínima da face para o encoding
+ENCODE_MAX_FACE_SIZE = env_int("FACE_ENCODE_MAX_FACE_SIZE", 300)  # recortes maiores são reduzidos
+ENCODE_CROP_PADDING = env_float("FACE_ENCODE_CROP_PADDING", 0.5)  # margem do recorte, em frações da face
+
+# Execução
+RECOGNITION_WORKERS = env_int("RECOGNITION_WORKERS", 2)  # threads do pool de reconhecimento
+
+# Perfis de reconhecimentos lentos
+PROFILE_ENABLED = env_bool("PROFILE_ENABLED", True)
+PROFILE_DIR = env_str("PROFILE_DIR", "data/profiles")
+PROFILE_THRESHOLD_SECONDS = env_float("PROFILE_THRESHOLD_SECONDS", 2.0)  # grava perfil acima deste tempo
+PROFILE_SAMPLE_RATE = env_float("PROFILE_SAMPLE_RATE", 0.0)  # fração das chamadas perfiladas com cProfile
+PROFILE_MAX_FILES = env_int("PROFILE_MAX_FILES", 50)  # tamanho do anel em disco
+PROFILE_SAMPLE_INTERVAL = env_float("PROFILE_SAMPLE_INTERVAL", 0.005)  # intervalo entre amostras de pilha (s)
+PROFILE_ARM_FRACTION = env_float("PROFILE_ARM_FRACTION", 0.5)  # amostragem começa após esta fração do limite
+
+# Inicialização
+IMPORT_BUDGET_SECONDS = env_float("IMPORT_BUDGET_SECONDS", 2.0)  # tempo aceitável para importar a API
+STARTUP_BUDGET_SECONDS = env_float("STARTUP_BUDGET_SECONDS", 15.0)  # tempo aceitável até o /ready
+READY_RETRY_AFTER_SECONDS = env_int("READY_RETRY_AFTER_SECONDS", 5)
+WARMUP_RETRY_SECONDS = env_float("WARMUP_RETRY_SECONDS", 5.0)  # espera antes de repetir uma fase que falhou (dobra a cada falha)
+WARMUP_RETRY_MAX_SECONDS = env_float("WARMUP_RETRY_MAX_SECONDS", 120.0)
+
+# Logging
+LOG_DIR = env_str("LOG_DIR", "logs")
+LOG_JSON = env_bool("LOG_JSON", False)  # JSON lines compacto em vez de texto
+LOG_QUEUE_SIZE = env_int("LOG_QUEUE_SIZE", 10000)  # registros pendentes antes de descartar
+LOG_CONSOLE = env_bool("LOG_CONSOLE", True)
+
+# Controle de qualidade da face (antes do encoding)
+QUALITY_GATE_ENABLED = env_bool("FACE_QUALITY_GATE_ENABLED", True)
+QUALITY_MIN_FACE_SIZE = env_int("FACE_QUALITY_MIN_FACE_SIZE", 40)  # menor lado da face (px, imagem decodificada)
+QUALITY_MIN_BRIGHTNESS = env_float("FACE_QUALITY_MIN_BRIGHTNESS", 40.0)  # luminância média mínima da face (0-255)
+QUALITY_MAX_BRIGHTNESS = env_float("FACE_QUALITY_MAX_BRIGHTNESS", 225.0)
+QUALITY_MIN_SHARPNESS = env_float("FACE_QUALITY_MIN_SHARPNESS", 15.0)  # variância do Laplaciano na face em 100px
+QUALITY_MAX_YAW = env_float("FACE_QUALITY_MAX_YAW", 0.35)  # desvio do nariz / distância entre os olhos
+
+# Detecção em cascata (opcional; meça o recall com benchmarks.bench_detection antes de ativar)
+DETECT_METHOD = env_str("FACE_DETECT_METHOD", "hog")  # "hog" (HOG na imagem toda, Haar de reserva) ou "cascade"
+DETECT_PROPOSAL_DETECTOR = env_str("FACE_DETECT_PROPOSAL_DETECTOR", "hog")  # "haar" ou "hog" na passada barata
+DETECT_PROPOSAL_SCALE = env_float("FACE_DETECT_PROPOSAL_SCALE", 0.5)  # escala da passada barata
+DETECT_VERIFY = env_str("FACE_DETECT_VERIFY", "hog")  # "hog", "landmarks" ou "none"
+DETECT_ROI_PADDING = env_float("FACE_DETECT_ROI_PADDING", 0.3)  # margem das regiões verificadas, em frações da face
+DETECT_FALLBACK_FULL = env_bool("FACE_DETECT_FALLBACK_FULL", False)  # HOG na imagem toda quando não há propostas
+
+# Envio contínuo de frames (WebSocket /access/stream)
+STREAM_MAX_FRAME_AGE = env_float("STREAM_MAX_FRAME_AGE", 1.0)  # frames mais velhos que isso (s) são descartados
+STREAM_MAX_FRAME_BYTES = env_int("STREAM_MAX_FRAME_BYTES", 2 * 1024 * 1024)
+STREAM_MOTION_THRESHOLD = env_float("STREAM_MOTION_THRESHOLD", 4.0)  # diferença média (0-255) que conta como movimento
+STREAM_RESULT_TTL = env_float("STREAM_RESULT_TTL", 2.0)  # cena parada é reavaliada depois deste tempo (s)
+STREAM_DENY_FRAMES = env_int("STREAM_DENY_FRAMES", 3)  # frames não reconhecidos seguidos para negar
+STREAM_TRACK_TIMEOUT = env_float("STREAM_TRACK_TIMEOUT", 2.0)  # sem face por este tempo (s) encerra a trilha
+
+# Cadastro assíncrono (jobs de registro)
+REGISTRATION_UPLOAD_DIR = env_str("REGISTRATION_UPLOAD_DIR", "data/registration_uploads")
+REGISTRATION_MAX_ATTEMPTS = env_int("REGISTRATION_MAX_ATTEMPTS", 3)  # tentativas em falhas temporárias
+REGISTRATION_RETRY_DELAY_SECONDS = env_float("REGISTRATION_RETRY_DELAY_SECONDS", 5.0)  # multiplicado pela tentativa
+REGISTRATION_ORPHAN_TTL_SECONDS = env_int("REGISTRATION_ORPHAN_TTL_SECONDS", 24 * 3600)  # idade para apagar sobras
+REGISTRATION_CLEANUP_INTERVAL_SECONDS = env_int("REGISTRATION_CLEANUP_INTERVAL_SECONDS", 3600)
+
+# Câmeras registradas (pipelines de captura e reconhecimento contínuos)
+CAMERA_PIPELINES_ENABLED = env_bool("CAMERA_PIPELINES_ENABLED", True)
+CAMERA_SCHEDULER_SLOTS = env_int("CAMERA_SCHEDULER_SLOTS", 0)  # reconhecimentos simultâneos das câmeras; 0 = workers - 1
+CAMERA_DEFAULT_MAX_FPS = env_float("CAMERA_DEFAULT_MAX_FPS", 2.0)  # reconhecimentos por segundo de cada câmera
+CAMERA_MAX_FRAME_AGE = env_float("CAMERA_MAX_FRAME_AGE", 1.0)  # frames mais velhos que isso (s) são descartados
+CAMERA_RECONNECT_SECONDS = env_float("CAMERA_RECONNECT_SECONDS", 5.0)  # espera antes de reabrir uma fonte que caiu
+
+# Controle de admissão das verificações de acesso (ver admission.py)
+ADMISSION_ENABLED = env_bool("ADMISSION_ENABLED", True)
+ADMISSION_REDUCED_LOAD = env_float("ADMISSION_REDUCED_LOAD", 1.5)  # verificações pendentes por worker (0 = ignorar)
+ADMISSION_MINIMAL_LOAD = env_float("ADMISSION_MINIMAL_LOAD", 3.0)
+ADMISSION_SHED_LOAD = env_float("ADMISSION_SHED_LOAD", 6.0)
+ADMISSION_REDUCED_WAIT = env_float("ADMISSION_REDUCED_WAIT", 0.3)  # espera do item mais antigo da fila (s; 0 = ignorar)
+ADMISSION_MINIMAL_WAIT = env_float("ADMISSION_MINIMAL_WAIT", 1.0)
+ADMISSION_SHED_WAIT = env_float("ADMISSION_SHED_WAIT", 3.0)
+ADMISSION_REDUCED_FACE_SIZE = env_int("ADMISSION_REDUCED_FACE_SIZE", 80)  # tamanho alvo da detecção em reduced (px)
+ADMISSION_MINIMAL_FACE_SIZE = env_int("ADMISSION_MINIMAL_FACE_SIZE", 60)
+ADMISSION_RETRY_AFTER_SECONDS = env_int("ADMISSION_RETRY_AFTER_SECONDS", 2)  # mínimo do Retry-After do 503
+
+# Imagens das tentativas de acesso (ver snapshots.py)
+SNAPSHOT_MODE = env_str("SNAPSHOT_MODE", "denied")  # off, denied (só negações) ou all
+SNAPSHOT_DIR = env_str("SNAPSHOT_DIR", "data/snapshots")  # subdiretórios AAAA/MM/DD
+SNAPSHOT_CROP = env_str("SNAPSHOT_CROP", "face")  # face (região das faces) ou frame (imagem inteira)
+SNAPSHOT_CROP_PADDING = env_float("SNAPSHOT_CROP_PADDING", 0.5)  # margem do recorte, em frações da face
+SNAPSHOT_MAX_SIDE = env_int("SNAPSHOT_MAX_SIDE", 480)  # maior lado gravado (px); 0 = sem redução
+SNAPSHOT_JPEG_QUALITY = env_int("SNAPSHOT_JPEG_QUALITY", 80)
+SNAPSHOT_QUEUE_SIZE = env_int("SNAPSHOT_QUEUE_SIZE", 64)  # imagens pendentes antes de descartar
+SNAPSHOT_RETENTION_DAYS = env_int("SNAPSHOT_RETENTION_DAYS", 90)  # 0 = sem limite de idade
+SNAPSHOT_MAX_MB = env_int("SNAPSHOT_MAX_MB", 2048)  # cota de disco; acima dela, as mais antigas saem (0 = sem cota)
+SNAPSHOT_SWEEP_INTERVAL_SECONDS = env_int("SNAPSHOT_SWEEP_INTERVAL_SECONDS", 3600)
+
+# Cache em disco dos encodings de fotos de cadastro (ver encoding_cache.py)
+ENCODING_CACHE_ENABLED = env_bool("ENCODING_CACHE_ENABLED", True)
+ENCODING_CACHE_PATH = env_str("ENCODING_CACHE_PATH", "data/encoding_cache.db")
+ENCODING_CACHE_MAX_MB = env_int("ENCODING_CACHE_MAX_MB", 256)  # acima disso, as entradas usadas há mais tempo saem
+
+# Galeria de encodings (gerações reconstruídas por tools.rebuild_gallery)
+GALLERY_DIR = env_str("GALLERY_DIR", "data/galleries")
+GALLERY_WATCH_INTERVAL_SECONDS = env_float("GALLERY_WATCH_INTERVAL_SECONDS", 5.0)  # verificação de nova geração publicada
+GALLERY_KEEP_GENERATIONS = env_int("GALLERY_KEEP_GENERATIONS", 3)  # gerações prontas mantidas para rollback
+GALLERY_QUANTIZATION = env_str("FACE_GALLERY_QUANTIZATION", "none")  # none, float16 ou int8 (ver quantized_gallery.py)
+GALLERY_QUANT_SCALE = env_str("FACE_GALLERY_QUANT_SCALE", "vector")  # escala do int8: vector (por encoding) ou global
+GALLERY_RERANK_K = env_int("FACE_GALLERY_RERANK_K", 32)  # candidatos re-comparados com os vetores float32 exatos
+GALLERY_EXACT_DIR = env_str("FACE_GALLERY_EXACT_DIR", os.path.join(GALLERY_DIR, "exact"))  # vetores float32 mapeados (mmap)
@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, LargeBinary, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import create_engine, inspect, text, Column, Integer, Float, String, LargeBinary, DateTime, Text, Boolean, ForeignKey, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime, timezone
@@ -33,7 +33,10 @@ class AuthorizedUser(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     email = Column(String, unique=True, index=True)
-    face_encoding = Column(Text) # armazenar como string para simplificar
+    face_encoding = Column(Text) # formato antigo (JSON); migrado para face_embedding
+    face_embedding = Column(LargeBinary, nullable=True)  # 128 float32 (ver embeddings.py)
+    embedding_version = Column(String, nullable=True)  # modelo/pipeline que gerou o encoding
+    embedding_updated_at = Column(DateTime, nullable=True)
     image_path = Column(String)
     access_level = Column(String, default=AccessLevel.BASICO.value)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
@@ -70,6 +73,66 @@ class AccessLog(Base):
     image_path = Column(String, nullable=True)  # Caminho para a imagem capturada durante o acesso
     access_type = Column(String, default="facial_recognition")  # Tipo de acesso (ex: RECONHECIMENTO_FACIAL, CARTAO_ACESSO, etc.)
     document_id = Column(Integer, ForeignKey("documents.id"), nullable=True)  # ID do documento acessado, se aplicável
+    recognition_profile = Column(String, nullable=True)  # perfil de reconhecimento usado (fast, balanced, accurate)
+    recognition_ms = Column(Float, nullable=True)  # tempo do reconhecimento (decodificação até a decisão)
+    camera = Column(String, nullable=True)  # câmera/quiosque de origem, quando informado
+
+class Camera(Base):
+    """Câmera registrada; cada uma ativa roda seu próprio pipeline de captura e reconhecimento (ver cameras.py)"""
+    __tablename__ = "cameras"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True)
+    source = Column(String)  # índice USB ("0"), arquivo de vídeo ou URL (rtsp://...)
+    enabled = Column(Boolean, default=True)
+    priority = Column(Integer, default=1)  # peso na divisão do pool entre as câmeras
+    max_fps = Column(Float, nullable=True)  # limite de reconhecimentos por segundo (None = CAMERA_DEFAULT_MAX_FPS)
+    profile = Column(String, nullable=True)  # perfil de reconhecimento (None = FACE_CAMERA_PROFILES ou o padrão)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class AccessRollupHourly(Base):
+    """Contagem de access_logs por hora (UTC), usuário, tipo de acesso, decisão e documento (ver analytics.py)"""
+    __tablename__ = "access_rollup_hourly"
+    __table_args__ = (UniqueConstraint("bucket", "user_id", "access_type", "access_granted", "document_id"),)
+
+    id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, nullable=False)  # início da hora
+    user_id = Column(Integer, nullable=False, default=0)  # 0 = sem usuário identificado
+    access_type = Column(String, nullable=False)
+    access_granted = Column(Boolean, nullable=False)
+    document_id = Column(Integer, nullable=False, default=0)  # 0 = sem documento
+    attempts = Column(Integer, nullable=False, default=0)
+
+class AccessRollupDaily(Base):
+    """Mesmas chaves de AccessRollupHourly, por dia (UTC)"""
+    __tablename__ = "access_rollup_daily"
+    __table_args__ = (UniqueConstraint("bucket", "user_id", "access_type", "access_granted", "document_id"),)
+
+    id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, nullable=False)  # início do dia
+    user_id = Column(Integer, nullable=False, default=0)
+    access_type = Column(String, nullable=False)
+    access_granted = Column(Boolean, nullable=False)
+    document_id = Column(Integer, nullable=False, default=0)
+    attempts = Column(Integer, nullable=False, default=0)
+
+class RegistrationJob(Base):
+    __tablename__ = "registration_jobs"
+
+    id = Column(String, primary_key=True)  # uuid devolvido ao cliente
+    name = Column(String)
+    email = Column(String, index=True)
+    access_level = Column(String, default=AccessLevel.BASICO.value)
+    upload_path = Column(String)  # foto recebida, aguardando o encoding
+    status = Column(String, default="queued", index=True)  # queued, running, succeeded, failed
+    attempts = Column(Integer, default=0)
+    message = Column(Text, nullable=True)  # motivo da falha ou mensagem de sucesso
+    retryable = Column(Boolean, default=False)  # falha temporária: pode ser reenfileirado
+    user_id = Column(Integer, ForeignKey("authorized_users.id"), nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at = Column(DateTime, nullable=True)
 
 def get_db():
     db = SessionLocal()
@@ -78,10 +141,30 @@ def get_db():
     finally:
         db.close()
 
+# Colunas adicionadas depois da criação das tabelas: (tabela, coluna, tipo SQL)
+ADDED_COLUMNS = [
+    ("authorized_users", "face_embedding", "BLOB"),
+    ("authorized_users", "embedding_version", "VARCHAR"),
+    ("authorized_users", "embedding_updated_at", "DATETIME"),
+    ("access_logs", "recognition_profile", "VARCHAR"),
+    ("access_logs", "recognition_ms", "FLOAT"),
+    ("access_logs", "camera", "VARCHAR"),
+]
+
+def migrate_schema():
+    """Acrescenta às tabelas existentes as colunas que o create_all não cria"""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table, column, sql_type in ADDED_COLUMNS:
+            existing = {info["name"] for info in inspector.get_columns(table)}
+            if column not in existing:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}"))
+
 def init_database():
     if not os.path.exists('./data'):
         os.makedirs('./data')
     Base.metadata.create_all(bind=engine)
+    migrate_schema()
 
 def get_accessible_documents(user_access_level: AccessLevel):
 
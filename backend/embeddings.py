@@ -0,0 +1,144 @@
+"""
+Encodings faciais como BLOB de largura fixa no banco.
+
+Cada encoding do dlib vira 128 float32 (512 bytes) em
+AuthorizedUser.face_embedding, com a versão do modelo/pipeline que o gerou
+em embedding_version. O banco é a única fonte da galeria: ela é carregada
+com um único SELECT sobre os usuários ativos, e os BLOBs concatenados viram
+a matriz do NumPy com np.frombuffer, sem parse de JSON.
+
+migrate_legacy_encodings converte os formatos antigos (arquivos
+{email}_encoding.json e a coluna de texto face_encoding) para o BLOB.
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+
+from database import AuthorizedUser, SessionLocal
+
+
+EMBEDDING_MODEL = "dlib_resnet_v1"
+EMBEDDING_SIZE = 128
+EMBEDDING_DTYPE = np.dtype("<f4")
+EMBEDDING_BYTES = EMBEDDING_SIZE * EMBEDDING_DTYPE.itemsize
+
+# Versão dos encodings convertidos dos formatos antigos (pipeline desconhecido)
+LEGACY_VERSION = "legacy"
+
+logger = logging.getLogger(__name__)
+
+
+def to_blob(encoding) -> bytes:
+    """Encoding (128 floats) -> 512 bytes float32 little-endian"""
+    array = np.asarray(encoding, dtype=EMBEDDING_DTYPE).reshape(-1)
+    if array.size != EMBEDDING_SIZE:
+        raise ValueError(f"Encoding com {array.size} valores (esperado: {EMBEDDING_SIZE})")
+    return array.tobytes()
+
+
+def from_blobs(blobs: Iterable[bytes]) -> np.ndarray:
+    """Concatena os BLOBs e devolve a matriz (n, 128) float32 sem copiar valor a valor"""
+    data = b"".join(blobs)
+    return np.frombuffer(data, dtype=EMBEDDING_DTYPE).reshape(-1, EMBEDDING_SIZE)
+
+
+def pipeline_version(signature: Dict[str, object]) -> str:
+    """Identificador curto do modelo + parâmetros do pipeline que geraram o encoding"""
+    digest = hashlib.sha1(json.dumps(signature, sort_keys=True).encode()).hexdigest()[:12]
+    return f"{EMBEDDING_MODEL}:{digest}"
+
+
+def load_gallery(db) -> Tuple[np.ndarray, List[str], List[str], Dict[str, int]]:
+    """
+    Lê a galeria dos usuários ativos em um único SELECT
+
+    Returns:
+        (matriz de encodings, nomes, emails, contagem por versão)
+    """
+    rows = db.query(AuthorizedUser.name, AuthorizedUser.email, AuthorizedUser.face_embedding,
+                    AuthorizedUser.embedding_version) \
+        .filter(AuthorizedUser.is_active == True, AuthorizedUser.face_embedding.isnot(None)) \
+        .order_by(AuthorizedUser.id).all()
+
+    valid = [row for row in rows if len(row.face_embedding) == EMBEDDING_BYTES]
+    if len(valid) != len(rows):
+        logger.warning(f"{len(rows) - len(valid)} encodings com tamanho inválido ignorados")
+
+    versions: Dict[str, int] = {}
+    for row in valid:
+        versions[row.embedding_version] = versions.get(row.embedding_version, 0) + 1
+    matrix = from_blobs(row.face_embedding for row in valid)
+    return matrix, [row.name for row in valid], [row.email for row in valid], versions
+
+
+def gallery_marker(db) -> Tuple[int, Optional[datetime]]:
+    """Resumo barato da galeria no banco; muda quando alguém entra, sai, é renomeado ou é recodificado"""
+    count, updated = db.query(func.count(AuthorizedUser.face_embedding), func.max(AuthorizedUser.embedding_updated_at)) \
+        .filter(AuthorizedUser.is_active == True).one()
+    return count, updated
+
+
+def _read_encoding_file(path: str) -> Optional[list]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)["encoding"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def migrate_legacy_encodings(directories: List[str]) -> Dict[str, int]:
+    """
+    Preenche face_embedding de quem ainda não tem, a partir de (em ordem):
+
+    1. arquivos {email}_encoding.json nos diretórios informados, que eram o
+       que a galeria de fato usava;
+    2. a coluna de texto face_encoding.
+
+    Os arquivos e a coluna antiga não são apagados.
+    """
+    counts = {"files": 0, "column": 0, "missing": 0}
+    db = SessionLocal()
+    try:
+        users = db.query(AuthorizedUser).filter(AuthorizedUser.face_embedding.is_(None)).all()
+        for user in users:
+            encoding = None
+            source = None
+            for directory in directories:
+                encoding = _read_encoding_file(os.path.join(directory, f"{user.email}_encoding.json"))
+                if encoding is not None:
+                    source = "files"
+                    break
+            if encoding is None and user.face_encoding:
+                try:
+                    encoding = json.loads(user.face_encoding)
+                    source = "column"
+                except ValueError:
+                    encoding = None
+            try:
+                blob = to_blob(encoding) if encoding is not None else None
+            except ValueError:
+                blob = None
+            if blob is None:
+                if user.is_active:
+                    counts["missing"] += 1
+                    logger.warning(f"Usuário {user.email} sem encoding em nenhum formato antigo")
+                continue
+
+            user.face_embedding = blob
+            user.embedding_version = LEGACY_VERSION
+            user.embedding_updated_at = datetime.now(timezone.utc)
+            counts[source] += 1
+        db.commit()
+    finally:
+        db.close()
+
+    if counts["files"] or counts["column"]:
+        logger.info(f"Encodings migrados para o banco: {counts['files']} de arquivos, "
+                    f"{counts['column']} da coluna face_encoding")
+    return counts
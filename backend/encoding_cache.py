@@ -0,0 +1,150 @@
+"""
+Cache em disco dos encodings de fotos de cadastro.
+
+Recadastrar alguém, repetir um job de registro que falhou ou reconstruir a
+galeria recodifica fotos que o sistema já processou, e o encoding (detecção
++ process_face_with_rotation) é a parte cara. O cache guarda o resultado de
+encode_enrollment_image (o encoding ou o motivo da recusa) em um SQLite
+próprio (ENCODING_CACHE_PATH), chaveado pelo SHA-1 do conteúdo da foto e
+pela versão do pipeline: mudar o pré-processamento, a detecção, as rotações
+ou o encoding muda a versão, e as entradas antigas deixam de ser usadas sem
+nenhuma limpeza manual.
+
+O tamanho é limitado por ENCODING_CACHE_MAX_MB com descarte LRU (as
+entradas de versões antigas, que não são mais lidas, saem primeiro). O
+arquivo pode ser usado ao mesmo tempo pela API e pelos processos do
+tools.rebuild_gallery.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+import config
+import metrics
+from embeddings import EMBEDDING_DTYPE
+
+
+# Inserções entre verificações do tamanho do cache
+EVICT_CHECK_INTERVAL = 64
+
+# Fração do limite liberada a cada descarte (evita descartar a cada inserção)
+EVICT_TARGET = 0.9
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+class EncodingCache:
+    """Encodings de cadastro por (hash da foto, versão do pipeline), com LRU limitado em bytes"""
+
+    def __init__(self, path: str = config.ENCODING_CACHE_PATH, max_bytes: int = config.ENCODING_CACHE_MAX_MB * 2**20,
+                 enabled: bool = config.ENCODING_CACHE_ENABLED):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._inserts = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Processos filhos (pool do rebuild) abrem a sua própria conexão
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS encodings ("
+                " key TEXT PRIMARY KEY, version TEXT NOT NULL, encoding BLOB, error TEXT,"
+                " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS encodings_last_used ON encodings (last_used)")
+            connection.commit()
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    @staticmethod
+    def key(digest: str, version: str) -> str:
+        return f"{digest}:{version}"
+
+    def get(self, digest: str, version: str) -> Optional[Tuple[Optional[np.ndarray], str]]:
+        """(encoding ou None, motivo da recusa) se a foto já foi processada nesta versão"""
+        if not self.enabled:
+            return None
+        key = self.key(digest, version)
+        try:
+            with self._lock:
+                connection = self._connect()
+                row = connection.execute("SELECT encoding, error FROM encodings WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    metrics.ENCODING_CACHE.labels("miss").inc()
+                    return None
+                connection.execute("UPDATE encodings SET last_used = ? WHERE key = ?", (time.time(), key))
+                connection.commit()
+                self.hits += 1
+        except sqlite3.Error as e:
+            logger.warning(f"Cache de encodings indisponível: {e}")
+            return None
+        metrics.ENCODING_CACHE.labels("hit").inc()
+        blob, error = row
+        return (np.frombuffer(blob, dtype=EMBEDDING_DTYPE).copy() if blob is not None else None), error or ""
+
+    def put(self, digest: str, version: str, encoding: Optional[np.ndarray], error: str = ""):
+        if not self.enabled:
+            return
+        blob = np.asarray(encoding, dtype=EMBEDDING_DTYPE).tobytes() if encoding is not None else None
+        key = self.key(digest, version)
+        size = len(key) + (len(blob) if blob else 0) + len(error.encode())
+        try:
+            with self._lock:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO encodings (key, version, encoding, error, size, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, version, blob, error, size, time.time()),
+                )
+                connection.commit()
+                self._inserts += 1
+                if self._inserts % EVICT_CHECK_INTERVAL == 1:
+                    self._evict(connection)
+        except sqlite3.Error as e:
+            logger.warning(f"Não foi possível gravar no cache de encodings: {e}")
+
+    def _evict(self, connection: sqlite3.Connection):
+        """Descarta as entradas usadas há mais tempo até o cache caber no limite"""
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM encodings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - int(self.max_bytes * EVICT_TARGET)
+        freed = 0
+        keys = []
+        for key, size in connection.execute("SELECT key, size FROM encodings ORDER BY last_used"):
+            keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        connection.executemany("DELETE FROM encodings WHERE key = ?", keys)
+        connection.commit()
+        logger.info(f"Cache de encodings: {len(keys)} entradas descartadas ({freed / 2**20:.1f} MiB)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            connection = self._connect()
+            entries, total = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM encodings").fetchone()
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes, "hits": self.hits,
+                "misses": self.misses}
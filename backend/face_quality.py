@@ -0,0 +1,130 @@
+"""
+Avaliação barata da qualidade da face antes do encoding.
+
+Cada face detectada passa por verificações em ordem de custo: tamanho,
+exposição e nitidez (variância do Laplaciano) usam só a região da face na
+imagem decodificada; a pose usa os 5 landmarks do dlib no recorte já
+preparado para o encoding. Uma face reprovada não é codificada e o motivo
+volta em formato legível por máquina (ex.: "too_blurry").
+"""
+import math
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import config
+
+
+# Motivos de reprovação
+FACE_TOO_SMALL = "face_too_small"
+TOO_DARK = "too_dark"
+TOO_BRIGHT = "too_bright"
+TOO_BLURRY = "too_blurry"
+POSE_TOO_EXTREME = "pose_too_extreme"
+
+# Mensagens para quem está na porta
+RETAKE_MESSAGES = {
+    FACE_TOO_SMALL: "Aproxime-se da câmera e tente novamente",
+    TOO_DARK: "Imagem muito escura - melhore a iluminação e tente novamente",
+    TOO_BRIGHT: "Imagem muito clara - evite luz direta na câmera e tente novamente",
+    TOO_BLURRY: "Imagem tremida ou fora de foco - fique parado e tente novamente",
+    POSE_TOO_EXTREME: "Olhe de frente para a câmera e tente novamente",
+}
+
+# Lado da região normalizada usada na nitidez, para que o limite não dependa da resolução
+SHARPNESS_REFERENCE_SIZE = 100
+
+
+@dataclass
+class QualityConfig:
+    """Limites do controle de qualidade"""
+    enabled: bool = config.QUALITY_GATE_ENABLED
+    min_face_size: int = config.QUALITY_MIN_FACE_SIZE
+    min_brightness: float = config.QUALITY_MIN_BRIGHTNESS
+    max_brightness: float = config.QUALITY_MAX_BRIGHTNESS
+    min_sharpness: float = config.QUALITY_MIN_SHARPNESS
+    max_yaw: float = config.QUALITY_MAX_YAW
+
+
+@dataclass
+class QualityReport:
+    """Resultado da avaliação de uma face"""
+    passed: bool = True
+    reason: Optional[str] = None
+    scores: Dict[str, float] = field(default_factory=dict)
+
+
+class FaceQualityGate:
+    def __init__(self, quality_config: Optional[QualityConfig] = None):
+        self.config = quality_config or QualityConfig()
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def assess_region(self, image: np.ndarray, box: Tuple[int, int, int, int]) -> QualityReport:
+        """
+        Verifica tamanho, exposição e nitidez da face na imagem BGR decodificada
+
+        Args:
+            box: (x, y, w, h) da face na resolução de image
+        """
+        report = QualityReport()
+        x, y, w, h = box
+        report.scores["face_size"] = float(min(w, h))
+        if min(w, h) < self.config.min_face_size:
+            return self._reject(report, FACE_TOO_SMALL)
+
+        img_h, img_w = image.shape[:2]
+        region = image[max(0, y):min(img_h, y + h), max(0, x):min(img_w, x + w)]
+        if region.size == 0:
+            return self._reject(report, FACE_TOO_SMALL)
+        gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
+
+        brightness = float(gray.mean())
+        report.scores["brightness"] = brightness
+        if brightness < self.config.min_brightness:
+            return self._reject(report, TOO_DARK)
+        if brightness > self.config.max_brightness:
+            return self._reject(report, TOO_BRIGHT)
+
+        scale = SHARPNESS_REFERENCE_SIZE / float(min(gray.shape))
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        report.scores["sharpness"] = sharpness
+        if sharpness < self.config.min_sharpness:
+            return self._reject(report, TOO_BLURRY)
+        return report
+
+    def assess_pose(self, report: QualityReport, landmarks: Dict[str, list]) -> QualityReport:
+        """
+        Estima a pose com os landmarks de 5 pontos (olhos e ponta do nariz)
+
+        O desvio lateral (yaw) é o deslocamento do nariz em relação ao ponto
+        médio entre os olhos, em frações da distância entre os olhos; o giro
+        no plano (roll) só é informado, pois as rotações do encoding o cobrem.
+        """
+        left_eye = np.mean(landmarks["left_eye"], axis=0)
+        right_eye = np.mean(landmarks["right_eye"], axis=0)
+        nose = np.mean(landmarks["nose_tip"], axis=0)
+        eye_vector = right_eye - left_eye
+        eye_distance = float(np.linalg.norm(eye_vector))
+        if eye_distance == 0:
+            return self._reject(report, POSE_TOO_EXTREME)
+
+        yaw = float((nose - (left_eye + right_eye) / 2) @ eye_vector) / eye_distance ** 2
+        report.scores["yaw"] = yaw
+        report.scores["roll"] = math.degrees(math.atan2(eye_vector[1], eye_vector[0]))
+        if abs(yaw) > self.config.max_yaw:
+            return self._reject(report, POSE_TOO_EXTREME)
+        return report
+
+    @staticmethod
+    def _reject(report: QualityReport, reason: str) -> QualityReport:
+        report.passed = False
+        report.reason = reason
+        return report
+
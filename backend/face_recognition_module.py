@@ -1,53 +1,263 @@
 import cv2
-import face_recognition
 import numpy as np
-import os
-import json
 import logging
-from datetime import datetime
-from typing import List, Tuple, Optional
-from PIL import Image, ImageEnhance
-import pickle
+from dataclasses import asdict, dataclass, field, replace
+from typing import Dict, List, Tuple, Optional
+import threading
+import time
 
+import config
+import embeddings
+import metrics
+import quantized_gallery
+from database import SessionLocal
+from encoding_cache import EncodingCache, content_hash
+from face_quality import FaceQualityGate, QualityReport
+from image_pipeline import DecodedImage, PreprocessingPipeline, decode_image, downscale, prepare_image
+from recognition_profiles import PROFILES, RecognitionProfile
+
+
+class _LazyFaceRecognition:
+    """
+    Importa face_recognition no primeiro uso.
+
+    O import do face_recognition já carrega os modelos do dlib (detector,
+    landmarks e rede de encoding), o que deixava o import da API lento.
+    """
 
-class FaceRecognitionSystem:
     def __init__(self):
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    import face_recognition as module
+                    self._module = module
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+
+face_recognition = _LazyFaceRecognition()
+
+# Rotações para testar (em graus)
+ROTATION_ANGLES = config.ROTATION_ANGLES
+
+
+@dataclass
+class DetectionConfig:
+    """Parâmetros da detecção (método "hog" = HOG na imagem toda com Haar de reserva)"""
+    method: str = config.DETECT_METHOD
+    proposal_detector: str = config.DETECT_PROPOSAL_DETECTOR
+    proposal_scale: float = config.DETECT_PROPOSAL_SCALE
+    verify: str = config.DETECT_VERIFY
+    roi_padding: float = config.DETECT_ROI_PADDING
+    fallback_full: bool = config.DETECT_FALLBACK_FULL
+    hog_upsample: int = config.DETECT_HOG_UPSAMPLE
+
+
+@dataclass
+class RecognitionSettings:
+    """Parâmetros efetivos de um reconhecimento: a configuração do sistema com o perfil aplicado"""
+    profile: str
+    detection: DetectionConfig
+    preprocessing: PreprocessingPipeline
+    rotation_angles: List[int]
+    num_jitters: int
+    detect_target_face_size: int
+    tolerance: float
+    min_confidence: float
+
+
+def merge_regions(regions: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+    """Une regiões (x0, y0, x1, y1) que se sobrepõem, para não verificar a mesma face duas vezes"""
+    merged = []
+    for region in sorted(regions):
+        x0, y0, x1, y1 = region
+        for i, (mx0, my0, mx1, my1) in enumerate(merged):
+            if x0 < mx1 and mx0 < x1 and y0 < my1 and my0 < y1:
+                merged[i] = (min(x0, mx0), min(y0, my0), max(x1, mx1), max(y1, my1))
+                break
+        else:
+            merged.append(region)
+    if len(merged) < len(regions):
+        return merge_regions(merged)
+    return merged
+
+
+def plausible_landmarks(landmarks: Dict[str, list], box: Tuple[int, int, int, int]) -> bool:
+    """Confere se os 5 landmarks têm a geometria de uma face dentro da caixa (x, y, w, h)"""
+    x, y, w, h = box
+    left_eye = np.mean(landmarks["left_eye"], axis=0)
+    right_eye = np.mean(landmarks["right_eye"], axis=0)
+    nose = np.mean(landmarks["nose_tip"], axis=0)
+    eye_distance = np.linalg.norm(right_eye - left_eye)
+    eyes_y = (left_eye[1] + right_eye[1]) / 2
+    return bool(
+        0.2 * w <= eye_distance <= 0.75 * w
+        and abs(right_eye[1] - left_eye[1]) <= 0.5 * eye_distance
+        and y <= eyes_y < nose[1] <= y + h
+        and min(left_eye[0], right_eye[0]) <= nose[0] <= max(left_eye[0], right_eye[0])
+    )
+
+
+@dataclass
+class RecognitionResult:
+    """Resultado detalhado de um reconhecimento, com tempos por etapa"""
+    access_granted: bool = False
+    user_name: Optional[str] = None
+    confidence: float = 0.0
+    faces: int = 0
+    image_size: Tuple[int, int] = (0, 0)
+    rotation_stages: int = 0
+    profile: Optional[str] = None  # perfil de reconhecimento usado
+    quality_reason: Optional[str] = None  # face reprovada no controle de qualidade (pedir nova foto)
+    quality_scores: Dict[str, float] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    face_boxes: List[Tuple[int, int, int, int]] = field(default_factory=list)  # (x, y, w, h) em decoded.image
+
+
+class FaceRecognitionSystem:
+    def __init__(self, lazy: bool = False):
+        """
+        Args:
+            lazy: não carrega modelos nem galeria no construtor; use warm_up()
+                (ou deixe carregar no primeiro uso)
+        """
         self.logger = logging.getLogger(__name__)
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self._face_cascade = None
         self.authorized_faces_dir = 'data/authorized_faces'
-        self.tolerance = 0.6
-        self.known_face_encodings = []
+        self.gallery_marker = None  # resumo da galeria no banco na última carga
+        self.tolerance = config.RECOGNITION_TOLERANCE
+        self.min_confidence = config.RECOGNITION_MIN_CONFIDENCE
+        self.rotation_angles = list(ROTATION_ANGLES)
+        self.preprocessing = PreprocessingPipeline()
+        self.quality_gate = FaceQualityGate()
+        self.detection = DetectionConfig()
+        self.encoding_cache = EncodingCache()
+        self.known_face_encodings = np.empty((0, embeddings.EMBEDDING_SIZE), dtype=embeddings.EMBEDDING_DTYPE)
         self.known_face_names = []
-        self.load_authorized_faces()
+        self.known_face_emails = []
+        self._gallery_lock = threading.Lock()
+        if not lazy:
+            self.warm_up()
 
-    def enhance_image_quality(self, image: np.ndarray) -> np.ndarray:
-        """Melhora a qualidade da imagem para melhor reconhecimento"""
-        # Converter para PIL para processamento
-        pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    @property
+    def face_cascade(self) -> cv2.CascadeClassifier:
+        """Haar Cascade, carregado no primeiro uso"""
+        if self._face_cascade is None:
+            self._face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        return self._face_cascade
 
-        # Melhorar contraste
-        enhancer = ImageEnhance.Contrast(pil_image)
-        pil_image = enhancer.enhance(1.2)
+    def pipeline_signature(self) -> Dict[str, object]:
+        """Parâmetros que mudam os encodings gerados; encodings de assinaturas diferentes não se misturam"""
+        return {
+            "rotation_angles": list(self.rotation_angles),
+            "preprocessing": asdict(self.preprocessing.config),
+            "detection": asdict(self.detection),
+            "encode": {
+                "min_face_size": config.ENCODE_MIN_FACE_SIZE,
+                "max_face_size": config.ENCODE_MAX_FACE_SIZE,
+                "crop_padding": config.ENCODE_CROP_PADDING,
+            },
+            # Redução na decodificação e escala da detecção das fotos de cadastro (reduction_for, detection_scale_for)
+            "decode": {
+                "target_face_size": config.DETECT_TARGET_FACE_SIZE,
+                "min_face_fraction": config.DETECT_MIN_FACE_FRACTION,
+            },
+        }
 
-        # Melhorar nitidez
-        enhancer = ImageEnhance.Sharpness(pil_image)
-        pil_image = enhancer.enhance(1.1)
+    def pipeline_version(self) -> str:
+        """Versão gravada em embedding_version junto com cada encoding"""
+        return embeddings.pipeline_version(self.pipeline_signature())
+
+    def settings(self, profile: Optional[RecognitionProfile] = None) -> RecognitionSettings:
+        """Configuração do sistema com as substituições do perfil (sem perfil: "balanced", a própria configuração)"""
+        profile = profile or PROFILES["balanced"]
+        overrides = {field_name: value for field_name, value in (
+            ("method", profile.detect_method),
+            ("proposal_detector", profile.proposal_detector),
+            ("hog_upsample", profile.hog_upsample),
+        ) if value is not None}
+        preprocessing = self.preprocessing
+        if not profile.enhance:
+            # Só a conversão para RGB (e a redução de max_side, se configurada)
+            preprocessing = PreprocessingPipeline(replace(self.preprocessing.config, contrast=1.0, sharpness=1.0,
+                                                          clahe=False))
+        return RecognitionSettings(
+            profile=profile.name,
+            detection=replace(self.detection, **overrides) if overrides else self.detection,
+            preprocessing=preprocessing,
+            rotation_angles=list(profile.rotation_angles) if profile.rotation_angles is not None else self.rotation_angles,
+            num_jitters=max(1, profile.num_jitters),
+            detect_target_face_size=profile.detect_target_face_size or config.DETECT_TARGET_FACE_SIZE,
+            tolerance=profile.tolerance if profile.tolerance is not None else self.tolerance,
+            min_confidence=profile.min_confidence if profile.min_confidence is not None else self.min_confidence,
+        )
+
+    def load_models(self):
+        """Carrega os modelos do dlib e o Haar Cascade"""
+        face_recognition.load()
+        _ = self.face_cascade
+
+    def run_dummy_encode(self):
+        """Executa um encoding descartável para que a primeira requisição não pague a inicialização"""
+        image = np.full((160, 160, 3), 128, dtype=np.uint8)
+        face_recognition.face_encodings(image, known_face_locations=[(20, 140, 140, 20)])
+
+    def warm_up_phases(self) -> List[Tuple[str, object]]:
+        """Fases de inicialização, na ordem, para acompanhamento pelo /ready"""
+        return [
+            ("models", self.load_models),
+            ("embeddings_migration", self.migrate_legacy_encodings),
+            ("gallery", self.load_authorized_faces),
+            ("dummy_encode", self.run_dummy_encode),
+        ]
+
+    def warm_up(self):
+        """Executa todas as fases de inicialização de forma síncrona"""
+        for _, phase in self.warm_up_phases():
+            phase()
+
+    def preprocess(self, image: np.ndarray, inplace: bool = False) -> Tuple[np.ndarray, Dict[str, float]]:
+        """
+        Converte a imagem BGR para RGB e aplica as melhorias de qualidade
+
+        Returns:
+            Tuple[np.ndarray, Dict[str, float]]: (imagem RGB, tempos por etapa)
+        """
+        rgb_image, timings = self.preprocessing.run(image, color="bgr", inplace=inplace)
+        self.logger.debug(
+            "Pré-processamento: " + ", ".join(f"{stage}={seconds * 1000:.2f}ms" for stage, seconds in timings.items())
+        )
+        return rgb_image, timings
 
-        # Converter de volta para OpenCV
-        return cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+    def enhance_image_quality(self, image: np.ndarray) -> np.ndarray:
+        """Melhora a qualidade da imagem para melhor reconhecimento (BGR -> BGR)"""
+        rgb_image, _ = self.preprocess(image)
+        return cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR, dst=rgb_image)
 
-    def detect_faces_multiple_methods(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
-        """Detecta faces usando múltiplos métodos para maior robustez"""
+    def detect_faces_multiple_methods(self, image: np.ndarray,
+                                      detection: Optional[DetectionConfig] = None) -> List[Tuple[int, int, int, int]]:
+        """Detecta faces usando múltiplos métodos para maior robustez (imagem RGB)"""
+        detection = detection or self.detection
         faces = []
         
         # Método 1: face_recognition (mais preciso)
-        face_locations = face_recognition.face_locations(image, model="hog")
+        face_locations = face_recognition.face_locations(image, detection.hog_upsample, model="hog")
         for (top, right, bottom, left) in face_locations:
             faces.append((left, top, right - left, bottom - top))
         
         # Método 2: Haar Cascade (mais rápido, detecta faces inclinadas)
         if not faces:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
             haar_faces = self.face_cascade.detectMultiScale(
                 gray,
                 scaleFactor=1.1,
@@ -60,25 +270,101 @@ class FaceRecognitionSystem:
         
         return faces
 
-    def process_face_with_rotation(self, image: np.ndarray) -> List[np.ndarray]:
-        """Processa a imagem com diferentes rotações para capturar faces inclinadas"""
+    def detect_faces(self, image: np.ndarray,
+                     detection: Optional[DetectionConfig] = None) -> List[Tuple[int, int, int, int]]:
+        """Detecta faces na imagem RGB com o método configurado em detection (padrão: self.detection)"""
+        detection = detection or self.detection
+        if detection.method == "cascade":
+            return self.detect_faces_cascade(image, detection)
+        return self.detect_faces_multiple_methods(image, detection)
+
+    def propose_face_regions(self, gray: np.ndarray,
+                             detection: Optional[DetectionConfig] = None) -> List[Tuple[int, int, int, int]]:
+        """Passada barata em tons de cinza reduzidos; devolve caixas (x, y, w, h) na escala de gray"""
+        detection = detection or self.detection
+        small = downscale(gray, detection.proposal_scale)
+        scale = small.shape[1] / float(gray.shape[1])
+        if detection.proposal_detector == "hog":
+            boxes = [(left, top, right - left, bottom - top)
+                     for (top, right, bottom, left) in face_recognition.face_locations(small, detection.hog_upsample, model="hog")]
+        else:
+            # minNeighbors baixo: aqui importa não perder faces, a verificação elimina os falsos positivos
+            boxes = self.face_cascade.detectMultiScale(small, scaleFactor=1.1, minNeighbors=3, minSize=(20, 20),
+                                                       flags=cv2.CASCADE_SCALE_IMAGE)
+        return [(int(x / scale), int(y / scale), int(w / scale), int(h / scale)) for (x, y, w, h) in boxes]
+
+    def detect_faces_cascade(self, image: np.ndarray,
+                             detection: Optional[DetectionConfig] = None) -> List[Tuple[int, int, int, int]]:
+        """
+        Detecção em cascata (imagem RGB): propostas baratas em uma versão reduzida
+        em tons de cinza e verificação (HOG ou landmarks) só nas regiões propostas,
+        com margem, na resolução da imagem recebida
+        """
+        detection = detection or self.detection
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        proposals = self.propose_face_regions(gray, detection)
+        if not proposals:
+            if not detection.fallback_full:
+                return []
+            # Sem propostas (ex.: face de perfil para o Haar): HOG na imagem toda, como no método antigo
+            return [(left, top, right - left, bottom - top)
+                    for (top, right, bottom, left) in face_recognition.face_locations(image, detection.hog_upsample, model="hog")]
+
+        if detection.verify == "none":
+            return proposals
+
+        faces = []
+        if detection.verify == "landmarks":
+            for box in proposals:
+                x, y, w, h = box
+                landmarks = face_recognition.face_landmarks(image, [(y, x + w, y + h, x)], model="small")
+                if landmarks and plausible_landmarks(landmarks[0], box):
+                    faces.append(box)
+            return faces
+
+        img_h, img_w = gray.shape[:2]
+        regions = []
+        for (x, y, w, h) in proposals:
+            pad = int(max(w, h) * detection.roi_padding)
+            regions.append((max(0, x - pad), max(0, y - pad), min(img_w, x + w + pad), min(img_h, y + h + pad)))
+        for (x0, y0, x1, y1) in merge_regions(regions):
+            roi = np.ascontiguousarray(image[y0:y1, x0:x1])
+            for (top, right, bottom, left) in face_recognition.face_locations(roi, detection.hog_upsample, model="hog"):
+                faces.append((x0 + left, y0 + top, right - left, bottom - top))
+        return faces
+
+    def process_face_with_rotation(self, image: np.ndarray,
+                                   face_location: Optional[Tuple[int, int, int, int]] = None,
+                                   settings: Optional[RecognitionSettings] = None) -> List[np.ndarray]:
+        """
+        Processa a imagem RGB com diferentes rotações para capturar faces inclinadas
+
+        Args:
+            image: imagem RGB (normalmente só o recorte da face)
+            face_location: (top, right, bottom, left) da face já detectada, evita
+                detectar de novo na rotação 0
+            settings: rotações e num_jitters do perfil (padrão: configuração do sistema)
+        """
+        settings = settings or self.settings()
         processed_encodings = []
         
-        # Rotações para testar (em graus)
-        rotations = [0, -15, 15, -30, 30]
-        
-        for angle in rotations:
+        for angle in settings.rotation_angles:
+            metrics.ROTATION_STAGES.labels(str(angle)).inc()
+            known_locations = None
             if angle != 0:
                 # Rotacionar imagem
                 rows, cols = image.shape[:2]
                 M = cv2.getRotationMatrix2D((cols/2, rows/2), angle, 1)
                 rotated = cv2.warpAffine(image, M, (cols, rows))
             else:
-                rotated = image.copy()
+                rotated = image
+                if face_location is not None:
+                    known_locations = [face_location]
             
             # Tentar extrair encoding da face
             try:
-                face_encodings = face_recognition.face_encodings(rotated)
+                face_encodings = face_recognition.face_encodings(rotated, known_face_locations=known_locations,
+                                                                 num_jitters=settings.num_jitters)
                 if face_encodings:
                     processed_encodings.extend(face_encodings)
             except Exception as e:
@@ -86,154 +372,369 @@ class FaceRecognitionSystem:
         
         return processed_encodings
 
-    def register_face(self, image_path: str, name: str, email: str) -> Tuple[bool, str, Optional[str]]:
+    def locate_faces(self, decoded: DecodedImage, contrast_mean: int, timings: Dict[str, float],
+                     settings: Optional[RecognitionSettings] = None) -> List[Tuple[Tuple[int, int, int, int], int]]:
+        """
+        Detecta as faces na imagem reduzida e devolve as caixas na resolução de decoded.image
+
+        Se nada for encontrado de frente, tenta a imagem reduzida rotacionada, o que
+        é muito mais barato do que rotacionar a foto inteira.
+
+        Returns:
+            List[Tuple[Tuple[int, int, int, int], int]]: [((x, y, w, h), ângulo), ...]
+        """
+        settings = settings or self.settings()
+        start = time.perf_counter()
+        small_rgb, _ = settings.preprocessing.run(decoded.detection_image, color="bgr", contrast_mean=contrast_mean)
+        timings["enhance"] = timings.get("enhance", 0.0) + time.perf_counter() - start
+
+        start = time.perf_counter()
+        scale = decoded.detection_scale
+        located = []
+        for angle in settings.rotation_angles:
+            if angle == 0:
+                faces = self.detect_faces(small_rgb, settings.detection)
+                centers = [(x + w / 2, y + h / 2) for (x, y, w, h) in faces]
+            else:
+                rows, cols = small_rgb.shape[:2]
+                M = cv2.getRotationMatrix2D((cols/2, rows/2), angle, 1)
+                # Nas rotações só o HOG, como fazia a antiga rotação da imagem inteira
+                rotated = cv2.warpAffine(small_rgb, M, (cols, rows))
+                faces = [(left, top, right - left, bottom - top)
+                         for (top, right, bottom, left) in face_recognition.face_locations(rotated, settings.detection.hog_upsample, model="hog")]
+                # Levar o centro de cada face de volta ao referencial não rotacionado
+                M_inv = cv2.invertAffineTransform(M)
+                centers = [tuple(M_inv @ np.array([x + w / 2, y + h / 2, 1.0])) for (x, y, w, h) in faces]
+
+            for (x, y, w, h), (cx, cy) in zip(faces, centers):
+                size_w, size_h = w / scale, h / scale
+                box = (int(cx / scale - size_w / 2), int(cy / scale - size_h / 2), int(size_w), int(size_h))
+                located.append((box, angle))
+            if located:
+                metrics.DETECTION_ANGLES.labels(str(angle)).inc(len(located))
+                break
+        timings["detect"] = timings.get("detect", 0.0) + time.perf_counter() - start
+        return located
+
+    def extract_face_crop(self, decoded: DecodedImage, box: Tuple[int, int, int, int], angle: int,
+                          contrast_mean: int, settings: Optional[RecognitionSettings] = None
+                          ) -> Tuple[np.ndarray, Optional[Tuple[int, int, int, int]]]:
+        """
+        Recorta a face da imagem em resolução cheia e aplica o pré-processamento só no recorte
+
+        Returns:
+            Tuple[np.ndarray, Optional[Tuple[int, int, int, int]]]: (recorte RGB,
+                (top, right, bottom, left) da face no recorte, ou None se for preciso detectar)
         """
-        Registra uma nova face autorizada
+        x, y, w, h = box
+        pad = int(max(w, h) * config.ENCODE_CROP_PADDING)
+        img_h, img_w = decoded.image.shape[:2]
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1, y1 = min(img_w, x + w + pad), min(img_h, y + h + pad)
+        crop = decoded.image[y0:y1, x0:x1]
+
+        # Faces muito grandes não ganham nada no encoding (o dlib trabalha em 150x150)
+        crop_scale = min(1.0, config.ENCODE_MAX_FACE_SIZE / float(max(w, h, 1)))
+        crop = downscale(crop, crop_scale)
+        preprocessing = settings.preprocessing if settings is not None else self.preprocessing
+        rgb_crop, _ = preprocessing.run(crop, color="bgr", inplace=crop_scale < 1.0, contrast_mean=contrast_mean)
+
+        if angle != 0:
+            rows, cols = rgb_crop.shape[:2]
+            M = cv2.getRotationMatrix2D((cols/2, rows/2), angle, 1)
+            return cv2.warpAffine(rgb_crop, M, (cols, rows)), None
+
+        top = int((y - y0) * crop_scale)
+        left = int((x - x0) * crop_scale)
+        bottom = min(rgb_crop.shape[0], int((y + h - y0) * crop_scale))
+        right = min(rgb_crop.shape[1], int((x + w - x0) * crop_scale))
+        return rgb_crop, (top, right, bottom, left)
+
+    def encode_faces(self, decoded: DecodedImage, timings: Dict[str, float],
+                     quality: Optional[List[QualityReport]] = None,
+                     settings: Optional[RecognitionSettings] = None,
+                     boxes: Optional[List[Tuple[int, int, int, int]]] = None) -> Tuple[int, List[List[np.ndarray]]]:
+        """
+        Detecta na imagem reduzida e extrai os encodings de cada face a partir do recorte
+
+        Args:
+            quality: se informada (e o controle estiver ativo), cada face passa pelo
+                controle de qualidade antes do encoding e o laudo é acrescentado à
+                lista; faces reprovadas ficam sem encodings
+            settings: parâmetros do perfil (padrão: configuração do sistema, usada no cadastro)
+            boxes: se informada, recebe as caixas (x, y, w, h) das faces detectadas
+
+        Returns:
+            Tuple[int, List[List[np.ndarray]]]: (número de faces, encodings de cada face)
+        """
+        settings = settings or self.settings()
+        contrast_mean = self.preprocessing.luminance_mean(decoded.detection_image)
+        located = self.locate_faces(decoded, contrast_mean, timings, settings)
+        if boxes is not None:
+            boxes.extend(tuple(int(value) for value in box) for box, _ in located)
+        check_quality = quality is not None and self.quality_gate.enabled
+
+        encodings_per_face = []
+        for box, angle in located:
+            report = None
+            if check_quality:
+                start = time.perf_counter()
+                report = self.quality_gate.assess_region(decoded.image, box)
+                timings["quality"] = timings.get("quality", 0.0) + time.perf_counter() - start
+                if not report.passed:
+                    quality.append(report)
+                    encodings_per_face.append([])
+                    continue
+
+            start = time.perf_counter()
+            rgb_crop, face_location = self.extract_face_crop(decoded, box, angle, contrast_mean, settings)
+            timings["enhance"] = timings.get("enhance", 0.0) + time.perf_counter() - start
+
+            if report is not None:
+                # A pose precisa dos landmarks, calculados no recorte já preparado
+                start = time.perf_counter()
+                if face_location is not None:
+                    landmarks = face_recognition.face_landmarks(rgb_crop, [face_location], model="small")
+                    if landmarks:
+                        self.quality_gate.assess_pose(report, landmarks[0])
+                timings["quality"] = timings.get("quality", 0.0) + time.perf_counter() - start
+                quality.append(report)
+                if not report.passed:
+                    encodings_per_face.append([])
+                    continue
+
+            start = time.perf_counter()
+            encodings_per_face.append(self.process_face_with_rotation(rgb_crop, face_location, settings))
+            timings["encode"] = timings.get("encode", 0.0) + time.perf_counter() - start
+
+        return len(located), encodings_per_face
+
+    def encode_enrollment_image(self, image_path: str) -> Tuple[Optional[np.ndarray], str]:
+        """
+        Extrai o encoding de uma foto de cadastro (exatamente uma face)
+
+        Fotos já processadas com o mesmo pipeline (recadastro, job repetido,
+        reconstrução da galeria) vêm do cache de encodings
+
+        Returns:
+            Tuple[Optional[np.ndarray], str]: (encoding, mensagem de erro se não houver)
+        """
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        digest, version = content_hash(data), self.pipeline_version()
+        cached = self.encoding_cache.get(digest, version)
+        if cached is not None:
+            return cached
+
+        encoding, error = self._encode_enrollment_data(data)
+        self.encoding_cache.put(digest, version, encoding, error)
+        return encoding, error
+
+    def _encode_enrollment_data(self, data: bytes) -> Tuple[Optional[np.ndarray], str]:
+        # Carregar imagem na resolução necessária, já com a orientação EXIF aplicada
+        decoded = decode_image(data)
+        if decoded is None:
+            return None, "Não foi possível carregar a imagem"
+
+        # Detectar faces na imagem reduzida e extrair encodings do recorte
+        timings = dict(decoded.timings)
+        faces, encodings_per_face = self.encode_faces(decoded, timings)
+        metrics.observe_stages("register", timings)
+        if not faces:
+            return None, "Nenhuma face detectada na imagem"
+
+        if faces > 1:
+            return None, "Múltiplas faces detectadas. Use uma imagem com apenas uma pessoa"
+
+        face_encodings = encodings_per_face[0]
+
+        if not face_encodings:
+            return None, "Não foi possível extrair características da face"
+
+        # Usar o primeiro encoding válido
+        return face_encodings[0], ""
+
+    def register_face(self, image_path: str, name: str, email: str,
+                      raise_errors: bool = False) -> Tuple[bool, str, Optional[np.ndarray]]:
+        """
+        Valida uma nova face autorizada e extrai o seu encoding
+
+        A galeria em memória não muda: quem chama grava o encoding no banco e,
+        depois do commit, usa add_authorized_face
+
+        Args:
+            raise_errors: propaga erros inesperados em vez de devolvê-los como
+                falha (os jobs de registro usam isso para distinguir falhas
+                temporárias, que podem ser repetidas, de fotos recusadas)
         
         Returns:
-            Tuple[bool, str, Optional[str]]: (sucesso, mensagem, encoding_string)
+            Tuple[bool, str, Optional[np.ndarray]]: (sucesso, mensagem, encoding float32
+            a ser gravado em AuthorizedUser.face_embedding)
         """
         try:
-            # Carregar e processar imagem
-            image = cv2.imread(image_path)
-            if image is None:
-                return False, "Não foi possível carregar a imagem", None
-                
-            # Melhorar qualidade da imagem
-            enhanced_image = self.enhance_image_quality(image)
-            
-            # Detectar faces
-            faces = self.detect_faces_multiple_methods(enhanced_image)
-            if not faces:
-                return False, "Nenhuma face detectada na imagem", None
-            
-            if len(faces) > 1:
-                return False, "Múltiplas faces detectadas. Use uma imagem com apenas uma pessoa", None
-                
-            # Processar face com rotações
-            face_encodings = self.process_face_with_rotation(enhanced_image)
-            
-            if not face_encodings:
-                return False, "Não foi possível extrair características da face", None
-                
-            # Usar o primeiro encoding válido
-            face_encoding = face_encodings[0]
+            face_encoding, error = self.encode_enrollment_image(image_path)
+            if face_encoding is None:
+                return False, error, None
             
             # Verificar se a face já está registrada
-            if self.known_face_encodings:
-                matches = face_recognition.compare_faces(
-                    self.known_face_encodings,
-                    face_encoding,
-                    tolerance=self.tolerance
-                )
-                if any(matches):
-                    return False, "Esta face já está registrada no sistema", None
-            
-            # Salvar encoding
-            encoding_str = json.dumps(face_encoding.tolist())
-            
-            # Adicionar às listas conhecidas
-            self.known_face_encodings.append(face_encoding)
-            self.known_face_names.append(name)
-            
-            encoding_file = os.path.join(self.authorized_faces_dir, f"{email}_encoding.json")
-            with open(encoding_file, 'w') as f:
-                json.dump({
-                    'name': name,
-                    'email': email,
-                    'encoding': face_encoding.tolist(),
-                    'image_path': image_path,
-                    'created_at': datetime.now().isoformat()
-                }, f)
+            known_face_encodings, _ = self.gallery_snapshot()
+            nearest = quantized_gallery.nearest(known_face_encodings, [face_encoding])
+            if nearest and nearest[0][1] <= self.tolerance:
+                return False, "Esta face já está registrada no sistema", None
             
-            self.logger.info(f"Face registrada com sucesso: {name} ({email})")
-            return True, f"Face de {name} registrada com sucesso", encoding_str
+            face_encoding = face_encoding.astype(embeddings.EMBEDDING_DTYPE)
+            return True, f"Face de {name} registrada com sucesso", face_encoding
             
         except Exception as e:
             self.logger.error(f"Erro ao registrar face: {e}")
+            if raise_errors:
+                raise
             return False, f"Erro interno: {str(e)}", None
 
-    def recognize_face(self, image: np.ndarray) -> Tuple[bool, Optional[str], float]:
+    def gallery_snapshot(self) -> Tuple[np.ndarray, List[str]]:
         """
-        Reconhece uma face na imagem
-        
+        Encodings (matriz float32 ou QuantizedGallery) e nomes da mesma versão
+        da galeria; quem altera a galeria cria listas novas em vez de modificar
+        as existentes
+        """
+        with self._gallery_lock:
+            return self.known_face_encodings, self.known_face_names
+
+    def match_encodings(self, face_encodings: List[np.ndarray],
+                        tolerance: Optional[float] = None) -> Tuple[Optional[str], float]:
+        """
+        Compara os encodings com as faces conhecidas
+
         Returns:
-            Tuple[bool, Optional[str], float]: (autorizado, nome, confiança)
+            Tuple[Optional[str], float]: (nome da melhor correspondência, confiança)
         """
+        tolerance = self.tolerance if tolerance is None else tolerance
+        best_match_name = None
+        best_confidence = 0.0
+        known_face_encodings, known_face_names = self.gallery_snapshot()
+        
+        if not face_encodings:
+            return best_match_name, best_confidence
+
+        # Melhor correspondência de cada encoding encontrado (galeria float32 ou
+        # quantizada com re-rank exato; ver quantized_gallery)
+        for best_match_index, min_distance in quantized_gallery.nearest(known_face_encodings, face_encodings):
+            # Converter distância em confiança (0-100%)
+            confidence = max(0, (1 - min_distance) * 100)
+
+            # Verificar se atende aos critérios
+            if min_distance <= tolerance and confidence > best_confidence:
+                best_confidence = confidence
+                best_match_name = known_face_names[best_match_index]
+        return best_match_name, best_confidence
+
+    def recognize(self, decoded: DecodedImage, profile: Optional[RecognitionProfile] = None) -> RecognitionResult:
+        """Reconhece as faces de uma imagem decodificada com o perfil dado, registrando o tempo de cada etapa"""
+        result = self._recognize(decoded, self.settings(profile))
+        metrics.observe_stages("recognize", result.timings)
+        return result
+
+    def _recognize(self, decoded: DecodedImage, settings: RecognitionSettings) -> RecognitionResult:
+        result = RecognitionResult(image_size=decoded.original_size, profile=settings.profile,
+                                   timings=dict(decoded.timings))
         try:
-            if not self.known_face_encodings:
-                return False, None, 0.0
-            
-            # Melhorar qualidade da imagem
-            enhanced_image = self.enhance_image_quality(image)
-            rgb_image = cv2.cvtColor(enhanced_image, cv2.COLOR_BGR2RGB)
-            
-            # Processar com múltiplas rotações
-            face_encodings = self.process_face_with_rotation(rgb_image)
+            if not len(self.known_face_encodings):
+                return result
             
+            # Detectar na imagem reduzida e codificar apenas os recortes das faces
+            quality = []
+            result.faces, encodings_per_face = self.encode_faces(decoded, result.timings, quality=quality,
+                                                                 settings=settings, boxes=result.face_boxes)
+            face_encodings = [encoding for encodings in encodings_per_face for encoding in encodings]
+            rejected = [report for report in quality if not report.passed]
+            result.rotation_stages = (result.faces - len(rejected)) * len(settings.rotation_angles)
+
+            if rejected and len(rejected) == result.faces:
+                # Nenhuma face em condições: pedir outra foto em vez de negar
+                result.quality_reason = rejected[0].reason
+                result.quality_scores = rejected[0].scores
+                metrics.QUALITY_REJECTIONS.labels(result.quality_reason).inc()
+                self.logger.info(f"Face reprovada no controle de qualidade: {result.quality_reason} {rejected[0].scores}")
+                return result
+
             if not face_encodings:
-                return False, None, 0.0
-                
-            best_match_name = None
-            best_confidence = 0.0
-            
-            # Testar cada encoding encontrado
-            for face_encoding in face_encodings:
-                # Calcular distâncias para todas as faces conhecidas
-                face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
+                return result
                 
-                if len(face_distances) > 0:
-                    # Encontrar a melhor correspondência
-                    best_match_index = np.argmin(face_distances)
-                    min_distance = face_distances[best_match_index]
-                    
-                    # Converter distância em confiança (0-100%)
-                    confidence = max(0, (1 - min_distance) * 100)
-                    
-                    # Verificar se atende aos critérios
-                    if min_distance <= self.tolerance and confidence > best_confidence:
-                        best_confidence = confidence
-                        best_match_name = self.known_face_names[best_match_index]
+            start = time.perf_counter()
+            best_match_name, best_confidence = self.match_encodings(face_encodings, settings.tolerance)
+            result.timings["match"] = time.perf_counter() - start
             
             # Decidir se autorizar acesso
-            access_granted = best_confidence >= 60  # Confiança mínima de 60%
+            result.access_granted = best_confidence >= settings.min_confidence
+            result.user_name = best_match_name
+            result.confidence = best_confidence
             self.logger.info(
-                f"Reconhecimento: {best_match_name if access_granted else 'Não autorizado'}, "
-                f"Confiança: {best_confidence:.1f}%"
+                f"Reconhecimento: {best_match_name if result.access_granted else 'Não autorizado'}, "
+                f"Confiança: {best_confidence:.1f}%, Tempo: {sum(result.timings.values()) * 1000:.0f}ms, "
+                f"Perfil: {settings.profile}"
             )
-            return access_granted, best_match_name, best_confidence
+            return result
             
         except Exception as e:
             self.logger.error(f"Erro no reconhecimento: {e}")
-            return False, None, 0.0
+            return RecognitionResult(image_size=decoded.original_size, profile=settings.profile, timings=result.timings)
+
+    def recognize_face(self, image: np.ndarray,
+                       profile: Optional[RecognitionProfile] = None) -> Tuple[bool, Optional[str], float]:
+        """
+        Reconhece uma face na imagem BGR
+        
+        Returns:
+            Tuple[bool, Optional[str], float]: (autorizado, nome, confiança)
+        """
+        target_face_size = self.settings(profile).detect_target_face_size
+        result = self.recognize(prepare_image(image, target_face_size=target_face_size), profile)
+        return result.access_granted, result.user_name, result.confidence
+
+    def migrate_legacy_encodings(self) -> Dict[str, int]:
+        """Converte encodings dos arquivos JSON e da coluna face_encoding para o BLOB no banco"""
+        return embeddings.migrate_legacy_encodings([self.authorized_faces_dir])
 
     def load_authorized_faces(self):
-        """Carrega todas as faces autorizadas do diretório"""
+        """Carrega as faces autorizadas do banco (um SELECT direto para a matriz de encodings)"""
         try:
-            if not os.path.exists(self.authorized_faces_dir):
-                os.makedirs(self.authorized_faces_dir)
-                return
+            db = SessionLocal()
+            try:
+                marker = embeddings.gallery_marker(db)
+                known_face_encodings, known_face_names, known_face_emails, versions = embeddings.load_gallery(db)
+            finally:
+                db.close()
+            known_face_encodings = quantized_gallery.build_gallery(known_face_encodings)
 
-            self.known_face_encodings = []
-            self.known_face_names = []
+            # Troca a galeria de uma vez: reconhecimentos em andamento usam a anterior
+            with self._gallery_lock:
+                self.known_face_encodings = known_face_encodings
+                self.known_face_names = known_face_names
+                self.known_face_emails = known_face_emails
+                self.gallery_marker = marker
             
-            for filename in os.listdir(self.authorized_faces_dir):
-                if filename.endswith('_encoding.json'):
-                    filepath = os.path.join(self.authorized_faces_dir, filename)
-                    try:
-                        with open(filepath, 'r') as f:
-                            data = json.load(f)
-                            encoding = np.array(data['encoding'])
-                            name = data['name']
-                            self.known_face_encodings.append(encoding)
-                            self.known_face_names.append(name)
-                    except Exception as e:
-                        self.logger.warning(f"Erro ao carregar {filename}: {e}")
-            
-            self.logger.info(f"Carregadas {len(self.known_face_encodings)} faces autorizadas")
+            metrics.GALLERY_SIZE.set(len(known_face_encodings))
+            self.logger.info(f"Carregadas {len(known_face_encodings)} faces autorizadas")
+            outdated = sum(count for version, count in versions.items() if version != self.pipeline_version())
+            if outdated:
+                self.logger.warning(
+                    f"{outdated} encodings gerados com outro pipeline; rode tools.rebuild_gallery para atualizá-los"
+                )
         except Exception as e:
             self.logger.error(f"Erro ao carregar faces autorizadas: {e}")
 
+    def reload_gallery_if_changed(self) -> bool:
+        """Recarrega a galeria se ela mudou no banco (reconstrução, cadastro ou remoção em outro processo)"""
+        db = SessionLocal()
+        try:
+            marker = embeddings.gallery_marker(db)
+        finally:
+            db.close()
+        if marker == self.gallery_marker:
+            return False
+        self.load_authorized_faces()
+        return True
+
     def get_camera_frame(self, camera_index: int = 0) -> Optional[np.ndarray]:
         """Captura um frame da câmera"""
         try:
@@ -248,15 +749,24 @@ class FaceRecognitionSystem:
             self.logger.error(f"Erro ao capturar frame da câmera: {e}")
             return None
 
+    def add_authorized_face(self, name: str, email: str, face_encoding: np.ndarray):
+        """Acrescenta uma face à galeria em memória (depois que o cadastro foi gravado no banco)"""
+        face_encoding = np.asarray(face_encoding, dtype=embeddings.EMBEDDING_DTYPE)
+        with self._gallery_lock:
+            self.known_face_encodings = quantized_gallery.append(self.known_face_encodings, face_encoding)
+            self.known_face_names = self.known_face_names + [name]
+            self.known_face_emails = self.known_face_emails + [email]
+            metrics.GALLERY_SIZE.set(len(self.known_face_encodings))
+        self.logger.info(f"Face registrada com sucesso: {name} ({email})")
+
     def remove_authorized_face(self, email: str) -> bool:
-        """Remove uma face autorizada"""
-        try:
-            encoding_file = os.path.join(self.authorized_faces_dir, f"{email}_encoding.json")
-            if os.path.exists(encoding_file):
-                os.remove(encoding_file)
-                self.load_authorized_faces()  # Recarregar faces
-                return True
-            return False
-        except Exception as e:
-            self.logger.error(f"Erro ao remover face: {e}")
-            return False
\ No newline at end of file
+        """Remove uma face autorizada da galeria em memória (o banco é atualizado por quem chama)"""
+        with self._gallery_lock:
+            keep = [index for index, known_email in enumerate(self.known_face_emails) if known_email != email]
+            if len(keep) == len(self.known_face_emails):
+                return False
+            self.known_face_encodings = self.known_face_encodings[keep]
+            self.known_face_names = [self.known_face_names[index] for index in keep]
+            self.known_face_emails = [self.known_face_emails[index] for index in keep]
+            metrics.GALLERY_SIZE.set(len(self.known_face_encodings))
+        return True
@@ -0,0 +1,173 @@
+"""
+Estado por conexão do envio contínuo de frames (WebSocket /access/stream).
+
+O quiosque manda frames JPEG em sequência; o servidor guarda só o mais
+recente (os que chegam enquanto um reconhecimento está em andamento
+substituem o anterior e contam como descartados) e ignora frames velhos.
+Uma miniatura do último frame processado serve de referência de movimento:
+se a cena não mudou e a última decisão ainda vale, o frame não é
+reconhecido de novo. A trilha acompanha a pessoa diante da câmera para que
+uma mesma passagem gere um único registro de acesso.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import config
+import metrics
+from face_recognition_module import RecognitionResult
+
+
+# Resolução da miniatura usada como referência de movimento
+MOTION_THUMBNAIL_SIZE = (32, 24)
+
+# Só decisões finais são reaproveitadas enquanto a cena não muda
+FINAL_STATUSES = ("granted", "denied", "no_face")
+
+
+@dataclass
+class FaceTrack:
+    """Pessoa acompanhada entre frames consecutivos"""
+    user_name: Optional[str] = None
+    granted: bool = False
+    denied_frames: int = 0
+    last_seen: float = 0.0
+
+
+class FrameSession:
+    def __init__(self, max_frame_age: float = config.STREAM_MAX_FRAME_AGE,
+                 motion_threshold: float = config.STREAM_MOTION_THRESHOLD,
+                 result_ttl: float = config.STREAM_RESULT_TTL,
+                 deny_frames: int = config.STREAM_DENY_FRAMES,
+                 track_timeout: float = config.STREAM_TRACK_TIMEOUT,
+                 count_frame: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            count_frame: contabiliza cada frame pelo resultado (padrão: métrica
+                do WebSocket; os pipelines de câmera usam a sua)
+        """
+        self.count_frame = count_frame or (lambda result: metrics.STREAM_FRAMES.labels(result).inc())
+        self.max_frame_age = max_frame_age
+        self.motion_threshold = motion_threshold
+        self.result_ttl = result_ttl
+        self.deny_frames = max(1, deny_frames)
+        self.track_timeout = track_timeout
+
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.last_result: Optional[RecognitionResult] = None
+        self.last_status: Optional[str] = None
+        self.last_result_at = 0.0
+        self.track = FaceTrack()
+
+        self._pending: Optional[Tuple[int, bytes, float]] = None
+        self._baseline: Optional[np.ndarray] = None
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def submit(self, data: bytes):
+        """Guarda o frame recebido, substituindo o que ainda não foi processado"""
+        self.received += 1
+        self.count_frame("received")
+        if self._pending is not None:
+            self._drop()
+        self._pending = (self.received, data, time.monotonic())
+        self._ready.set()
+
+    async def next_frame(self) -> Optional[Tuple[int, bytes]]:
+        """Espera o próximo frame ainda atual; None quando a conexão é encerrada"""
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            if self._closed:
+                return None
+            if self._pending is None:
+                continue
+            number, data, received_at = self._pending
+            self._pending = None
+            if time.monotonic() - received_at > self.max_frame_age:
+                self._drop()
+                continue
+            return number, data
+
+    def close(self):
+        self._closed = True
+        self._ready.set()
+
+    def _drop(self):
+        self.dropped += 1
+        self.count_frame("dropped")
+
+    def unchanged(self, image: np.ndarray) -> bool:
+        """
+        Compara o frame (BGR) com a referência de movimento; a cena é considerada
+        a mesma se a diferença média ficar abaixo do limite e a última decisão
+        for final e ainda estiver valendo
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.resize(gray, MOTION_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        if (self._baseline is not None and self.last_status in FINAL_STATUSES
+                and time.monotonic() - self.last_result_at <= self.result_ttl
+                and float(cv2.absdiff(thumbnail, self._baseline).mean()) < self.motion_threshold):
+            self.skipped += 1
+            self.count_frame("unchanged")
+            return True
+        self._baseline = thumbnail
+        return False
+
+    def update(self, result: RecognitionResult) -> str:
+        """
+        Atualiza a trilha com o resultado de um frame e devolve o status a enviar:
+
+        - "retake": frame reprovado no controle de qualidade;
+        - "no_face": ninguém diante da câmera;
+        - "granted": acesso liberado (o registro só é feito na primeira vez da trilha);
+        - "pending": face não reconhecida, aguardando mais frames;
+        - "denied": face não reconhecida em deny_frames frames seguidos.
+        """
+        now = time.monotonic()
+        self.processed += 1
+        self.last_result = result
+        self.last_result_at = now
+        self.count_frame("processed")
+        self.last_status = self._track(result, now)
+        return self.last_status
+
+    def _track(self, result: RecognitionResult, now: float) -> str:
+        if result.quality_reason:
+            return "retake"
+
+        if not result.faces:
+            if now - self.track.last_seen > self.track_timeout:
+                self.track = FaceTrack()
+            return "no_face"
+
+        if result.access_granted and result.user_name != self.track.user_name:
+            self.track = FaceTrack(user_name=result.user_name)
+        self.track.last_seen = now
+
+        if result.access_granted:
+            return "granted"
+
+        self.track.denied_frames += 1
+        if self.track.denied_frames >= self.deny_frames:
+            self.track.denied_frames = 0
+            return "denied"
+        return "pending"
+
+    def first_grant(self) -> bool:
+        """Marca a trilha como liberada; True apenas na primeira liberação"""
+        if self.track.granted:
+            return False
+        self.track.granted = True
+        return True
+
+    def stats(self) -> dict:
+        return {"received": self.received, "processed": self.processed,
+                "dropped": self.dropped, "unchanged": self.skipped}
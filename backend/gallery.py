@@ -0,0 +1,92 @@
+"""
+Gerações da galeria de encodings.
+
+Cada reconstrução (tools.rebuild_gallery) grava os encodings de uma geração
+nova em um diretório próprio, que serve de checkpoint para retomar uma
+execução interrompida. A galeria em uso fica no banco (ver embeddings.py);
+ao publicar, a geração é copiada para AuthorizedUser.face_embedding em uma
+única transação.
+
+    data/galleries/<geração>/manifest.json       estado, assinatura do pipeline, contagens
+    data/galleries/<geração>/<email>_encoding.json
+    data/galleries/<geração>/failures.jsonl      usuários cujas fotos não geraram encoding
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import List, Optional
+
+
+MANIFEST_FILE = "manifest.json"
+FAILURES_FILE = "failures.jsonl"
+ENCODING_SUFFIX = "_encoding.json"
+
+BUILDING = "building"
+READY = "ready"
+PUBLISHED = "published"
+
+
+def new_generation_id() -> str:
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+def generation_dir(root: str, generation: str) -> str:
+    return os.path.join(root, generation)
+
+
+def encoding_path(directory: str, email: str) -> str:
+    return os.path.join(directory, f"{email}{ENCODING_SUFFIX}")
+
+
+def read_json(path: str, default=None):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json_atomic(path: str, data):
+    """Grava em um arquivo temporário e troca de uma vez (leitores nunca veem o arquivo pela metade)"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def write_encoding(directory: str, email: str, name: str, encoding: list, image_path: Optional[str]):
+    write_json_atomic(encoding_path(directory, email), {
+        "name": name,
+        "email": email,
+        "encoding": encoding,
+        "image_path": image_path,
+        "created_at": datetime.now().isoformat(),
+    })
+
+
+def read_manifest(root: str, generation: str) -> dict:
+    return read_json(os.path.join(generation_dir(root, generation), MANIFEST_FILE), {})
+
+
+def write_manifest(root: str, generation: str, manifest: dict):
+    write_json_atomic(os.path.join(generation_dir(root, generation), MANIFEST_FILE), manifest)
+
+
+def list_generations(root: str) -> List[str]:
+    """Gerações existentes, da mais antiga para a mais recente"""
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if os.path.isfile(os.path.join(root, name, MANIFEST_FILE)))
+
+
+def prune(root: str, keep: int) -> List[str]:
+    """Remove as gerações concluídas mais antigas, mantendo as keep mais recentes"""
+    finished = [generation for generation in list_generations(root)
+                if read_manifest(root, generation).get("status") in (READY, PUBLISHED)]
+    removed = []
+    for generation in finished[:max(0, len(finished) - keep)]:
+        shutil.rmtree(generation_dir(root, generation), ignore_errors=True)
+        removed.append(generation)
+    return removed
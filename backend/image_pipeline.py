@@ -0,0 +1,270 @@
+import cv2
+import io
+import numpy as np
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+from PIL import Image
+
+import config
+
+
+# Flags de decodificação reduzida do OpenCV (a orientação EXIF é aplicada por nós)
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+# Kernel do filtro SMOOTH do Pillow, usado pelo ImageEnhance.Sharpness
+SMOOTH_KERNEL = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13.0
+
+
+@dataclass
+class PreprocessingConfig:
+    """Parâmetros do pipeline de pré-processamento"""
+    contrast: float = config.PREPROCESS_CONTRAST
+    sharpness: float = config.PREPROCESS_SHARPNESS
+    clahe: bool = config.PREPROCESS_CLAHE
+    clahe_clip_limit: float = config.PREPROCESS_CLAHE_CLIP_LIMIT
+    clahe_tile_size: int = config.PREPROCESS_CLAHE_TILE_SIZE
+    max_side: int = config.PREPROCESS_MAX_SIDE
+
+
+class PreprocessingPipeline:
+    """
+    Pipeline de pré-processamento que trabalha direto em RGB.
+
+    A imagem é convertida de BGR para RGB uma única vez e todas as etapas
+    seguintes (contraste via LUT, nitidez via unsharp mask e CLAHE opcional)
+    são aplicadas no mesmo buffer, sem passar pelo PIL. O resultado equivale
+    ao antigo enhance_image_quality (ImageEnhance.Contrast + Sharpness).
+    """
+
+    def __init__(self, preprocessing_config: Optional[PreprocessingConfig] = None):
+        self.config = preprocessing_config or PreprocessingConfig()
+        self._clahe = None
+        if self.config.clahe:
+            tile = max(1, self.config.clahe_tile_size)
+            self._clahe = cv2.createCLAHE(clipLimit=self.config.clahe_clip_limit, tileGridSize=(tile, tile))
+
+    def run(self, image: np.ndarray, color: str = "bgr", inplace: bool = False,
+            contrast_mean: Optional[int] = None) -> Tuple[np.ndarray, Dict[str, float]]:
+        """
+        Executa o pipeline sobre a imagem.
+
+        Args:
+            image: imagem de entrada (uint8, 3 canais)
+            color: ordem de canais da entrada ("bgr" ou "rgb")
+            inplace: permite reaproveitar o buffer de entrada
+            contrast_mean: média de luminância a usar no contraste (ex.: a da foto
+                inteira quando a entrada é apenas o recorte da face)
+
+        Returns:
+            Tuple[np.ndarray, Dict[str, float]]: (imagem RGB, tempos por etapa em segundos)
+        """
+        timings = {}
+
+        # Redimensionar primeiro para que as demais etapas trabalhem em menos pixels
+        start = time.perf_counter()
+        resized = self._resize(image)
+        if resized is not image:
+            inplace = True
+        image = resized
+        timings["resize"] = time.perf_counter() - start
+
+        # Única conversão de cor; é também a única cópia quando inplace=False
+        start = time.perf_counter()
+        if color == "bgr":
+            rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image if inplace else None)
+        else:
+            rgb = image if inplace else image.copy()
+        timings["color"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self._apply_contrast(rgb, contrast_mean)
+        timings["contrast"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self._apply_sharpness(rgb)
+        timings["sharpness"] = time.perf_counter() - start
+
+        if self._clahe is not None:
+            start = time.perf_counter()
+            self._apply_clahe(rgb)
+            timings["clahe"] = time.perf_counter() - start
+
+        return rgb, timings
+
+    def _resize(self, image: np.ndarray) -> np.ndarray:
+        """Reduz a imagem para que o maior lado não passe de max_side"""
+        max_side = self.config.max_side
+        height, width = image.shape[:2]
+        if max_side <= 0 or max(height, width) <= max_side:
+            return image
+        scale = max_side / float(max(height, width))
+        size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def luminance_mean(image: np.ndarray, color: str = "bgr") -> int:
+        """Média de luminância (L do Pillow) sem converter a imagem para cinza"""
+        channel_means = cv2.mean(image)[:3]
+        if color == "bgr":
+            channel_means = channel_means[::-1]
+        mean_r, mean_g, mean_b = channel_means
+        return int(0.299 * mean_r + 0.587 * mean_g + 0.114 * mean_b + 0.5)
+
+    def _apply_contrast(self, rgb: np.ndarray, mean: Optional[int] = None):
+        """Contraste em torno da média de luminância, como ImageEnhance.Contrast"""
+        factor = self.config.contrast
+        if factor == 1.0:
+            return
+        if mean is None:
+            mean = self.luminance_mean(rgb, color="rgb")
+        lut = np.clip(mean + factor * (np.arange(256, dtype=np.float32) - mean), 0, 255).astype(np.uint8)
+        cv2.LUT(rgb, lut, dst=rgb)
+
+    def _apply_sharpness(self, rgb: np.ndarray):
+        """Unsharp mask com o kernel SMOOTH, como ImageEnhance.Sharpness"""
+        factor = self.config.sharpness
+        if factor == 1.0:
+            return
+        smooth = cv2.filter2D(rgb, -1, SMOOTH_KERNEL, borderType=cv2.BORDER_REPLICATE)
+        cv2.addWeighted(rgb, factor, smooth, 1.0 - factor, 0, dst=rgb)
+
+    def _apply_clahe(self, rgb: np.ndarray):
+        """Equalização adaptativa (CLAHE) apenas no canal de luminância"""
+        lab = cv2.cvtColor(rgb, cv2.COLOR_RGB2LAB)
+        lab[:, :, 0] = self._clahe.apply(np.ascontiguousarray(lab[:, :, 0]))
+        cv2.cvtColor(lab, cv2.COLOR_LAB2RGB, dst=rgb)
+
+
+@dataclass
+class DecodedImage:
+    """Imagem decodificada e sua versão reduzida usada na detecção"""
+    image: np.ndarray  # BGR, resolução usada para os recortes de face
+    detection_image: np.ndarray  # BGR reduzida para a detecção
+    detection_scale: float  # pixels da detecção / pixels de image
+    original_size: Tuple[int, int]  # (largura, altura) do arquivo original
+    reduction: int = 1  # fator IMREAD_REDUCED_* usado na decodificação
+    orientation: int = 1  # orientação EXIF aplicada
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def read_image_header(data: bytes) -> Tuple[Optional[int], Optional[int], int]:
+    """
+    Lê dimensões e orientação EXIF sem decodificar os pixels
+
+    Returns:
+        Tuple[Optional[int], Optional[int], int]: (largura, altura, orientação)
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as pil_image:
+            width, height = pil_image.size
+            orientation = pil_image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+            return width, height, orientation if orientation in range(1, 9) else 1
+    except Exception:
+        return None, None, 1
+
+
+def apply_orientation(image: np.ndarray, orientation: int) -> np.ndarray:
+    """Aplica a orientação EXIF com transposições exatas (sem interpolação)"""
+    if orientation == 2:
+        return cv2.flip(image, 1)
+    if orientation == 3:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(image, 0)
+    if orientation == 5:
+        return cv2.transpose(image)
+    if orientation == 6:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(image), -1)
+    if orientation == 8:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+
+def detection_scale_for(width: int, height: int,
+                        target_face_size: int = config.DETECT_TARGET_FACE_SIZE,
+                        min_face_fraction: float = config.DETECT_MIN_FACE_FRACTION) -> float:
+    """Escala (<= 1) que leva a menor face esperada ao tamanho alvo da detecção"""
+    expected_face = min(width, height) * min_face_fraction
+    if expected_face <= 0:
+        return 1.0
+    return min(1.0, target_face_size / expected_face)
+
+
+def reduction_for(width: int, height: int,
+                  encode_min_face_size: int = config.ENCODE_MIN_FACE_SIZE,
+                  min_face_fraction: float = config.DETECT_MIN_FACE_FRACTION) -> int:
+    """Maior fator IMREAD_REDUCED_* que ainda mantém a face com resolução para o encoding"""
+    expected_face = min(width, height) * min_face_fraction
+    reduction = 1
+    for factor in (2, 4, 8):
+        if expected_face / factor >= encode_min_face_size:
+            reduction = factor
+    return reduction
+
+
+def downscale(image: np.ndarray, scale: float) -> np.ndarray:
+    """Reduz a imagem pela escala dada (não copia quando scale >= 1)"""
+    if scale >= 1.0:
+        return image
+    height, width = image.shape[:2]
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def prepare_image(image: np.ndarray, original_size: Optional[Tuple[int, int]] = None,
+                  reduction: int = 1, orientation: int = 1,
+                  timings: Optional[Dict[str, float]] = None,
+                  target_face_size: int = config.DETECT_TARGET_FACE_SIZE) -> DecodedImage:
+    """Monta o DecodedImage de um frame já decodificado (ex.: câmera)"""
+    timings = dict(timings or {})
+    start = time.perf_counter()
+    height, width = image.shape[:2]
+    scale = detection_scale_for(width, height, target_face_size)
+    detection_image = downscale(image, scale)
+    timings["downscale"] = time.perf_counter() - start
+    return DecodedImage(
+        image=image,
+        detection_image=detection_image,
+        detection_scale=detection_image.shape[1] / float(width),
+        original_size=original_size or (width, height),
+        reduction=reduction,
+        orientation=orientation,
+        timings=timings,
+    )
+
+
+def decode_image(data: bytes, target_face_size: int = config.DETECT_TARGET_FACE_SIZE) -> Optional[DecodedImage]:
+    """
+    Decodifica um upload na menor resolução que ainda serve ao reconhecimento.
+
+    As dimensões são lidas do cabeçalho para escolher um IMREAD_REDUCED_*
+    (decodificação direta em 1/2, 1/4 ou 1/8 no JPEG) e a orientação EXIF é
+    aplicada para que fotos de celular cheguem em pé à detecção.
+    target_face_size é o lado da menor face na imagem de detecção (varia com
+    o perfil de reconhecimento).
+    """
+    timings = {}
+    start = time.perf_counter()
+    width, height, orientation = read_image_header(data)
+    reduction = reduction_for(width, height) if width and height else 1
+    flags = REDUCED_DECODE_FLAGS[reduction] | cv2.IMREAD_IGNORE_ORIENTATION
+
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+    if image is None:
+        return None
+    image = apply_orientation(image, orientation)
+    timings["decode"] = time.perf_counter() - start
+
+    original_size = (width, height) if width and height else (image.shape[1], image.shape[0])
+    return prepare_image(image, original_size=original_size, reduction=reduction,
+                         orientation=orientation, timings=timings, target_face_size=target_face_size)
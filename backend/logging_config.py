@@ -1,21 +1,141 @@
+import json
 import logging
-import os 
+import os
+import queue
+import threading
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import config
+
+
+ACCESS_LOGGER_NAME = "access_attempts"
+
+# Campos fixos dos eventos de acesso no formato JSON
+ACCESS_EVENT_FIELDS = ("event", "user_name", "email", "access_granted", "confidence", "method", "success", "details")
+
+_listener = None
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler que nunca bloqueia quem está logando.
+
+    Com a fila cheia, registros abaixo de WARNING são descartados; avisos e
+    erros descartam o registro mais antigo da fila para entrar. Os descartes
+    são contados e informados assim que houver espaço.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Como o QueueHandler: a mensagem é montada aqui (os args podem mudar ou
+        # não ser serializáveis) e args, exc_info e exc_text saem da cópia
+        # enfileirada; a escrita e a rotação continuam na thread do listener
+        return super().prepare(record)
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.dropped:
+            self._report_dropped()
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        if record.levelno >= logging.WARNING:
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                self._count_dropped()
+            else:
+                self._count_dropped()  # o registro mais antigo foi descartado
+        else:
+            self._count_dropped()
+
+    def _count_dropped(self):
+        with self._lock:
+            self.dropped += 1
+
+    def _report_dropped(self) -> bool:
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        record = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                   "%d registros de log descartados (fila cheia)", (dropped,), None)
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += dropped
+            return False
+
+
+class _LogListener(QueueListener):
+    """QueueListener cujo sinal de parada espera espaço na fila em vez de falhar"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class LoggerNameFilter(logging.Filter):
+    """Aceita apenas registros de um logger (e seus filhos)"""
+
+    def __init__(self, name: str, include: bool = True):
+        super().__init__(name)
+        self.include = include
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return super().filter(record) == self.include
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON compacta por registro; eventos de acesso têm esquema fixo"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        event = getattr(record, "access_event", None)
+        if event is not None:
+            for field in ACCESS_EVENT_FIELDS:
+                data[field] = event.get(field)
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def setup_logging(json_format: bool = config.LOG_JSON, queue_size: int = config.LOG_QUEUE_SIZE,
+                  log_dir: str = config.LOG_DIR, console: bool = config.LOG_CONSOLE):
+    """
+    Configura o logging com fila: os loggers apenas enfileiram e uma thread
+    (QueueListener) faz a formatação, a escrita e a rotação dos arquivos.
+    """
+    global _listener
+    if _listener is not None:
+        return logging.getLogger(), logging.getLogger(ACCESS_LOGGER_NAME)
 
-def setup_logging():
     #Cria diretório de logs se não existir
-    log_dir = "logs"
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
 
     #configurar formato de log
-    log_format = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if json_format:
+        log_format = JsonFormatter()
+    else:
+        log_format = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 
     #Log principal da aplicação
     main_handler = RotatingFileHandler(
-        os.path.join(log_dir, 'access_control.log'), 
-        maxBytes=5*1024*1024, 
+        os.path.join(log_dir, 'access_control.log'),
+        maxBytes=5*1024*1024,
         backupCount=5)
     main_handler.setLevel(logging.INFO)
     main_handler.setFormatter(log_format)
@@ -23,85 +143,104 @@ def setup_logging():
 
     # Log especifico para tentativas de acesso
     access_handler = RotatingFileHandler(
-        os.path.join(log_dir, 'access_attempts.log'), 
-        maxBytes=5*1024*1024, 
+        os.path.join(log_dir, 'access_attempts.log'),
+        maxBytes=5*1024*1024,
         backupCount=10)
     access_handler.setLevel(logging.INFO)
     access_handler.setFormatter(log_format)
+    access_handler.addFilter(LoggerNameFilter(ACCESS_LOGGER_NAME))
 
     #Log especidifico para erros de sistema
     error_handler = RotatingFileHandler(
-        os.path.join(log_dir, 'error.log'), 
-        maxBytes=5*1024*1024, 
+        os.path.join(log_dir, 'error.log'),
+        maxBytes=5*1024*1024,
         backupCount=10)
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(log_format)
 
+    handlers = [main_handler, access_handler, error_handler]
 
-    # Configuração do logger principal
+    #Console handler
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(log_format)
+        handlers.append(console_handler)
+
+    # Cada registro passa uma única vez pela fila do logger raiz; o logger de
+    # acessos só propaga, e o filtro do access_handler separa as suas linhas
+    log_queue = queue.Queue(maxsize=queue_size)
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
-    logger.addHandler(main_handler)
-    logger.addHandler(access_handler)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(DroppingQueueHandler(log_queue))
 
     #Logger especifico para tentativas de acesso
-    access_logger = logging.getLogger("access_attemps")
+    access_logger = logging.getLogger(ACCESS_LOGGER_NAME)
     access_logger.setLevel(logging.INFO)
-    access_logger.addHandler(access_handler)
+    access_logger.propagate = True
 
-    #Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(log_format)
-    logger.addHandler(console_handler)
+    _listener = _LogListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
 
     return logger, access_logger
 
+
+def stop_logging():
+    """Esvazia a fila e encerra a thread de escrita (chamar no desligamento)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
 class AccessLogger:
 
     def __init__(self, access_logger):
         self.access_logger = access_logger
 
-    def log_access_attempt(self, user_name: str = None, access_granted: bool = False, 
+    def _log(self, level: int, message: str, **event):
+        self.access_logger.log(level, message, extra={"access_event": event})
+
+    def log_access_attempt(self, user_name: str = None, access_granted: bool = False,
                            confidence: float = 0.0, method: str = "camera"):
         #Registra tentativas de acesso
+        status = "GRANTED" if access_granted else "DENIED"
 
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        status = "GRANTED" if success else "DENIED"
-        
         if access_granted and user_name:
-            message = (f"{timestamp} - Access {status} for user '{user_name}' "
+            message = (f"Access {status} for user '{user_name}' "
                        f"with confidence {confidence:.2f} via {method}.")
         else:
-            message = (f"{timestamp} - Access {status} for unknown user "
+            message = (f"Access {status} for unknown user "
                        f"with confidence {confidence:.2f} via {method}.")
-            
-        if access_granted:
-            self.access_logger.info(message)
-        else:
-            self.access_logger.warning(message)
+
+        self._log(logging.INFO if access_granted else logging.WARNING, message,
+                  event="access_attempt", user_name=user_name, access_granted=bool(access_granted),
+                  confidence=round(float(confidence), 2), method=method)
+
+    def log_quality_rejection(self, reason: str, method: str = "camera"):
+        #Foto reprovada no controle de qualidade (não é uma tentativa de acesso)
+        message = f"Access RETAKE requested ({reason}) via {method}."
+        self._log(logging.INFO, message, event="quality_rejection", method=method, details=reason)
 
     def log_user_registration(self, user_name: str, email: str, success: bool):
         status = "SUCCESS" if success else "FAILURE"
         message = f"User registration {status} for '{user_name}' with email '{email}'."
-        if success:
-            self.access_logger.info(message)
-        else:
-            self.access_logger.error(message)
+        self._log(logging.INFO if success else logging.ERROR, message,
+                  event="user_registration", user_name=user_name, email=email, success=success)
 
     def log_user_removal(self, user_name: str, email: str, success: bool):
         status = "SUCCESS" if success else "FAILURE"
         message = f"User removal {status} for '{user_name}' with email '{email}'."
-        if success:
-            self.access_logger.info(message)
-        else:
-            self.access_logger.error(message)
+        self._log(logging.INFO if success else logging.ERROR, message,
+                  event="user_removal", user_name=user_name, email=email, success=success)
 
     def log_system_event(self, event: str, details: str = ""):
         message = f"System event: {event}. Details: {details}"
-        self.access_logger.info(message)
+        self._log(logging.INFO, message, event="system_event", details=f"{event}: {details}")
 
 
     def log_error(self, error_type: str, error_message: str):
         message = f"Error [{error_type}]: {error_message}"
-        self.access_logger.error(message)
+        self._log(logging.ERROR, message, event="error", details=f"{error_type}: {error_message}")
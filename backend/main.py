@@ -1,11 +1,14 @@
 import uvicorn
 from api import app
+from config import env_bool, env_int
 
 if __name__ == "__main__":
     uvicorn.run(
         "main:app", 
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        # reload recarrega modelos e galeria a cada alteração; use só em desenvolvimento
+        reload=env_bool("UVICORN_RELOAD", False),
+        workers=env_int("UVICORN_WORKERS", 1),
         log_level="info"
     )
\ No newline at end of file
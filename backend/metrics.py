@@ -0,0 +1,86 @@
+"""
+Métricas no formato Prometheus.
+
+Com vários workers do uvicorn, defina PROMETHEUS_MULTIPROC_DIR (um diretório
+vazio e gravável) antes de iniciar o servidor: cada processo grava suas
+métricas em arquivos mmap e o /metrics de qualquer worker agrega todos.
+"""
+import os
+from typing import Dict, Tuple
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+
+# Buckets pensados para o reconhecimento (de ~1ms a vários segundos)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_LATENCY = Histogram(
+    "face_recognition_stage_seconds",
+    "Duração de cada etapa do FaceRecognitionSystem",
+    ["operation", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Duração das requisições HTTP por rota",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+QUEUE_WAIT = Histogram(
+    "recognition_queue_wait_seconds",
+    "Tempo de espera na fila do pool de reconhecimento",
+    buckets=LATENCY_BUCKETS,
+)
+
+GALLERY_SIZE = Gauge("face_gallery_size", "Faces autorizadas carregadas na memória", multiprocess_mode="max")
+QUEUE_DEPTH = Gauge("recognition_queue_depth", "Reconhecimentos aguardando um worker", multiprocess_mode="livesum")
+IN_FLIGHT = Gauge("recognition_in_flight", "Reconhecimentos em execução", multiprocess_mode="livesum")
+CACHE_SIZE = Gauge("cache_entries", "Entradas em caches em memória", ["cache"], multiprocess_mode="livesum")
+
+ACCESS_DECISIONS = Counter("access_decisions_total", "Decisões de acesso", ["channel", "result"])
+LOCKOUTS = Counter("access_lockouts_total", "Bloqueios por excesso de tentativas falhas")
+ROTATION_STAGES = Counter("face_rotation_stages_total", "Rotações avaliadas no encoding", ["angle"])
+PROFILES_CAPTURED = Counter("recognition_profiles_total", "Perfis de reconhecimento gravados", ["trigger"])
+DETECTION_ANGLES = Counter("face_detection_angle_total", "Rotação em que as faces foram detectadas", ["angle"])
+STREAM_FRAMES = Counter("stream_frames_total", "Frames recebidos pelo WebSocket de acesso", ["result"])
+STREAM_CONNECTIONS = Gauge("stream_connections", "Conexões WebSocket de acesso abertas", multiprocess_mode="livesum")
+QUALITY_REJECTIONS = Counter("face_quality_rejections_total", "Faces reprovadas no controle de qualidade", ["reason"])
+CAMERA_FRAMES = Counter("camera_frames_total", "Frames das câmeras registradas por resultado", ["camera", "result"])
+CAMERA_LAG = Histogram(
+    "camera_decision_lag_seconds",
+    "Tempo entre a captura do frame e a decisão, por câmera",
+    ["camera"],
+    buckets=LATENCY_BUCKETS,
+)
+CAMERA_SCHEDULER_WAIT = Histogram(
+    "camera_scheduler_wait_seconds",
+    "Espera de cada câmera por uma vaga de reconhecimento",
+    ["camera"],
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_DECISIONS = Counter("admission_decisions_total", "Níveis do controle de admissão das verificações", ["level"])
+SNAPSHOTS = Counter("access_snapshots_total", "Imagens de tentativas de acesso por resultado", ["result"])
+ENCODING_CACHE = Counter("encoding_cache_total", "Consultas ao cache de encodings de cadastro", ["result"])
+REGISTRATION_JOBS = Counter("registration_jobs_total", "Tentativas de jobs de registro por resultado", ["result"])
+
+
+def observe_stages(operation: str, timings: Dict[str, float]):
+    """Registra no histograma os tempos por etapa de uma operação"""
+    for stage, seconds in timings.items():
+        STAGE_LATENCY.labels(operation, stage).observe(seconds)
+
+
+def render_latest() -> Tuple[bytes, str]:
+    """Gera o texto de exposição, agregando os processos em modo multiprocesso"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Remove os gauges 'live' de um worker encerrado (apenas em modo multiprocesso)"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
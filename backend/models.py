@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional, List
 from enum import Enum
@@ -33,6 +33,24 @@ class UserResponse(BaseModel):
         #orm_mode = True
 
 
+class RegistrationJobResponse(BaseModel):
+    id: str
+    name: str
+    email: str
+    access_level: AccessLevel
+    status: str  # queued, running, succeeded, failed
+    attempts: int
+    message: Optional[str] = None
+    retryable: bool = False
+    user_id: Optional[int] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 class UserUpdate(BaseModel):
     name: Optional[str] = None
     #email: Optional[str] = None
@@ -75,6 +93,10 @@ class AccessResponse(BaseModel):
     access_level: Optional[AccessLevel] = None
     locked: Optional[bool] = False
     lock_remaining_seconds: Optional[int] = None
+    retake: Optional[bool] = False  # foto reprovada no controle de qualidade; não conta como tentativa
+    quality_reason: Optional[str] = None
+    recognition_profile: Optional[str] = None  # perfil de reconhecimento usado (fast, balanced, accurate)
+    degradation: Optional[str] = None  # "reduced" ou "minimal" quando a carga barateou o pipeline (ver admission.py)
 
 
 class DocumentAccessResponse(BaseModel):
@@ -83,4 +105,36 @@ class DocumentAccessResponse(BaseModel):
     total_available: int
 
     class Config:
-        orm_mode= True
\ No newline at end of file
+        orm_mode= True
+
+class CameraCreate(BaseModel):
+    name: str
+    source: str  # índice USB ("0"), caminho de vídeo ou URL RTSP
+    enabled: bool = True
+    priority: int = Field(default=1, ge=1)  # peso no escalonador de reconhecimento
+    max_fps: Optional[float] = Field(default=None, gt=0)  # None = CAMERA_DEFAULT_MAX_FPS
+    profile: Optional[str] = None  # None = FACE_CAMERA_PROFILES ou o perfil padrão
+
+
+class CameraUpdate(BaseModel):
+    name: Optional[str] = None
+    source: Optional[str] = None
+    enabled: Optional[bool] = None
+    priority: Optional[int] = Field(default=None, ge=1)
+    max_fps: Optional[float] = Field(default=None, gt=0)
+    profile: Optional[str] = None
+
+
+class CameraResponse(BaseModel):
+    id: int
+    name: str
+    source: str
+    enabled: bool
+    priority: int
+    max_fps: Optional[float] = None
+    profile: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,254 @@
+"""
+Perfis sob demanda de reconhecimentos lentos.
+
+Duas formas de disparo:
+- amostragem (PROFILE_SAMPLE_RATE): a chamada inteira roda sob cProfile;
+- limite de latência (PROFILE_THRESHOLD_SECONDS): cada chamada apenas se
+  registra em um dicionário. Uma thread de vigia dorme até que alguma chamada
+  passe de PROFILE_ARM_FRACTION do limite e só então amostra a pilha dela;
+  se a chamada terminar acima do limite, as pilhas viram um perfil.
+
+Chamadas rápidas custam apenas o registro no dicionário. Os perfis ficam em
+um anel limitado em disco (PROFILE_DIR, no máximo PROFILE_MAX_FILES).
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as StackCounter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import config
+import metrics
+
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$")
+
+
+class _ActiveCall:
+    """Chamada em andamento acompanhada pela thread de vigia"""
+
+    def __init__(self, thread_id: int):
+        self.thread_id = thread_id
+        self.start = time.perf_counter()
+        self.samples = StackCounter()
+
+
+class RecognitionProfiler:
+    def __init__(self, directory: str = config.PROFILE_DIR,
+                 threshold_seconds: float = config.PROFILE_THRESHOLD_SECONDS,
+                 sample_rate: float = config.PROFILE_SAMPLE_RATE,
+                 max_profiles: int = config.PROFILE_MAX_FILES,
+                 sample_interval: float = config.PROFILE_SAMPLE_INTERVAL,
+                 arm_fraction: float = config.PROFILE_ARM_FRACTION,
+                 enabled: bool = config.PROFILE_ENABLED):
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.threshold_seconds = threshold_seconds
+        self.sample_rate = sample_rate
+        self.max_profiles = max(1, max_profiles)
+        self.sample_interval = sample_interval
+        self.arm_after = threshold_seconds * arm_fraction
+        self.enabled = enabled
+
+        self._active: Dict[int, _ActiveCall] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+        # O cProfile só pode estar ativo em uma chamada por vez
+        self._cprofile_lock = threading.Lock()
+
+    def run(self, func: Callable[..., Any], *args,
+            context: Optional[Callable[[Any], Dict[str, Any]]] = None, **kwargs) -> Any:
+        """
+        Executa func e grava um perfil se a amostragem disparar ou se passar do limite
+
+        Args:
+            context: função que recebe o resultado e devolve metadados do perfil
+                (dimensões da imagem, faces, rotações, tamanho da galeria...)
+        """
+        if not self.enabled:
+            return func(*args, **kwargs)
+
+        if self.sample_rate > 0 and random.random() < self.sample_rate and self._cprofile_lock.acquire(blocking=False):
+            try:
+                return self._run_cprofile(func, args, kwargs, context)
+            finally:
+                self._cprofile_lock.release()
+
+        return self._run_watched(func, args, kwargs, context)
+
+    def _run_cprofile(self, func, args, kwargs, context):
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Outra ferramenta de profiling já está ativa
+            return self._run_watched(func, args, kwargs, context)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - start
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(60)
+        self._save_async("sample", duration, result, context, {"format": "pstats", "report": stream.getvalue()},
+                         profiler)
+        return result
+
+    def _run_watched(self, func, args, kwargs, context):
+        call = _ActiveCall(threading.get_ident())
+        with self._lock:
+            idle = not self._active
+            self._active[call.thread_id] = call
+        self._ensure_watchdog()
+        if idle:
+            # Só a primeira chamada acorda a vigia; as seguintes armam depois da
+            # mais antiga, cujo prazo ela já está esperando
+            self._wakeup.set()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active.pop(call.thread_id, None)
+        duration = time.perf_counter() - call.start
+
+        if duration >= self.threshold_seconds:
+            stacks = [f"{stack} {count}" for stack, count in call.samples.most_common()]
+            self._save_async("threshold", duration, result, context, {
+                "format": "collapsed",
+                "sample_interval": self.sample_interval,
+                "sampled_after": self.arm_after,
+                "stacks": stacks,
+            })
+        return result
+
+    def _ensure_watchdog(self):
+        if self._watchdog is None:
+            with self._lock:
+                if self._watchdog is None:
+                    self._watchdog = threading.Thread(target=self._watch, name="profiler-watchdog", daemon=True)
+                    self._watchdog.start()
+
+    def _watch(self):
+        """Amostra a pilha apenas das chamadas que já passaram do tempo de armar"""
+        while True:
+            with self._lock:
+                calls = list(self._active.values())
+            if not calls:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            now = time.perf_counter()
+            due = [call for call in calls if now - call.start >= self.arm_after]
+            if not due:
+                next_due = min(call.start for call in calls) + self.arm_after
+                self._wakeup.wait(timeout=max(0.0, next_due - now))
+                self._wakeup.clear()
+                continue
+
+            frames = sys._current_frames()
+            for call in due:
+                frame = frames.get(call.thread_id)
+                if frame is not None:
+                    call.samples[self._collapse(frame)] += 1
+            del frames
+            time.sleep(self.sample_interval)
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        """Pilha no formato 'collapsed' (raiz;...;folha), compatível com flamegraph"""
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            filename = os.path.join(os.path.basename(os.path.dirname(code.co_filename)),
+                                    os.path.basename(code.co_filename))
+            parts.append(f"{filename}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+    def _save_async(self, trigger, duration, result, context, profile, profiler=None):
+        """Grava o perfil fora do caminho da requisição"""
+        try:
+            metadata = context(result) if context else {}
+        except Exception as e:
+            metadata = {"context_error": str(e)}
+        threading.Thread(
+            target=self._save, args=(trigger, duration, metadata, profile, profiler), daemon=True
+        ).start()
+
+    def _save(self, trigger, duration, metadata, profile, profiler):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profile_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            record = {
+                "id": profile_id,
+                "created_at": datetime.now().isoformat(),
+                "trigger": trigger,
+                "duration_seconds": duration,
+                "threshold_seconds": self.threshold_seconds,
+                "context": metadata,
+                "profile": profile,
+            }
+            if profiler is not None:
+                profiler.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+            temp_path = os.path.join(self.directory, f".{profile_id}.json.tmp")
+            with open(temp_path, "w") as f:
+                json.dump(record, f, default=str)
+            os.replace(temp_path, os.path.join(self.directory, f"{profile_id}.json"))
+            metrics.PROFILES_CAPTURED.labels(trigger).inc()
+            self.logger.warning(f"Reconhecimento lento ({duration:.2f}s, {trigger}): perfil {profile_id} gravado")
+            self._trim()
+        except Exception as e:
+            self.logger.error(f"Erro ao gravar perfil: {e}")
+
+    def _trim(self):
+        """Mantém apenas os max_profiles perfis mais recentes"""
+        for profile_id in self.list_ids()[self.max_profiles:]:
+            for extension in (".json", ".prof"):
+                path = os.path.join(self.directory, profile_id + extension)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def list_ids(self) -> List[str]:
+        """Ids dos perfis gravados, do mais recente para o mais antigo"""
+        if not os.path.isdir(self.directory):
+            return []
+        ids = [name[:-5] for name in os.listdir(self.directory) if name.endswith(".json")]
+        return sorted((i for i in ids if PROFILE_ID_PATTERN.match(i)), reverse=True)
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Metadados dos perfis gravados (sem o conteúdo do perfil)"""
+        profiles = []
+        for profile_id in self.list_ids():
+            try:
+                with open(os.path.join(self.directory, f"{profile_id}.json")) as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            record.pop("profile", None)
+            record["has_cprofile"] = os.path.exists(os.path.join(self.directory, f"{profile_id}.prof"))
+            profiles.append(record)
+        return profiles
+
+    def profile_path(self, profile_id: str, extension: str = ".json") -> Optional[str]:
+        """Caminho do arquivo de um perfil, ou None se o id for inválido ou não existir"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + extension)
+        return path if os.path.exists(path) else None
+
+
+profiler = RecognitionProfiler()
@@ -0,0 +1,249 @@
+"""
+Galeria quantizada para a primeira passada da comparação.
+
+Com milhões de cadastros, a matriz float32 ocupa gigabytes em cada worker e
+a varredura completa é limitada pela banda de memória. Com
+FACE_GALLERY_QUANTIZATION=float16 ou int8, cada worker guarda só os códigos
+quantizados (2 ou 1 byte por valor) e calcula com eles a distância
+aproximada para toda a galeria, em blocos:
+
+    |q - s·c|² = |q|² + s²|c|² - 2·s·(q·c)
+
+Os FACE_GALLERY_RERANK_K candidatos mais próximos são então comparados com
+os vetores float32 exatos, lidos de um arquivo mapeado em memória (mmap)
+compartilhado entre os workers: só as páginas dos candidatos são lidas, e o
+resultado final (índice e distância) é o mesmo da comparação exata sempre
+que o melhor cadastro está entre os candidatos.
+
+No int8 a escala é por vetor (FACE_GALLERY_QUANT_SCALE=vector, padrão) ou
+única para a galeria (global). A galeria é imutável: cadastro e remoção
+criam outra instância que compartilha o mmap, com os vetores novos em
+memória até a próxima carga.
+"""
+import hashlib
+import logging
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import config
+from embeddings import EMBEDDING_DTYPE, EMBEDDING_SIZE
+
+
+MODES = ("none", "float16", "int8")
+SCALES = ("vector", "global")
+
+# Linhas da galeria convertidas para float32 de cada vez na varredura aproximada
+SCAN_BLOCK_ROWS = 16384
+
+EXACT_SUFFIX = ".f32"
+
+logger = logging.getLogger(__name__)
+
+
+def quantize(encodings: np.ndarray, mode: str, scale: str = "vector") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns:
+        (códigos float16/int8, escala por vetor (float32); 1.0 no float16)
+    """
+    encodings = np.asarray(encodings, dtype=np.float32)
+    if mode == "float16":
+        return encodings.astype(np.float16), np.ones(len(encodings), dtype=np.float32)
+    if mode != "int8":
+        raise ValueError(f"Quantização desconhecida: {mode} (disponíveis: float16, int8)")
+    if scale == "global":
+        peak = float(np.abs(encodings).max()) if encodings.size else 1.0
+        scales = np.full(len(encodings), (peak or 1.0) / 127.0, dtype=np.float32)
+    else:
+        peaks = np.abs(encodings).max(axis=1) if encodings.size else np.empty(0, dtype=np.float32)
+        scales = (np.where(peaks > 0, peaks, 1.0) / 127.0).astype(np.float32)
+    codes = np.clip(np.rint(encodings / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def exact_file(encodings: np.ndarray, directory: str, keep: int = config.GALLERY_KEEP_GENERATIONS) -> str:
+    """
+    Grava os vetores float32 em <directory>/<hash>.f32 (se ainda não existir) e
+    apaga os arquivos mais antigos além de keep; workers com a mesma galeria
+    usam o mesmo arquivo
+    """
+    data = np.ascontiguousarray(encodings, dtype=EMBEDDING_DTYPE)
+    name = hashlib.sha1(memoryview(data).cast("B")).hexdigest()[:16] + EXACT_SUFFIX
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        data.tofile(temp_path)
+        os.replace(temp_path, path)
+
+    # Um arquivo apagado continua válido para quem já o mapeou
+    files = sorted((os.path.join(directory, file) for file in os.listdir(directory) if file.endswith(EXACT_SUFFIX)),
+                   key=os.path.getmtime, reverse=True)
+    for old in files[max(1, keep):]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    return path
+
+
+class QuantizedGallery:
+    """Códigos quantizados em memória + vetores exatos no mmap (ou em memória, para os cadastrados depois)"""
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray, exact: np.ndarray, rows: np.ndarray,
+                 extra: np.ndarray, mode: str, scale: str, rerank_k: int, norms: Optional[np.ndarray] = None):
+        self.codes = codes
+        self.scales = scales
+        self.norms = norms if norms is not None else self._norms(codes, scales)  # s²|c|² de cada vetor
+        self.exact = exact  # np.memmap (n, 128) float32
+        self.rows = rows  # posição na galeria -> linha em exact (>= len(exact): linha em extra)
+        self.extra = extra
+        self.mode = mode
+        self.scale = scale
+        self.rerank_k = max(1, rerank_k)
+
+    @staticmethod
+    def _norms(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        norms = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+        return norms * scales ** 2
+
+    @classmethod
+    def build(cls, encodings: np.ndarray, mode: str = config.GALLERY_QUANTIZATION,
+              scale: str = config.GALLERY_QUANT_SCALE, rerank_k: int = config.GALLERY_RERANK_K,
+              directory: str = config.GALLERY_EXACT_DIR) -> "QuantizedGallery":
+        encodings = np.asarray(encodings, dtype=EMBEDDING_DTYPE).reshape(-1, EMBEDDING_SIZE)
+        codes, scales = quantize(encodings, mode, scale)
+        if len(encodings):
+            exact = np.memmap(exact_file(encodings, directory), dtype=EMBEDDING_DTYPE, mode="r",
+                              shape=encodings.shape)
+        else:
+            exact = np.empty((0, EMBEDDING_SIZE), dtype=EMBEDDING_DTYPE)
+        rows = np.arange(len(encodings), dtype=np.int32)
+        return cls(codes, scales, exact, rows, np.empty((0, EMBEDDING_SIZE), EMBEDDING_DTYPE), mode, scale, rerank_k)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, keep: Sequence[int]) -> "QuantizedGallery":
+        """Subconjunto (remoção de um cadastro), sem reler o mmap"""
+        keep = np.asarray(keep, dtype=np.int64)
+        return QuantizedGallery(self.codes[keep], self.scales[keep], self.exact, self.rows[keep], self.extra,
+                                self.mode, self.scale, self.rerank_k, self.norms[keep])
+
+    def nbytes(self) -> int:
+        """Memória própria do worker (códigos, escalas, normas e vetores fora do mmap)"""
+        return self.codes.nbytes + self.scales.nbytes + self.norms.nbytes + self.rows.nbytes + self.extra.nbytes
+
+    def append(self, encoding: np.ndarray) -> "QuantizedGallery":
+        """Galeria com mais um cadastro; o vetor exato fica em memória até a próxima carga"""
+        encoding = np.asarray(encoding, dtype=EMBEDDING_DTYPE).reshape(1, EMBEDDING_SIZE)
+        if self.mode == "int8" and self.scale == "global" and len(self.scales):
+            # Mantém a escala da galeria (valores fora dela são saturados)
+            codes = np.clip(np.rint(encoding / self.scales[0]), -127, 127).astype(np.int8)
+            scales = self.scales[:1].copy()
+        else:
+            codes, scales = quantize(encoding, self.mode, self.scale)
+        return QuantizedGallery(
+            np.concatenate([self.codes, codes]), np.concatenate([self.scales, scales]), self.exact,
+            np.append(self.rows, len(self.exact) + len(self.extra)), np.concatenate([self.extra, encoding]),
+            self.mode, self.scale, self.rerank_k, np.concatenate([self.norms, self._norms(codes, scales)]),
+        )
+
+    def exact_vectors(self, positions: np.ndarray) -> np.ndarray:
+        """Vetores float32 exatos das posições pedidas (só essas páginas do mmap são lidas)"""
+        rows = self.rows[positions]
+        vectors = np.empty((len(rows), EMBEDDING_SIZE), dtype=np.float32)
+        mapped = rows < len(self.exact)
+        if mapped.any():
+            order = np.argsort(rows[mapped])
+            selected = np.flatnonzero(mapped)[order]
+            vectors[selected] = self.exact[rows[mapped][order]]
+        if not mapped.all():
+            vectors[~mapped] = self.extra[rows[~mapped] - len(self.exact)]
+        return vectors
+
+    def candidates(self, queries: np.ndarray, k: int) -> np.ndarray:
+        """
+        Posições dos k cadastros mais próximos de cada encoding pela distância
+        aproximada (k, len(queries)); a galeria é percorrida em blocos e só os
+        k melhores de cada bloco são guardados
+        """
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        positions, values = [], []
+        for start in range(0, len(self.codes), SCAN_BLOCK_ROWS):
+            block = self.codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            squared = block @ queries.T
+            squared *= -2.0 * self.scales[start:start + len(block), None]
+            squared += self.norms[start:start + len(block), None] + query_norms
+            if len(block) > k:
+                best = np.argpartition(squared, k - 1, axis=0)[:k]
+                squared = np.take_along_axis(squared, best, axis=0)
+            else:
+                best = np.broadcast_to(np.arange(len(block))[:, None], squared.shape)
+            positions.append(best + start)
+            values.append(squared)
+        positions, values = np.concatenate(positions), np.concatenate(values)
+        if len(positions) > k:
+            best = np.argpartition(values, k - 1, axis=0)[:k]
+            positions = np.take_along_axis(positions, best, axis=0)
+        return positions
+
+    def nearest(self, queries: np.ndarray) -> List[Tuple[int, float]]:
+        """
+        Cadastro mais próximo de cada encoding: varredura aproximada, re-rank
+        exato dos rerank_k melhores
+
+        Returns:
+            [(posição na galeria, distância euclidiana exata)] por encoding
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, EMBEDDING_SIZE)
+        if not len(self.codes):
+            return []
+        candidates = self.candidates(queries, min(self.rerank_k, len(self.codes)))
+        results = []
+        for column, query in enumerate(queries):
+            distances = np.linalg.norm(self.exact_vectors(candidates[:, column]) - query, axis=1)
+            best = int(np.argmin(distances))
+            results.append((int(candidates[best, column]), float(distances[best])))
+        return results
+
+
+def build_gallery(encodings: np.ndarray, mode: str = config.GALLERY_QUANTIZATION):
+    """Matriz float32 (sem quantização) ou QuantizedGallery, conforme FACE_GALLERY_QUANTIZATION"""
+    if mode not in MODES:
+        logger.warning(f"FACE_GALLERY_QUANTIZATION={mode} desconhecido; usando a galeria float32")
+        mode = "none"
+    if mode == "none" or not len(encodings):
+        return encodings
+    scale = config.GALLERY_QUANT_SCALE if config.GALLERY_QUANT_SCALE in SCALES else "vector"
+    gallery = QuantizedGallery.build(encodings, mode, scale)
+    logger.info(f"Galeria quantizada ({mode}, escala {gallery.scale}): {gallery.nbytes() / 2**20:.1f} MiB "
+                f"em memória, {np.asarray(encodings).nbytes / 2**20:.1f} MiB em float32 no mmap")
+    return gallery
+
+
+def nearest(known, queries: np.ndarray) -> List[Tuple[int, float]]:
+    """Cadastro mais próximo de cada encoding, na galeria float32 ou na quantizada"""
+    if isinstance(known, QuantizedGallery):
+        return known.nearest(queries)
+    if not len(known):
+        return []
+    results = []
+    for query in np.atleast_2d(queries):
+        distances = np.linalg.norm(known - query, axis=1)
+        best = int(np.argmin(distances))
+        results.append((best, float(distances[best])))
+    return results
+
+
+def append(known, encoding: np.ndarray):
+    """Galeria com mais um encoding (cria outra; quem está lendo a anterior não é afetado)"""
+    if isinstance(known, QuantizedGallery):
+        return known.append(encoding)
+    return np.vstack([known, np.asarray(encoding, dtype=EMBEDDING_DTYPE).reshape(1, EMBEDDING_SIZE)])
@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+import config
+
+
+class StartupState:
+    """
+    Acompanha as fases da inicialização para o endpoint /ready.
+
+    A API aceita conexões assim que é importada; modelos e galeria carregam
+    em segundo plano e só então o worker passa a ser considerado pronto. Uma
+    fase que falha é repetida com espera crescente, sem refazer as anteriores.
+    """
+
+    def __init__(self, import_budget: float = config.IMPORT_BUDGET_SECONDS,
+                 startup_budget: float = config.STARTUP_BUDGET_SECONDS,
+                 retry_delay: float = config.WARMUP_RETRY_SECONDS,
+                 max_retry_delay: float = config.WARMUP_RETRY_MAX_SECONDS):
+        self.logger = logging.getLogger(__name__)
+        self.import_budget = import_budget
+        self.startup_budget = startup_budget
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.process_started = time.perf_counter()  # substituído pelo mark_started() no startup
+        self.import_seconds = None
+        self.startup_seconds = None
+        self.phases: Dict[str, Dict[str, object]] = {}
+        self.ready = False
+        self.stopping = False
+        self.error = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def mark_started(self):
+        """Marca o início da inicialização (hook de startup), base do startup_seconds"""
+        self.process_started = time.perf_counter()
+
+    def mark_imported(self, seconds: float):
+        """Registra o tempo de import do módulo da API e compara com o orçamento"""
+        self.import_seconds = seconds
+        if seconds > self.import_budget:
+            self.logger.warning(f"Import da API levou {seconds:.2f}s (orçamento: {self.import_budget:.2f}s)")
+        else:
+            self.logger.info(f"Import da API em {seconds:.2f}s")
+
+    def run_phases(self, phases: List[Tuple[str, Callable[[], object]]], retry: bool = False):
+        """
+        Executa as fases em ordem; uma falha deixa o worker como não pronto.
+
+        Com retry, a fase que falhou é repetida (espera de retry_delay, dobrando
+        até max_retry_delay) até passar ou o desligamento começar.
+        """
+        for name, _ in phases:
+            self.phases.setdefault(name, {"status": "pending", "seconds": None})
+
+        for name, func in phases:
+            delay = self.retry_delay
+            while not self._run_phase(name, func):
+                if not retry:
+                    return
+                self.logger.warning(f"Repetindo a fase '{name}' em {delay:.1f}s")
+                if self._stopped.wait(delay):
+                    return
+                delay = min(delay * 2, self.max_retry_delay)
+
+        self.error = None
+        self.startup_seconds = time.perf_counter() - self.process_started
+        self.ready = True
+        if self.startup_seconds > self.startup_budget:
+            self.logger.warning(
+                f"Inicialização levou {self.startup_seconds:.2f}s (orçamento: {self.startup_budget:.2f}s)"
+            )
+        else:
+            self.logger.info(f"Sistema pronto em {self.startup_seconds:.2f}s")
+
+    def _run_phase(self, name: str, func: Callable[[], object]) -> bool:
+        with self._lock:
+            self.phases[name] = {"status": "running", "seconds": None}
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            with self._lock:
+                self.phases[name] = {"status": "failed", "seconds": time.perf_counter() - start}
+                self.error = f"{name}: {e}"
+            self.logger.error(f"Falha na fase de inicialização '{name}': {e}")
+            return False
+        with self._lock:
+            self.phases[name] = {"status": "done", "seconds": time.perf_counter() - start}
+        self.logger.info(f"Fase '{name}' concluída em {time.perf_counter() - start:.2f}s")
+        return True
+
+    def start_background(self, phases: List[Tuple[str, Callable[[], object]]]) -> threading.Thread:
+        """Executa as fases (repetindo as que falharem) em uma thread para não atrasar o bind da API"""
+        for name, _ in phases:
+            self.phases.setdefault(name, {"status": "pending", "seconds": None})
+        thread = threading.Thread(target=self.run_phases, args=(phases, True), name="warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def mark_stopping(self):
+        """Deixa de aceitar tráfego novo durante o desligamento (rolling restart)"""
+        self.stopping = True
+        self._stopped.set()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.ready and not self.stopping
+
+    def snapshot(self) -> Dict[str, object]:
+        """Estado atual para o /ready"""
+        with self._lock:
+            phases = {name: dict(info) for name, info in self.phases.items()}
+        done = sum(1 for info in phases.values() if info["status"] == "done")
+        return {
+            "ready": self.is_ready,
+            "stopping": self.stopping,
+            "progress": done / len(phases) if phases else 0.0,
+            "phases": phases,
+            "error": self.error,
+            "import_seconds": self.import_seconds,
+            "import_budget_seconds": self.import_budget,
+            "startup_seconds": self.startup_seconds,
+            "startup_budget_seconds": self.startup_budget,
+            "uptime_seconds": time.perf_counter() - self.process_started,
+            "timestamp": datetime.now(),
+        }
@@ -0,0 +1,94 @@
+"""
+Perfis de reconhecimento nomeados.
+
+Cada porta pede um equilíbrio diferente entre velocidade e precisão: a
+catraca da recepção quer resposta rápida, a sala de servidores quer menos
+falsos aceites. Um perfil agrupa os parâmetros do reconhecimento que podem
+mudar por requisição sem invalidar a galeria (detector, upsample do HOG,
+rotações, num_jitters, tamanho alvo da detecção, melhoria de imagem e
+limiares). Campos None usam a configuração do sistema (config.py), de modo
+que "balanced" é exatamente o comportamento padrão.
+
+O cadastro e a reconstrução da galeria sempre usam a configuração do
+sistema: o perfil só muda como as tentativas de acesso são processadas.
+
+O perfil vem, em ordem: do parâmetro da requisição, do mapa por câmera
+(FACE_CAMERA_PROFILES) ou de FACE_RECOGNITION_PROFILE.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import config
+
+
+@dataclass(frozen=True)
+class RecognitionProfile:
+    """Parâmetros do reconhecimento de uma tentativa de acesso (None = configuração do sistema)"""
+    name: str
+    detect_method: Optional[str] = None  # "cascade" ou "hog"
+    proposal_detector: Optional[str] = None  # "haar" ou "hog" na passada barata da cascata
+    hog_upsample: Optional[int] = None
+    rotation_angles: Optional[List[int]] = None
+    num_jitters: int = 1  # reamostragens da face por encoding (mais lento, encoding mais estável)
+    detect_target_face_size: Optional[int] = None  # lado da menor face na imagem de detecção (px)
+    enhance: bool = True  # contraste/nitidez/CLAHE antes da detecção e do encoding
+    tolerance: Optional[float] = None
+    min_confidence: Optional[float] = None
+
+
+PROFILES: Dict[str, RecognitionProfile] = {
+    profile.name: profile for profile in (
+        # Uma passada: propostas Haar, sem upsample, sem rotações e sem melhoria de imagem
+        RecognitionProfile(
+            name="fast",
+            detect_method="cascade",
+            proposal_detector="haar",
+            hog_upsample=0,
+            rotation_angles=[0],
+            detect_target_face_size=80,
+            enhance=False,
+        ),
+        RecognitionProfile(name="balanced"),
+        # HOG na imagem toda em resolução maior, todas as rotações, encoding com jitter e limiar mais rígido
+        RecognitionProfile(
+            name="accurate",
+            detect_method="hog",
+            hog_upsample=1,
+            rotation_angles=[0, -15, 15, -30, 30],
+            num_jitters=2,
+            detect_target_face_size=150,
+            tolerance=0.5,
+            min_confidence=65.0,
+        ),
+    )
+}
+
+
+def parse_camera_profiles(value: str) -> Dict[str, str]:
+    """"camera:perfil,camera:perfil" -> {camera: perfil}"""
+    mapping = {}
+    for item in value.split(","):
+        camera, _, profile = item.partition(":")
+        if camera.strip() and profile.strip():
+            mapping[camera.strip()] = profile.strip()
+    return mapping
+
+
+CAMERA_PROFILES = parse_camera_profiles(config.CAMERA_PROFILES)
+
+
+def get_profile(name: str) -> RecognitionProfile:
+    """Perfil pelo nome; ValueError se não existir"""
+    profile = PROFILES.get(name)
+    if profile is None:
+        raise ValueError(f"Perfil de reconhecimento desconhecido: {name} (disponíveis: {', '.join(PROFILES)})")
+    return profile
+
+
+def resolve_profile(name: Optional[str] = None, camera: Optional[str] = None) -> RecognitionProfile:
+    """Perfil pedido na requisição, senão o da câmera, senão o padrão"""
+    if name:
+        return get_profile(name)
+    if camera is not None and str(camera) in CAMERA_PROFILES:
+        return get_profile(CAMERA_PROFILES[str(camera)])
+    return get_profile(config.RECOGNITION_PROFILE)
@@ -0,0 +1,290 @@
+"""
+Cadastro assíncrono de usuários.
+
+O POST /users/register grava a foto em REGISTRATION_UPLOAD_DIR, cria um
+RegistrationJob no banco e responde na hora com o id do job; o encoding roda
+no pool de reconhecimento. Falhas inesperadas (disco, dlib, banco) são
+repetidas com espera crescente; fotos recusadas (sem face, face duplicada)
+falham de vez. Como o estado fica no banco, jobs interrompidos por um
+restart voltam para a fila na inicialização, e fotos sem job ativo são
+apagadas pela limpeza periódica.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+import config
+import embeddings
+import metrics
+from database import AuthorizedUser, RegistrationJob, SessionLocal
+
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+TERMINAL_STATUSES = (SUCCEEDED, FAILED)
+
+# Valor devolvido por process() quando a tentativa deve ser repetida
+RETRY = "retry"
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class RegistrationJobRunner:
+    def __init__(self, face_system, pool, upload_dir: str = config.REGISTRATION_UPLOAD_DIR,
+                 max_attempts: int = config.REGISTRATION_MAX_ATTEMPTS,
+                 retry_delay: float = config.REGISTRATION_RETRY_DELAY_SECONDS,
+                 orphan_ttl: float = config.REGISTRATION_ORPHAN_TTL_SECONDS):
+        self.logger = logging.getLogger(__name__)
+        self.face_system = face_system
+        self.pool = pool
+        self.upload_dir = upload_dir
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.orphan_ttl = orphan_ttl
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def store_upload(self, job_id: str, data: bytes) -> str:
+        """Grava a foto recebida (escrita atômica) e devolve o caminho"""
+        os.makedirs(self.upload_dir, exist_ok=True)
+        path = os.path.join(self.upload_dir, f"{job_id}.jpg")
+        temp_path = f"{path}.part"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return path
+
+    def submit(self, job_id: str):
+        """Agenda o job no event loop (sem efeito se ele já estiver agendado)"""
+        task = self._tasks.get(job_id)
+        if task is not None and not task.done():
+            return
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id: str):
+        while True:
+            try:
+                status, attempts = await self.pool.run(self.process, job_id)
+            except Exception as e:
+                # pool encerrado no desligamento: o job continua no banco e volta no próximo start
+                self.logger.warning(f"Job de registro {job_id} interrompido: {e}")
+                return
+            if status != RETRY:
+                return
+            await asyncio.sleep(self.retry_delay * attempts)
+
+    def process(self, job_id: str) -> Tuple[Optional[str], int]:
+        """
+        Executa uma tentativa do job (em uma thread do pool)
+
+        Returns:
+            (status final, RETRY se deve ser repetido ou None se o job não existe, tentativas)
+        """
+        db = SessionLocal()
+        try:
+            job = db.get(RegistrationJob, job_id)
+            if job is None:
+                return None, 0
+            if job.status in TERMINAL_STATUSES:
+                return job.status, job.attempts
+
+            job.status = RUNNING
+            job.attempts += 1
+            job.updated_at = utcnow()
+            db.commit()
+
+            try:
+                success, message, face_encoding = self.face_system.register_face(
+                    job.upload_path, job.name, job.email, raise_errors=True
+                )
+                if success:
+                    return self._succeed(db, job, message, face_encoding), job.attempts
+            except IntegrityError:
+                # Outro cadastro com o mesmo email foi gravado antes: repetir não adianta
+                db.rollback()
+                return self._fail(db, job, "Email já cadastrado", retryable=False), job.attempts
+            except Exception as e:
+                db.rollback()
+                return self._retry_or_fail(db, job, str(e)), job.attempts
+
+            return self._fail(db, job, message, retryable=False), job.attempts
+        finally:
+            db.close()
+
+    def _succeed(self, db, job: RegistrationJob, message: str, face_encoding) -> str:
+        os.makedirs(self.face_system.authorized_faces_dir, exist_ok=True)
+        final_image_path = os.path.join(self.face_system.authorized_faces_dir,
+                                        f"{job.email}_{datetime.now().timestamp()}.jpg")
+        db_user = AuthorizedUser(
+            name=job.name,
+            email=job.email,
+            face_embedding=embeddings.to_blob(face_encoding),
+            embedding_version=self.face_system.pipeline_version(),
+            embedding_updated_at=utcnow(),
+            image_path=final_image_path,
+            access_level=job.access_level,
+        )
+        db.add(db_user)
+        db.flush()
+        upload_path = job.upload_path
+
+        job.status = SUCCEEDED
+        job.message = message
+        job.retryable = False
+        job.user_id = db_user.id
+        job.upload_path = None
+        job.updated_at = job.finished_at = utcnow()
+        db.commit()
+
+        # Só depois do commit: se ele falhar, a foto continua no lugar para a próxima tentativa
+        # e a galeria em memória não ganha uma face sem cadastro no banco
+        try:
+            os.replace(upload_path, final_image_path)
+        except OSError as e:
+            self.logger.error(f"Não foi possível mover a foto do job {job.id} para {final_image_path}: {e}")
+        self.face_system.add_authorized_face(job.name, job.email, face_encoding)
+
+        metrics.REGISTRATION_JOBS.labels(SUCCEEDED).inc()
+        self.logger.info(f"Usuário registrado: {job.name} ({job.email}) [job {job.id}]")
+        return SUCCEEDED
+
+    def _retry_or_fail(self, db, job: RegistrationJob, error: str) -> str:
+        job = db.get(RegistrationJob, job.id)
+        if job.attempts < self.max_attempts:
+            job.status = QUEUED
+            job.message = f"Tentativa {job.attempts} falhou: {error}"
+            job.updated_at = utcnow()
+            db.commit()
+            metrics.REGISTRATION_JOBS.labels(RETRY).inc()
+            self.logger.warning(f"Job de registro {job.id} será repetido: {error}")
+            return RETRY
+        # A foto é mantida para um novo envio via /retry (até a limpeza por idade)
+        return self._fail(db, job, f"Erro interno: {error}", retryable=True)
+
+    def _fail(self, db, job: RegistrationJob, message: str, retryable: bool) -> str:
+        if not retryable:
+            self._remove_file(job.upload_path)
+            job.upload_path = None
+        job.status = FAILED
+        job.message = message
+        job.retryable = retryable
+        job.updated_at = job.finished_at = utcnow()
+        db.commit()
+
+        metrics.REGISTRATION_JOBS.labels(FAILED).inc()
+        self.logger.warning(f"Job de registro {job.id} falhou ({job.email}): {message}")
+        return FAILED
+
+    def retry(self, db, job: RegistrationJob) -> RegistrationJob:
+        """Reenfileira um job que falhou por erro temporário"""
+        job.status = QUEUED
+        job.attempts = 0
+        job.retryable = False
+        job.message = None
+        job.updated_at = utcnow()
+        job.finished_at = None
+        db.commit()
+        self.submit(job.id)
+        return job
+
+    def resume(self) -> int:
+        """Reenfileira os jobs ativos deixados por um processo anterior"""
+        db = SessionLocal()
+        try:
+            job_ids = [job_id for (job_id,) in
+                       db.query(RegistrationJob.id).filter(RegistrationJob.status.in_(ACTIVE_STATUSES)).all()]
+        finally:
+            db.close()
+        for job_id in job_ids:
+            self.submit(job_id)
+        if job_ids:
+            self.logger.info(f"{len(job_ids)} job(s) de registro retomado(s)")
+        return len(job_ids)
+
+    async def resume_when_ready(self, startup_state, poll_interval: float = 0.5):
+        """Espera o warm-up terminar (modelos e galeria) antes de retomar os jobs"""
+        while not startup_state.is_ready:
+            if startup_state.error or startup_state.stopping:
+                return
+            await asyncio.sleep(poll_interval)
+        self.resume()
+
+    def cleanup_orphans(self) -> int:
+        """
+        Apaga fotos que não serão mais usadas:
+
+        - uploads sem job ativo (job concluído, removido ou nunca gravado) mais
+          antigos que orphan_ttl;
+        - uploads de jobs com falha mais antigos que orphan_ttl;
+        - temp_*.jpg do cadastro síncrono antigo em authorized_faces.
+        """
+        now = time.time()
+        removed = 0
+        db = SessionLocal()
+        try:
+            keep = {os.path.abspath(path) for (path, status, finished_at) in
+                    db.query(RegistrationJob.upload_path, RegistrationJob.status, RegistrationJob.finished_at)
+                    .filter(RegistrationJob.upload_path.isnot(None)).all()
+                    if status in ACTIVE_STATUSES or not self._expired(finished_at)}
+        finally:
+            db.close()
+
+        if os.path.isdir(self.upload_dir):
+            for filename in os.listdir(self.upload_dir):
+                path = os.path.abspath(os.path.join(self.upload_dir, filename))
+                if path in keep:
+                    continue
+                # Arquivo recente pode ser uma gravação em andamento ou um upload cujo job ainda não foi gravado
+                try:
+                    if now - os.path.getmtime(path) < self.orphan_ttl:
+                        continue
+                except FileNotFoundError:
+                    continue
+                removed += self._remove_file(path)
+
+        faces_dir = self.face_system.authorized_faces_dir
+        if os.path.isdir(faces_dir):
+            for filename in os.listdir(faces_dir):
+                path = os.path.join(faces_dir, filename)
+                if filename.startswith("temp_") and now - os.path.getmtime(path) > self.orphan_ttl:
+                    removed += self._remove_file(path)
+
+        if removed:
+            self.logger.info(f"Limpeza de cadastro: {removed} arquivo(s) órfão(s) removido(s)")
+        return removed
+
+    async def cleanup_periodically(self, interval: float = config.REGISTRATION_CLEANUP_INTERVAL_SECONDS):
+        while True:
+            try:
+                await asyncio.to_thread(self.cleanup_orphans)
+            except Exception as e:
+                self.logger.error(f"Erro na limpeza de arquivos de cadastro: {e}")
+            await asyncio.sleep(interval)
+
+    def _expired(self, finished_at: Optional[datetime]) -> bool:
+        if finished_at is None:
+            return False
+        if finished_at.tzinfo is None:
+            finished_at = finished_at.replace(tzinfo=timezone.utc)  # o SQLite não guarda o fuso
+        return (utcnow() - finished_at).total_seconds() > self.orphan_ttl
+
+    def _remove_file(self, path: Optional[str]) -> int:
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+                return 1
+            except OSError as e:
+                self.logger.warning(f"Não foi possível remover {path}: {e}")
+        return 0
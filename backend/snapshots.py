@@ -0,0 +1,315 @@
+"""
+Imagens das tentativas de acesso (evidência para auditoria).
+
+A verificação de acesso só entrega a imagem já decodificada (e as caixas das
+faces) a uma fila; uma thread própria recorta a região das faces (ou mantém
+o frame inteiro, SNAPSHOT_CROP=frame), reduz o maior lado para
+SNAPSHOT_MAX_SIDE, recodifica em JPEG com SNAPSHOT_JPEG_QUALITY e grava em
+SNAPSHOT_DIR/AAAA/MM/DD/<id do registro>.jpg, preenchendo
+AccessLog.image_path em lote. Com a fila cheia a imagem é descartada (e
+contada em access_snapshots_total): a verificação nunca espera pelo disco.
+
+SNAPSHOT_MODE escolhe o que guardar: denied (padrão, só negações), all ou
+off. O SnapshotSweeper apaga os dias mais velhos que SNAPSHOT_RETENTION_DAYS
+e, acima de SNAPSHOT_MAX_MB, as imagens mais antigas; os registros dessas
+imagens ficam com image_path vazio.
+"""
+import asyncio
+import logging
+import os
+import queue
+import shutil
+import threading
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+import config
+import metrics
+from database import AccessLog, SessionLocal
+
+
+MODES = ("off", "denied", "all")
+
+# Registros atualizados por transação (a fila é esvaziada em lotes)
+WRITE_BATCH = 32
+
+# Caminhos por UPDATE ao limpar image_path das imagens apagadas
+CLEAR_CHUNK = 500
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Snapshot:
+    log_id: int
+    image: np.ndarray  # BGR (decoded.image)
+    boxes: List[Tuple[int, int, int, int]] = field(default_factory=list)  # (x, y, w, h) das faces em image
+    taken_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+def crop_faces(image: np.ndarray, boxes: Sequence[Tuple[int, int, int, int]], padding: float) -> np.ndarray:
+    """Região que contém todas as faces, com margem de padding (fração da face); sem faces, a imagem toda"""
+    if not boxes:
+        return image
+    height, width = image.shape[:2]
+    margin = int(max(max(w, h) for _, _, w, h in boxes) * padding)
+    left = max(0, min(x for x, _, _, _ in boxes) - margin)
+    top = max(0, min(y for _, y, _, _ in boxes) - margin)
+    right = min(width, max(x + w for x, _, w, _ in boxes) + margin)
+    bottom = min(height, max(y + h for _, y, _, h in boxes) + margin)
+    if right <= left or bottom <= top:
+        return image
+    return image[top:bottom, left:right]
+
+
+def encode_snapshot(image: np.ndarray, max_side: int, quality: int) -> bytes:
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width) if max_side > 0 else 1.0
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("falha ao codificar a imagem")
+    return buffer.tobytes()
+
+
+def day_dir(directory: str, day: date) -> str:
+    return os.path.join(directory, f"{day.year:04d}", f"{day.month:02d}", f"{day.day:02d}")
+
+
+class SnapshotWriter:
+    """Fila limitada + thread que grava as imagens e preenche AccessLog.image_path"""
+
+    def __init__(self, directory: str = config.SNAPSHOT_DIR, mode: str = config.SNAPSHOT_MODE,
+                 crop: str = config.SNAPSHOT_CROP, crop_padding: float = config.SNAPSHOT_CROP_PADDING,
+                 max_side: int = config.SNAPSHOT_MAX_SIDE, quality: int = config.SNAPSHOT_JPEG_QUALITY,
+                 queue_size: int = config.SNAPSHOT_QUEUE_SIZE):
+        if mode not in MODES:
+            logger.warning(f"SNAPSHOT_MODE={mode} desconhecido; usando denied")
+            mode = "denied"
+        self.directory = directory
+        self.mode = mode
+        self.crop = crop
+        self.crop_padding = crop_padding
+        self.max_side = max_side
+        self.quality = quality
+        self._queue: "queue.Queue[Optional[Snapshot]]" = queue.Queue(maxsize=max(1, queue_size))
+        self._thread: Optional[threading.Thread] = None
+
+    def wants(self, access_granted: bool) -> bool:
+        return self.mode == "all" or (self.mode == "denied" and not access_granted)
+
+    def start(self):
+        """Inicia a thread de escrita (chamado no startup, não no import: os workers do pool importam a API)"""
+        if self._thread is None and self.mode != "off":
+            self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Grava o que ainda está na fila e encerra a thread"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, log_id: int, access_granted: bool, image: Optional[np.ndarray],
+               boxes: Sequence[Tuple[int, int, int, int]] = ()) -> bool:
+        """Enfileira a imagem de um registro de acesso sem bloquear; False se não for guardada"""
+        if image is None or self._thread is None or not self.wants(access_granted):
+            return False
+        try:
+            self._queue.put_nowait(Snapshot(log_id, image, list(boxes)))
+            return True
+        except queue.Full:
+            metrics.SNAPSHOTS.labels("dropped").inc()
+            return False
+
+    def path_for(self, snapshot: Snapshot) -> str:
+        return os.path.join(day_dir(self.directory, snapshot.taken_at.date()), f"{snapshot.log_id}.jpg")
+
+    def write(self, snapshot: Snapshot) -> str:
+        image = snapshot.image
+        if self.crop == "face":
+            image = crop_faces(image, snapshot.boxes, self.crop_padding)
+        data = encode_snapshot(image, self.max_side, self.quality)
+        path = self.path_for(snapshot)
+        temp_path = f"{path}.part"
+        for attempt in range(2):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                break
+            except FileNotFoundError:
+                # O sweeper removeu o diretório (vazio) entre o makedirs e o open
+                if attempt:
+                    raise
+        os.replace(temp_path, path)
+        return path
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [snapshot for snapshot in batch if snapshot is not None]
+
+            written = []
+            for snapshot in batch:
+                try:
+                    written.append({"id": snapshot.log_id, "image_path": self.write(snapshot)})
+                except Exception as e:
+                    metrics.SNAPSHOTS.labels("failed").inc()
+                    logger.error(f"Erro ao gravar a imagem do acesso {snapshot.log_id}: {e}")
+            if not written:
+                continue
+            db = SessionLocal()
+            try:
+                db.bulk_update_mappings(AccessLog, written)
+                db.commit()
+                metrics.SNAPSHOTS.labels("written").inc(len(written))
+            except Exception as e:
+                db.rollback()
+                metrics.SNAPSHOTS.labels("failed").inc(len(written))
+                logger.error(f"Erro ao registrar {len(written)} imagens de acesso: {e}")
+            finally:
+                db.close()
+
+
+class SnapshotSweeper:
+    """Retenção por dia e cota de disco das imagens de acesso"""
+
+    def __init__(self, directory: str = config.SNAPSHOT_DIR, retention_days: int = config.SNAPSHOT_RETENTION_DAYS,
+                 max_bytes: int = config.SNAPSHOT_MAX_MB * 2**20):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+
+    def days(self) -> List[Tuple[date, str]]:
+        """Diretórios de dia existentes, do mais antigo ao mais novo"""
+        found = []
+        for year in self._numbered(self.directory):
+            for month in self._numbered(os.path.join(self.directory, year)):
+                for day in self._numbered(os.path.join(self.directory, year, month)):
+                    try:
+                        found.append((date(int(year), int(month), int(day)),
+                                      os.path.join(self.directory, year, month, day)))
+                    except ValueError:
+                        continue
+        return sorted(found)
+
+    @staticmethod
+    def _numbered(path: str) -> List[str]:
+        try:
+            return [entry.name for entry in os.scandir(path) if entry.is_dir() and entry.name.isdigit()]
+        except FileNotFoundError:
+            return []
+
+    def sweep(self, today: Optional[date] = None) -> dict:
+        """Apaga os dias vencidos e, acima da cota, as imagens mais antigas; devolve o que foi removido"""
+        today = today or datetime.now(timezone.utc).date()
+        removed = {"days": 0, "files": 0, "bytes": 0}
+        days = self.days()
+
+        if self.retention_days > 0:
+            cutoff = today - timedelta(days=self.retention_days)
+            for day, path in [entry for entry in days if entry[0] < cutoff]:
+                files = self._files(path)
+                shutil.rmtree(path, ignore_errors=True)
+                self._clear_prefix(path + os.sep)
+                removed["days"] += 1
+                removed["files"] += len(files)
+                removed["bytes"] += sum(size for _, size, _ in files)
+                metrics.SNAPSHOTS.labels("expired").inc(len(files))
+            days = [entry for entry in days if entry[0] >= cutoff]
+
+        if self.max_bytes > 0:
+            listing = [(path, self._files(path)) for _, path in days]
+            total = sum(size for _, files in listing for _, size, _ in files)
+            evicted = []
+            for _, files in listing:
+                for file_path, size, _ in sorted(files, key=lambda file: file[2]):
+                    if total <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(file_path)
+                    except OSError:
+                        continue
+                    total -= size
+                    removed["bytes"] += size
+                    evicted.append(file_path)
+                if total <= self.max_bytes:
+                    break
+            if evicted:
+                self._clear_paths(evicted)
+                removed["files"] += len(evicted)
+                metrics.SNAPSHOTS.labels("evicted").inc(len(evicted))
+
+        self._remove_empty_dirs(today)
+        if removed["files"]:
+            logger.info(f"Imagens de acesso removidas: {removed['files']} arquivos "
+                        f"({removed['bytes'] / 2**20:.1f} MiB, {removed['days']} dias vencidos)")
+        return removed
+
+    @staticmethod
+    def _files(path: str) -> List[Tuple[str, int, float]]:
+        """(caminho, bytes, mtime) das imagens de um dia"""
+        files = []
+        try:
+            for entry in os.scandir(path):
+                if entry.is_file() and entry.name.endswith(".jpg"):
+                    stat = entry.stat()
+                    files.append((entry.path, stat.st_size, stat.st_mtime))
+        except FileNotFoundError:
+            pass
+        return files
+
+    def _clear_prefix(self, prefix: str):
+        db = SessionLocal()
+        try:
+            db.query(AccessLog).filter(AccessLog.image_path.startswith(prefix, autoescape=True)) \
+                .update({AccessLog.image_path: None}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _clear_paths(self, paths: List[str]):
+        db = SessionLocal()
+        try:
+            for start in range(0, len(paths), CLEAR_CHUNK):
+                db.query(AccessLog).filter(AccessLog.image_path.in_(paths[start:start + CLEAR_CHUNK])) \
+                    .update({AccessLog.image_path: None}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _remove_empty_dirs(self, today: date):
+        # O diretório do dia (e os do ano e mês) é onde o gravador está escrevendo agora
+        current = day_dir(self.directory, today)
+        keep = {self.directory, current, os.path.dirname(current), os.path.dirname(os.path.dirname(current))}
+        for root, _, _ in sorted(os.walk(self.directory), key=lambda item: -len(item[0])):
+            if root not in keep:
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+
+    async def sweep_periodically(self, interval: float = config.SNAPSHOT_SWEEP_INTERVAL_SECONDS):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Erro na limpeza das imagens de acesso: {e}")
+            await asyncio.sleep(interval)
@@ -0,0 +1 @@
+"""Ferramentas de linha de comando do backend. Execute a partir de backend/ com python -m tools.<nome>."""
@@ -0,0 +1,35 @@
+"""
+Recalcula os agregados de acesso do dashboard (access_rollup_hourly e
+access_rollup_daily) a partir da tabela access_logs.
+
+A API já mantém os agregados a cada registro e os preenche sozinha na
+primeira inicialização; use esta ferramenta para corrigir um período
+(registros importados ou apagados direto no banco). O recálculo é feito um
+dia por transação e pode rodar com a API no ar.
+
+Uso (a partir de backend/):
+    python -m tools.backfill_analytics
+    python -m tools.backfill_analytics --since 2025-01-01
+"""
+import argparse
+import time
+from datetime import datetime
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--since", type=datetime.fromisoformat,
+                        help="recalcula só a partir desta data (UTC, ex.: 2025-01-01)")
+    args = parser.parse_args()
+
+    import analytics
+    from database import init_database
+
+    init_database()
+    start = time.perf_counter()
+    counted = analytics.backfill(args.since)
+    print(f"{counted} registros agregados em {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Gerador de carga para a API de controle de acesso.
+
+Modelo de chegada aberto: as requisições são disparadas nos instantes
+sorteados, independentemente das respostas, e a latência é contada a partir
+do instante planejado (inclui a espera por concorrência no cliente, evitando
+a "omissão coordenada").
+
+Modelos de chegada:
+    poisson  - chegadas de Poisson na taxa --rate
+    bursty   - taxa base com picos de troca de turno (--burst-factor durante
+               --burst-seconds a cada --burst-period)
+    replay   - instantes reais da tabela access_logs (--replay-db), acelerados
+               por --speedup
+
+Por padrão a API roda no mesmo processo (cliente ASGI, banco temporário, sem
+serviços externos); use --url para apontar para um servidor.
+
+Exemplos (a partir de backend/):
+    python -m tools.loadgen --rates 1,2,4,8 --duration 30 --images fotos/
+    python -m tools.loadgen --model bursty --rates 5 --mix check=0.7,documents=0.2,stats=0.1
+    python -m tools.loadgen --model replay --replay-db data/access_control.db --speedup 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.common import encode_jpeg, environment_info, load_images, summarize, synthetic_image
+
+
+LOAD_USER_EMAIL = "loadgen@example.com"
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Converte 'check=0.8,documents=0.1,stats=0.1' em pesos normalizados"""
+    weights = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - {"check", "documents", "stats"}
+    if unknown:
+        raise SystemExit(f"Tipos de requisição desconhecidos: {', '.join(sorted(unknown))}")
+    total = sum(weights.values())
+    return {name: weight / total for name, weight in weights.items()}
+
+
+def poisson_schedule(rate: float, duration: float, rng: random.Random) -> List[float]:
+    """Instantes de chegada de um processo de Poisson"""
+    times, t = [], 0.0
+    while rate > 0:
+        t += rng.expovariate(rate)
+        if t >= duration:
+            break
+        times.append(t)
+    return times
+
+
+def bursty_schedule(rate: float, duration: float, rng: random.Random, burst_factor: float,
+                    burst_seconds: float, burst_period: float) -> List[float]:
+    """Poisson não homogêneo: taxa multiplicada durante as janelas de troca de turno"""
+    peak = rate * burst_factor
+    times, t = [], 0.0
+    # Thinning: sorteia na taxa de pico e aceita proporcionalmente à taxa do instante
+    while peak > 0:
+        t += rng.expovariate(peak)
+        if t >= duration:
+            break
+        in_burst = (t % burst_period) < burst_seconds
+        if in_burst or rng.random() < rate / peak:
+            times.append(t)
+    return times
+
+
+def replay_schedule(db_path: str, speedup: float, duration: Optional[float]) -> List[Tuple[float, str]]:
+    """Instantes e tipos das tentativas gravadas em access_logs"""
+    connection = sqlite3.connect(db_path)
+    try:
+        rows = connection.execute(
+            "SELECT timestamp, access_type FROM access_logs WHERE timestamp IS NOT NULL ORDER BY timestamp"
+        ).fetchall()
+    finally:
+        connection.close()
+    if not rows:
+        raise SystemExit(f"Nenhum registro em access_logs de {db_path}")
+
+    first = datetime.fromisoformat(str(rows[0][0]))
+    schedule = []
+    for timestamp, access_type in rows:
+        offset = (datetime.fromisoformat(str(timestamp)) - first).total_seconds() / speedup
+        if duration is not None and offset >= duration:
+            break
+        kind = "documents" if access_type in ("document_access", "document_download") else "check"
+        schedule.append((offset, kind))
+    return schedule
+
+
+class LoadTarget:
+    """Cliente HTTP para um servidor remoto ou para a API no mesmo processo"""
+
+    def __init__(self, url: Optional[str], images: List[bytes], user_email: str, register: bool):
+        self.url = url
+        self.images = images
+        self.user_email = user_email
+        self.register = register
+        self.client = None
+
+    async def __aenter__(self):
+        import httpx
+
+        if self.url:
+            self.client = httpx.AsyncClient(base_url=self.url.rstrip("/"), timeout=60.0)
+        else:
+            self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=self._local_app()),
+                                            base_url="http://loadgen", timeout=60.0)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    def _local_app(self):
+        """Sobe a API em um diretório temporário, com um usuário para /documents"""
+        os.chdir(tempfile.mkdtemp(prefix="loadgen_"))
+        os.makedirs("data/authorized_faces", exist_ok=True)
+        import api
+        from database import AuthorizedUser, SessionLocal
+        from embeddings import to_blob
+
+        api.init_database()
+        api.run_warm_up()
+        encoding = None
+        if self.register:
+            image_path = os.path.abspath("data/authorized_faces/loadgen.jpg")
+            with open(image_path, "wb") as f:
+                f.write(self.images[0])
+            success, message, encoding = api.face_system.register_face(image_path, "Carga", self.user_email)
+            if success:
+                api.face_system.add_authorized_face("Carga", self.user_email, encoding)
+            print(f"Cadastro da face de teste: {message}")
+
+        db = SessionLocal()
+        try:
+            db.add(AuthorizedUser(name="Carga", email=self.user_email, access_level="TOTAL",
+                                  face_embedding=to_blob(encoding) if encoding is not None else None))
+            db.commit()
+        finally:
+            db.close()
+        return api.app
+
+    async def request(self, kind: str, index: int):
+        if kind == "check":
+            image = self.images[index % len(self.images)]
+            return await self.client.post("/access/check", files={"image": ("probe.jpg", image, "image/jpeg")})
+        if kind == "documents":
+            return await self.client.get("/documents", params={"user_email": self.user_email})
+        return await self.client.get("/stats")
+
+
+async def run_step(target: LoadTarget, schedule: List[Tuple[float, str]], concurrency: int) -> Dict[str, object]:
+    """Dispara o cronograma e coleta latência e status de cada requisição"""
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def fire(index: int, offset: float, kind: str):
+        await asyncio.sleep(max(0.0, start + offset - loop.time()))
+        planned = start + offset
+        async with semaphore:
+            sent = loop.time()
+            try:
+                response = await target.request(kind, index)
+                status = response.status_code
+            except Exception:
+                status = 0
+            done = loop.time()
+        samples.append({"kind": kind, "status": status, "latency": done - planned, "service": done - sent,
+                        "done": done - start})
+
+    await asyncio.gather(*(fire(i, offset, kind) for i, (offset, kind) in enumerate(schedule)))
+    elapsed = max([s["done"] for s in samples] + [schedule[-1][0] if schedule else 0.0, 1e-9])
+    return summarize_step(samples, schedule, elapsed)
+
+
+def summarize_step(samples: List[dict], schedule: List[Tuple[float, str]], elapsed: float) -> Dict[str, object]:
+    """Percentis por tipo de requisição, taxas de erro/429 e vazão obtida"""
+    span = schedule[-1][0] if schedule else 0.0
+    report = {
+        "offered_rate": len(schedule) / span if span > 0 else 0.0,
+        "achieved_rate": sum(1 for s in samples if 200 <= s["status"] < 300) / elapsed,
+        "requests": len(samples),
+        "error_rate": sum(1 for s in samples if s["status"] == 0 or s["status"] >= 500) / max(1, len(samples)),
+        "rate_429": sum(1 for s in samples if s["status"] == 429) / max(1, len(samples)),
+        "by_kind": {},
+    }
+    for kind in sorted({s["kind"] for s in samples}):
+        of_kind = [s for s in samples if s["kind"] == kind]
+        stats = summarize([s["latency"] for s in of_kind])
+        stats["service_p50_ms"] = summarize([s["service"] for s in of_kind]).get("p50_ms", 0.0)
+        stats["status"] = {str(code): sum(1 for s in of_kind if s["status"] == code)
+                           for code in sorted({s["status"] for s in of_kind})}
+        report["by_kind"][kind] = stats
+    return report
+
+
+def find_saturation(steps: List[Dict[str, object]], slo_ms: float) -> Optional[float]:
+    """Primeira taxa oferecida em que a vazão não acompanha (<90%) ou o p95 passa do SLO"""
+    for step in steps:
+        check = step["by_kind"].get("check") or next(iter(step["by_kind"].values()), {})
+        if step["achieved_rate"] < 0.9 * step["offered_rate"] or check.get("p95_ms", 0.0) > slo_ms:
+            return step["offered_rate"]
+    return None
+
+
+def print_step(step: Dict[str, object]):
+    print(f"  oferecido {step['offered_rate']:.2f} req/s, obtido {step['achieved_rate']:.2f} req/s, "
+          f"erros {step['error_rate'] * 100:.1f}%, 429 {step['rate_429'] * 100:.1f}%")
+    for kind, stats in step["by_kind"].items():
+        if stats.get("n"):
+            print(f"    {kind:<10} n={stats['n']:<5} p50={stats['p50_ms']:.0f}ms p95={stats['p95_ms']:.0f}ms "
+                  f"p99={stats['p99_ms']:.0f}ms status={stats['status']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="URL base da API (padrão: API no mesmo processo)")
+    parser.add_argument("--images", help="diretório com fotos para /access/check (padrão: sintéticas)")
+    parser.add_argument("--register", action="store_true",
+                        help="no modo local, cadastra a primeira foto para gerar acessos liberados")
+    parser.add_argument("--user-email", default=LOAD_USER_EMAIL, help="usuário usado em /documents")
+    parser.add_argument("--model", choices=["poisson", "bursty", "replay"], default="poisson")
+    parser.add_argument("--rates", default="1,2,4", help="taxas (req/s) testadas em sequência")
+    parser.add_argument("--duration", type=float, default=30.0, help="duração de cada etapa (s)")
+    parser.add_argument("--concurrency", type=int, default=64, help="máximo de requisições simultâneas")
+    parser.add_argument("--mix", default="check=1", help="ex.: check=0.8,documents=0.1,stats=0.1")
+    parser.add_argument("--burst-factor", type=float, default=5.0)
+    parser.add_argument("--burst-seconds", type=float, default=5.0)
+    parser.add_argument("--burst-period", type=float, default=30.0)
+    parser.add_argument("--replay-db", help="banco SQLite com access_logs para o modelo replay")
+    parser.add_argument("--speedup", type=float, default=1.0, help="aceleração do replay")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="p95 aceitável para /access/check")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="arquivo JSON com o relatório")
+    args = parser.parse_args()
+
+    if args.model == "replay" and not args.replay_db:
+        parser.error("--model replay exige --replay-db")
+    if args.register and (args.url or not args.images):
+        parser.error("--register só vale no modo local e com --images")
+
+    replay_db = os.path.abspath(args.replay_db) if args.replay_db else None
+    output = os.path.abspath(args.output) if args.output else None
+    images = load_images(os.path.abspath(args.images) if args.images else None)
+    images = images or [encode_jpeg(synthetic_image(1280, 720, seed=seed)) for seed in range(3)]
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+
+    def plan(rate: float) -> List[Tuple[float, str]]:
+        if args.model == "replay":
+            return replay_schedule(replay_db, args.speedup, args.duration)
+        if args.model == "bursty":
+            times = bursty_schedule(rate, args.duration, rng, args.burst_factor, args.burst_seconds, args.burst_period)
+        else:
+            times = poisson_schedule(rate, args.duration, rng)
+        kinds, weights = list(mix), list(mix.values())
+        return [(t, rng.choices(kinds, weights)[0]) for t in times]
+
+    async def run():
+        steps = []
+        async with LoadTarget(args.url, images, args.user_email, args.register) as target:
+            rates = [0.0] if args.model == "replay" else [float(r) for r in args.rates.split(",") if r]
+            for rate in rates:
+                schedule = plan(rate)
+                label = "replay" if args.model == "replay" else f"{rate:g} req/s"
+                print(f"Etapa {label}: {len(schedule)} requisições")
+                started = time.perf_counter()
+                step = await run_step(target, schedule, args.concurrency)
+                step["rate"] = rate
+                step["wall_seconds"] = time.perf_counter() - started
+                print_step(step)
+                steps.append(step)
+        return steps
+
+    steps = asyncio.run(run())
+    saturation = find_saturation(steps, args.slo_ms)
+    if saturation is None:
+        print("Saturação não atingida nas taxas testadas")
+    else:
+        print(f"Saturação em ~{saturation:.2f} req/s (vazão < 90% do oferecido ou p95 > {args.slo_ms:.0f}ms)")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"environment": environment_info(), "args": vars(args), "steps": steps,
+                       "saturation_rate": saturation}, f, indent=2)
+        print(f"Relatório gravado em {output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""
+Reconstrói a galeria de encodings a partir das fotos de cadastro.
+
+Necessário depois de mudar o pipeline (rotações, pré-processamento,
+detecção): os encodings antigos foram gerados com outros parâmetros. Os
+usuários ativos são recodificados em paralelo (um processo por núcleo) a
+partir de AuthorizedUser.image_path, em uma geração nova em
+data/galleries/. Cada encoding é gravado assim que fica pronto, então uma
+execução interrompida pode ser retomada com --resume sem refazer o que já
+foi feito.
+
+Ao final, a geração é publicada em AuthorizedUser.face_embedding em uma
+única transação (cadastros e remoções feitos durante a reconstrução são
+respeitados) e os servidores em execução passam a usá-la na próxima
+verificação (GALLERY_WATCH_INTERVAL_SECONDS), sem reinício. Usuários cujas
+fotos não geram mais uma face são listados no relatório; por padrão eles
+mantêm o encoding anterior (use --drop-failed para retirá-los).
+
+Uso (a partir de backend/):
+    python -m tools.rebuild_gallery --workers 4 --report rebuild.json
+    python -m tools.rebuild_gallery --resume
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import config
+import gallery
+
+
+_worker_system = None
+
+
+def _init_worker():
+    """Carrega os modelos uma vez por processo"""
+    global _worker_system
+    from face_recognition_module import FaceRecognitionSystem
+
+    _worker_system = FaceRecognitionSystem(lazy=True)
+    _worker_system.load_models()
+
+
+def _encode_user(user_id: int, image_path: Optional[str]) -> Tuple[int, Optional[list], str]:
+    """Recodifica a foto de um usuário (roda nos processos do pool)"""
+    if not image_path or not os.path.exists(image_path):
+        return user_id, None, "Foto de cadastro não encontrada"
+    try:
+        encoding, error = _worker_system.encode_enrollment_image(image_path)
+    except Exception as e:
+        return user_id, None, f"Erro ao processar a foto: {e}"
+    if encoding is None:
+        return user_id, None, error
+    return user_id, encoding.tolist(), ""
+
+
+def active_users() -> Dict[str, dict]:
+    from database import AuthorizedUser, SessionLocal
+
+    db = SessionLocal()
+    try:
+        users = db.query(AuthorizedUser).filter(AuthorizedUser.is_active == True).all()
+        return {user.email: {"id": user.id, "name": user.name, "email": user.email,
+                             "image_path": user.image_path} for user in users}
+    finally:
+        db.close()
+
+
+def read_failures(directory: str) -> Dict[str, dict]:
+    failures = {}
+    path = os.path.join(directory, gallery.FAILURES_FILE)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    failures[record["email"]] = record
+    return failures
+
+
+def start_generation(root: str, signature: dict, resume: bool, generation: Optional[str]) -> Tuple[str, dict]:
+    """Cria uma geração nova ou retoma uma em construção"""
+    if resume:
+        building = [name for name in gallery.list_generations(root)
+                    if gallery.read_manifest(root, name).get("status") == gallery.BUILDING]
+        generation = generation or (building[-1] if building else None)
+        if generation is None:
+            raise SystemExit("Nenhuma reconstrução interrompida para retomar")
+        manifest = gallery.read_manifest(root, generation)
+        if manifest.get("status") != gallery.BUILDING:
+            raise SystemExit(f"A geração {generation} não está em construção")
+        if manifest.get("signature") != signature:
+            raise SystemExit(f"O pipeline mudou desde o início da geração {generation}; "
+                             f"rode sem --resume para começar outra")
+        return generation, manifest
+
+    generation = generation or gallery.new_generation_id()
+    directory = gallery.generation_dir(root, generation)
+    if os.path.exists(directory):
+        raise SystemExit(f"A geração {generation} já existe")
+    os.makedirs(directory)
+    manifest = {
+        "generation": generation,
+        "status": gallery.BUILDING,
+        "signature": signature,
+        "started_at": datetime.now().isoformat(),
+    }
+    gallery.write_manifest(root, generation, manifest)
+    return generation, manifest
+
+
+def encode_all(users: Dict[str, dict], directory: str, workers: int) -> Tuple[int, float]:
+    """Recodifica quem ainda não tem encoding nem falha registrada nesta geração"""
+    failures = read_failures(directory)
+    pending = [user for email, user in users.items()
+               if email not in failures and not os.path.exists(gallery.encoding_path(directory, email))]
+    print(f"{len(users)} usuários ativos, {len(users) - len(pending)} já processados, {len(pending)} pendentes")
+    if not pending:
+        return 0, 0.0
+
+    by_id = {user["id"]: user for user in pending}
+    start = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor, \
+            open(os.path.join(directory, gallery.FAILURES_FILE), "a") as failures_file:
+        futures = [executor.submit(_encode_user, user["id"], user["image_path"]) for user in pending]
+        for future in as_completed(futures):
+            user_id, encoding, error = future.result()
+            user = by_id[user_id]
+            if encoding is not None:
+                gallery.write_encoding(directory, user["email"], user["name"], encoding, user["image_path"])
+            else:
+                failures_file.write(json.dumps({"email": user["email"], "name": user["name"],
+                                                "image_path": user["image_path"], "reason": error},
+                                               ensure_ascii=False) + "\n")
+                failures_file.flush()
+            done += 1
+            if done % 50 == 0 or done == len(pending):
+                print(f"  {done}/{len(pending)} ({done / (time.perf_counter() - start):.1f} usuários/s)")
+    return done, time.perf_counter() - start
+
+
+def publish(directory: str, version: str, drop_failed: bool) -> Dict[str, List[str]]:
+    """
+    Copia a geração para AuthorizedUser.face_embedding em uma única transação
+    (os servidores veem a galeria antiga ou a nova, nunca uma mistura):
+
+    - usuários recodificados recebem o novo encoding e a versão do pipeline;
+    - usuários desativados durante a reconstrução ficam de fora;
+    - usuários cadastrados durante a reconstrução mantêm o encoding do cadastro;
+    - usuários com falha mantêm o encoding anterior (ou saem da galeria com --drop-failed).
+    """
+    from database import AuthorizedUser, SessionLocal
+    from embeddings import to_blob
+
+    failures = read_failures(directory)
+    changes = {"updated": [], "kept_previous": [], "dropped": [], "not_rebuilt": [], "missing": []}
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        for user in db.query(AuthorizedUser).filter(AuthorizedUser.is_active == True).all():
+            data = gallery.read_json(gallery.encoding_path(directory, user.email))
+            if data is not None:
+                user.face_embedding = to_blob(data["encoding"])
+                user.embedding_version = version
+                user.embedding_updated_at = now
+                changes["updated"].append(user.email)
+            elif user.email in failures:
+                if drop_failed:
+                    user.face_embedding = None
+                    user.embedding_updated_at = now
+                    changes["dropped"].append(user.email)
+                else:
+                    changes["kept_previous"].append(user.email)
+            else:
+                changes["not_rebuilt"].append(user.email)
+            if user.face_embedding is None and user.email not in changes["dropped"]:
+                changes["missing"].append(user.email)
+        db.commit()
+    finally:
+        db.close()
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processos de encoding")
+    parser.add_argument("--resume", action="store_true", help="retoma a reconstrução interrompida mais recente")
+    parser.add_argument("--generation", help="nome da geração (padrão: data e hora)")
+    parser.add_argument("--drop-failed", action="store_true",
+                        help="retira da galeria usuários cujas fotos não geram face (padrão: mantém o encoding anterior)")
+    parser.add_argument("--no-publish", action="store_true", help="só constrói; a geração não entra em uso")
+    parser.add_argument("--keep", type=int, default=config.GALLERY_KEEP_GENERATIONS,
+                        help="gerações prontas mantidas no disco")
+    parser.add_argument("--report", help="arquivo JSON com o relatório")
+    args = parser.parse_args()
+
+    from database import init_database
+    from face_recognition_module import FaceRecognitionSystem
+
+    init_database()
+    root = config.GALLERY_DIR
+    face_system = FaceRecognitionSystem(lazy=True)
+    signature = face_system.pipeline_signature()
+    generation, manifest = start_generation(root, signature, args.resume, args.generation)
+    manifest["version"] = face_system.pipeline_version()
+    directory = gallery.generation_dir(root, generation)
+    print(f"Geração {generation} em {directory}")
+
+    encoded, seconds = encode_all(active_users(), directory, max(1, args.workers))
+    failures = read_failures(directory)
+
+    manifest.update({
+        "status": gallery.READY,
+        "finished_at": datetime.now().isoformat(),
+        "users": sum(1 for name in os.listdir(directory) if name.endswith(gallery.ENCODING_SUFFIX)),
+        "failures": len(failures),
+        "drop_failed": args.drop_failed,
+    })
+    gallery.write_manifest(root, generation, manifest)
+
+    changes = {}
+    if not args.no_publish:
+        changes = publish(directory, manifest["version"], args.drop_failed)
+        manifest.update({"status": gallery.PUBLISHED, "published_at": datetime.now().isoformat()})
+        gallery.write_manifest(root, generation, manifest)
+        removed = gallery.prune(root, args.keep)
+        print(f"Geração {generation} publicada no banco" + (f"; removidas: {', '.join(removed)}" if removed else ""))
+
+    print(f"{encoded} usuários recodificados em {seconds:.1f}s com {args.workers} processos")
+    if changes.get("kept_previous"):
+        print(f"{len(changes['kept_previous'])} usuários mantiveram o encoding anterior")
+    if changes.get("not_rebuilt"):
+        print(f"{len(changes['not_rebuilt'])} usuários cadastrados durante a reconstrução mantiveram o encoding do cadastro")
+    if failures:
+        print(f"{len(failures)} usuários sem face nas fotos de cadastro:")
+        for record in failures.values():
+            print(f"  {record['email']:<40} {record['reason']}")
+    if changes.get("missing"):
+        print(f"{len(changes['missing'])} usuários ativos ficaram fora da galeria: {', '.join(changes['missing'])}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"generation": generation, "published": not args.no_publish, "encoded": encoded,
+                       "seconds": seconds, "workers": args.workers, "failures": list(failures.values()),
+                       **changes}, f, indent=2, ensure_ascii=False)
+        print(f"Relatório gravado em {os.path.abspath(args.report)}")
+
+
+if __name__ == "__main__":
+    main()
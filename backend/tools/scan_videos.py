@@ -0,0 +1,451 @@
+"""
+Procura faces em vídeos gravados (investigação de incidentes).
+
+Cada vídeo é dividido em trechos de --segment-seconds, e os trechos de todos
+os vídeos são distribuídos entre os processos do pool. Cada processo abre o
+vídeo, pula para o início do trecho e lê um frame por vez (o vídeo nunca é
+carregado inteiro), reconhecendo --sample-fps frames por segundo de vídeo:
+detecção e encoding das faces com o perfil escolhido, sem o controle de
+qualidade. Os encodings de cada trecho vão para
+<saída>/detections/<vídeo>.ndjson assim que o trecho termina, então uma
+execução interrompida pode ser retomada com --resume sem refazer o que já foi
+feito.
+
+No fim, as detecções de cada vídeo são comparadas com a galeria do banco de
+uma vez (matriz de distâncias vetorizada). Faces não autorizadas são
+agrupadas entre si (desconhecido-1, desconhecido-2...) para que a mesma
+pessoa possa ser seguida no vídeo. Detecções seguidas da mesma identidade,
+separadas por até --gap segundos, viram uma aparição com início, fim e maior
+confiança, gravadas em <saída>/timeline.csv e <saída>/timeline.ndjson.
+
+Uso (a partir de backend/):
+    python -m tools.scan_videos gravacoes/*.mp4 --sample-fps 2 --workers 4 --output scan/
+    python -m tools.scan_videos gravacoes/*.mp4 --output scan/ --resume
+"""
+import argparse
+import base64
+import csv
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+import config
+
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".m4v", ".webm", ".mpg", ".mpeg", ".ts")
+
+# fps assumido quando o contêiner não informa
+DEFAULT_VIDEO_FPS = 25.0
+
+# Detecções comparadas com a galeria por bloco (limita a matriz de distâncias)
+MATCH_BATCH = 1024
+
+TIMELINE_FIELDS = ["video", "identity", "authorized", "email", "start_seconds", "end_seconds", "start", "end",
+                   "detections", "best_confidence"]
+
+_worker_system = None
+_worker_settings = {}
+
+
+def _init_worker():
+    """Carrega os modelos uma vez por processo"""
+    global _worker_system
+    from face_recognition_module import FaceRecognitionSystem
+
+    _worker_system = FaceRecognitionSystem(lazy=True)
+    _worker_system.load_models()
+
+
+def _settings(profile_name: str):
+    if profile_name not in _worker_settings:
+        from recognition_profiles import get_profile
+
+        _worker_settings[profile_name] = _worker_system.settings(get_profile(profile_name))
+    return _worker_settings[profile_name]
+
+
+def _scan_segment(path: str, segment: int, start_frame: int, end_frame: Optional[int], fps: float,
+                  step: int, profile_name: str) -> dict:
+    """Detecta e codifica as faces dos frames amostrados de um trecho (roda nos processos do pool)"""
+    from embeddings import EMBEDDING_DTYPE
+    from image_pipeline import prepare_image
+
+    settings = _settings(profile_name)
+    capture = cv2.VideoCapture(path)
+    if start_frame:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    detections, sampled = [], 0
+    start = time.perf_counter()
+    index = start_frame
+    try:
+        while end_frame is None or index < end_frame:
+            # grab() avança sem converter o frame; só os amostrados são decodificados por inteiro
+            if not capture.grab():
+                break
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    sampled += 1
+                    decoded = prepare_image(frame, target_face_size=settings.detect_target_face_size)
+                    _, encodings_per_face = _worker_system.encode_faces(decoded, {}, settings=settings)
+                    for encodings in encodings_per_face:
+                        if encodings:
+                            data = np.asarray(encodings, dtype=EMBEDDING_DTYPE).tobytes()
+                            detections.append({"t": round(index / fps, 3), "frame": index,
+                                               "encodings": base64.b64encode(data).decode("ascii")})
+            index += 1
+    finally:
+        capture.release()
+    return {"path": path, "segment": segment, "frames": index - start_frame, "sampled": sampled,
+            "seconds": round(time.perf_counter() - start, 2), "detections": detections}
+
+
+def find_videos(inputs: List[str]) -> List[str]:
+    """Arquivos, diretórios (vídeos dentro deles) e padrões glob"""
+    videos = []
+    for item in inputs:
+        matches = glob.glob(item) or [item]
+        for match in sorted(matches):
+            if os.path.isdir(match):
+                for root, _, files in os.walk(match):
+                    videos.extend(os.path.join(root, name) for name in sorted(files)
+                                  if name.lower().endswith(VIDEO_EXTENSIONS))
+            elif os.path.isfile(match):
+                videos.append(match)
+            else:
+                print(f"Ignorado (não encontrado): {match}")
+    return list(dict.fromkeys(os.path.abspath(video) for video in videos))
+
+
+def video_key(path: str) -> str:
+    """Nome do arquivo de detecções de um vídeo (estável entre execuções)"""
+    digest = hashlib.sha1(path.encode()).hexdigest()[:10]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}-{digest}"
+
+
+def probe_video(path: str, segment_seconds: float) -> Optional[dict]:
+    """fps, total de frames e trechos [(início, fim)] de um vídeo; None se não abrir"""
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            return None
+        fps = capture.get(cv2.CAP_PROP_FPS) or DEFAULT_VIDEO_FPS
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    finally:
+        capture.release()
+    if frame_count <= 0:
+        # Contêiner sem contagem de frames: um único trecho lido até o fim
+        return {"fps": fps, "frames": None, "segments": [(0, None)]}
+    length = max(1, int(round(segment_seconds * fps)))
+    segments = [(start, min(start + length, frame_count)) for start in range(0, frame_count, length)]
+    return {"fps": fps, "frames": frame_count, "segments": segments}
+
+
+def read_detections(path: str) -> Tuple[Set[int], List[dict]]:
+    """Trechos já processados e suas detecções (a última linha pode estar incompleta)"""
+    done, detections = set(), []
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                done.add(record["segment"])
+                detections.extend(record["detections"])
+    return done, detections
+
+
+def open_detections(path: str):
+    """Abre o arquivo de detecções para acrescentar, isolando uma linha incompleta de uma execução interrompida"""
+    file = open(path, "a")
+    if file.tell() > 0:
+        with open(path, "rb") as existing:
+            existing.seek(-1, os.SEEK_END)
+            if existing.read(1) != b"\n":
+                file.write("\n")
+    return file
+
+
+def start_run(output: str, signature: dict, resume: bool):
+    manifest_path = os.path.join(output, "manifest.json")
+    if resume:
+        if not os.path.exists(manifest_path):
+            raise SystemExit(f"Nenhuma varredura para retomar em {output}")
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("signature") != json.loads(json.dumps(signature)):
+            raise SystemExit("O pipeline ou os parâmetros de amostragem mudaram desde o início da varredura; "
+                             "rode sem --resume em outro diretório")
+        return
+    if os.path.exists(os.path.join(output, "detections")) and os.listdir(os.path.join(output, "detections")):
+        raise SystemExit(f"{output} já tem uma varredura; use --resume ou outro diretório")
+    os.makedirs(os.path.join(output, "detections"), exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump({"signature": signature, "started_at": time.strftime("%Y-%m-%dT%H:%M:%S")}, f, indent=2)
+
+
+def scan(videos: List[str], output: str, args) -> Tuple[Dict[str, dict], int, float]:
+    """Processa os trechos pendentes de todos os vídeos em paralelo"""
+    probes, pending = {}, []
+    for path in videos:
+        info = probe_video(path, args.segment_seconds)
+        if info is None:
+            print(f"Não foi possível abrir {path}")
+            continue
+        info["detections_path"] = os.path.join(output, "detections", f"{video_key(path)}.ndjson")
+        info["step"] = max(1, int(round(info["fps"] / args.sample_fps)))
+        probes[path] = info
+        done, _ = read_detections(info["detections_path"])
+        pending.extend((path, segment, start, end) for segment, (start, end) in enumerate(info["segments"])
+                       if segment not in done)
+    total_segments = sum(len(info["segments"]) for info in probes.values())
+    print(f"{len(probes)} vídeos, {total_segments} trechos, {total_segments - len(pending)} já processados, "
+          f"{len(pending)} pendentes")
+    if not pending:
+        return probes, 0, 0.0
+
+    start = time.perf_counter()
+    done = sampled = 0
+    files = {}
+    tasks: Iterator = iter(pending)
+    # Janela limitada de trechos em andamento: a memória não cresce com o número de vídeos
+    window = max(1, args.workers) * 2
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as executor:
+            running = set()
+            while True:
+                for path, segment, first, last in tasks:
+                    info = probes[path]
+                    running.add(executor.submit(_scan_segment, path, segment, first, last, info["fps"],
+                                                info["step"], args.profile))
+                    if len(running) >= window:
+                        break
+                if not running:
+                    break
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    path = result.pop("path")
+                    if path not in files:
+                        files[path] = open_detections(probes[path]["detections_path"])
+                    files[path].write(json.dumps(result) + "\n")
+                    files[path].flush()
+                    done += 1
+                    sampled += result["sampled"]
+                    if done % 10 == 0 or done == len(pending):
+                        elapsed = time.perf_counter() - start
+                        print(f"  {done}/{len(pending)} trechos ({sampled / elapsed:.1f} frames amostrados/s)")
+    finally:
+        for file in files.values():
+            file.close()
+    return probes, sampled, time.perf_counter() - start
+
+
+def load_gallery() -> Tuple[np.ndarray, List[str], List[str]]:
+    from database import SessionLocal, init_database
+    from embeddings import load_gallery as load
+
+    init_database()
+    db = SessionLocal()
+    try:
+        encodings, names, emails, _ = load(db)
+    finally:
+        db.close()
+    return encodings, names, emails
+
+
+def decode_detections(detections: List[dict]) -> Tuple[np.ndarray, List[int]]:
+    """Encodings de todas as detecções em uma matriz e o início das linhas de cada detecção"""
+    from embeddings import EMBEDDING_DTYPE, EMBEDDING_SIZE
+
+    blocks, offsets, position = [], [], 0
+    for detection in detections:
+        block = np.frombuffer(base64.b64decode(detection["encodings"]), dtype=EMBEDDING_DTYPE) \
+            .reshape(-1, EMBEDDING_SIZE)
+        blocks.append(block)
+        offsets.append(position)
+        position += len(block)
+    matrix = np.vstack(blocks) if blocks else np.empty((0, EMBEDDING_SIZE), dtype=EMBEDDING_DTYPE)
+    return matrix, offsets
+
+
+def match_detections(detections: List[dict], gallery: np.ndarray, tolerance: float, min_confidence: float):
+    """
+    Menor distância de cada detecção para cada cadastro (mínimo entre os
+    encodings das rotações, como no reconhecimento), em blocos vetorizados
+
+    Returns:
+        (índice do cadastro ou -1, confiança, encodings das detecções)
+    """
+    from benchmarks.sweep import distance_matrix
+
+    matrix, offsets = decode_detections(detections)
+    best = np.full(len(detections), -1, dtype=np.int64)
+    confidence = np.zeros(len(detections))
+    if len(detections) and len(gallery):
+        gallery = gallery.astype(np.float64)
+        bounds = offsets + [len(matrix)]
+        for first in range(0, len(detections), MATCH_BATCH):
+            last = min(first + MATCH_BATCH, len(detections))
+            rows = matrix[bounds[first]:bounds[last]].astype(np.float64)
+            distances = np.minimum.reduceat(distance_matrix(rows, gallery),
+                                            np.asarray(offsets[first:last]) - bounds[first], axis=0)
+            nearest = np.argmin(distances, axis=1)
+            nearest_distance = distances[np.arange(len(distances)), nearest]
+            confidence[first:last] = np.maximum(0.0, (1 - nearest_distance) * 100)
+            accepted = (nearest_distance <= tolerance) & (confidence[first:last] >= min_confidence)
+            best[first:last][accepted] = nearest[accepted]
+    return best, confidence, [matrix[offset] for offset in offsets]
+
+
+def cluster_unknown(encodings: List[np.ndarray], tolerance: float) -> List[int]:
+    """Agrupa faces não autorizadas pela média de cada grupo (número do grupo por face)"""
+    sums, counts, labels = [], [], []
+    for encoding in encodings:
+        if sums:
+            centroids = np.asarray(sums) / np.asarray(counts)[:, None]
+            distances = np.linalg.norm(centroids - encoding, axis=1)
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= tolerance:
+                sums[nearest] = sums[nearest] + encoding
+                counts[nearest] += 1
+                labels.append(nearest)
+                continue
+        sums.append(encoding.astype(np.float64))
+        counts.append(1)
+        labels.append(len(sums) - 1)
+    return labels
+
+
+def format_time(seconds: float) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}"
+
+
+def build_timeline(path: str, detections: List[dict], gallery, tolerance: float, min_confidence: float,
+                   gap: float) -> List[dict]:
+    """Aparições de cada identidade no vídeo, em ordem de início"""
+    encodings, names, emails = gallery
+    detections = sorted(detections, key=lambda detection: detection["t"])
+    best, confidence, face_encodings = match_detections(detections, encodings, tolerance, min_confidence)
+    unknown = [number for number, index in enumerate(best) if index < 0]
+    clusters = dict(zip(unknown, cluster_unknown([face_encodings[number] for number in unknown], tolerance)))
+
+    open_sightings: Dict[str, dict] = {}
+    sightings = []
+    for number, detection in enumerate(detections):
+        index = int(best[number])
+        identity = names[index] if index >= 0 else f"desconhecido-{clusters[number] + 1}"
+        sighting = open_sightings.get(identity)
+        if sighting is None or detection["t"] - sighting["end_seconds"] > gap:
+            sighting = {
+                "video": path, "identity": identity, "authorized": index >= 0,
+                "email": emails[index] if index >= 0 else None,
+                "start_seconds": detection["t"], "end_seconds": detection["t"],
+                "detections": 0, "best_confidence": 0.0,
+            }
+            open_sightings[identity] = sighting
+            sightings.append(sighting)
+        sighting["end_seconds"] = detection["t"]
+        sighting["detections"] += 1
+        if index >= 0:
+            sighting["best_confidence"] = max(sighting["best_confidence"], round(float(confidence[number]), 1))
+
+    for sighting in sightings:
+        sighting["start"] = format_time(sighting["start_seconds"])
+        sighting["end"] = format_time(sighting["end_seconds"])
+        if not sighting["authorized"]:
+            sighting["best_confidence"] = None
+    return sorted(sightings, key=lambda sighting: (sighting["start_seconds"], sighting["identity"]))
+
+
+def write_timeline(output: str, sightings: List[dict], formats: List[str]) -> List[str]:
+    written = []
+    if "csv" in formats:
+        path = os.path.join(output, "timeline.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=TIMELINE_FIELDS)
+            writer.writeheader()
+            writer.writerows(sightings)
+        written.append(path)
+    if "ndjson" in formats:
+        path = os.path.join(output, "timeline.ndjson")
+        with open(path, "w") as f:
+            for sighting in sightings:
+                f.write(json.dumps(sighting, ensure_ascii=False) + "\n")
+        written.append(path)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="+", help="arquivos de vídeo, diretórios ou padrões glob")
+    parser.add_argument("--output", default="video_scan", help="diretório das detecções e da linha do tempo")
+    parser.add_argument("--sample-fps", type=float, default=1.0, help="frames reconhecidos por segundo de vídeo")
+    parser.add_argument("--segment-seconds", type=float, default=60.0,
+                        help="duração dos trechos distribuídos entre os processos")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processos de reconhecimento")
+    parser.add_argument("--profile", default=config.RECOGNITION_PROFILE,
+                        help="perfil de reconhecimento (fast, balanced, accurate)")
+    parser.add_argument("--gap", type=float, default=None,
+                        help="segundos sem detecção que encerram uma aparição (padrão: 3 intervalos de amostragem)")
+    parser.add_argument("--format", default="csv,ndjson", help="formatos da linha do tempo: csv, ndjson")
+    parser.add_argument("--resume", action="store_true", help="retoma a varredura interrompida em --output")
+    args = parser.parse_args()
+
+    from face_recognition_module import FaceRecognitionSystem
+    from recognition_profiles import get_profile
+
+    try:
+        profile = get_profile(args.profile)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if args.sample_fps <= 0:
+        raise SystemExit("--sample-fps deve ser maior que zero")
+    args.workers = max(1, args.workers)
+    gap = args.gap if args.gap is not None else 3.0 / args.sample_fps
+
+    videos = find_videos(args.videos)
+    if not videos:
+        raise SystemExit("Nenhum vídeo encontrado")
+    face_system = FaceRecognitionSystem(lazy=True)
+    settings = face_system.settings(profile)
+    signature = {"pipeline": face_system.pipeline_signature(), "profile": profile.name,
+                 "sample_fps": args.sample_fps, "segment_seconds": args.segment_seconds}
+    start_run(args.output, signature, args.resume)
+
+    probes, sampled, seconds = scan(videos, args.output, args)
+    if sampled:
+        print(f"{sampled} frames amostrados em {seconds:.1f}s com {args.workers} processos")
+
+    gallery = load_gallery()
+    print(f"Comparando com a galeria ({len(gallery[0])} faces autorizadas)")
+    sightings = []
+    for path, info in probes.items():
+        done, detections = read_detections(info["detections_path"])
+        if len(done) < len(info["segments"]):
+            print(f"  {path}: {len(info['segments']) - len(done)} trechos faltando (use --resume)")
+        video_sightings = build_timeline(path, detections, gallery, settings.tolerance, settings.min_confidence, gap)
+        authorized = len({sighting["identity"] for sighting in video_sightings if sighting["authorized"]})
+        unknown = len({sighting["identity"] for sighting in video_sightings if not sighting["authorized"]})
+        print(f"  {os.path.basename(path)}: {len(detections)} faces, {len(video_sightings)} aparições, "
+              f"{authorized} autorizados, {unknown} desconhecidos")
+        sightings.extend(video_sightings)
+
+    formats = [item.strip() for item in args.format.split(",") if item.strip()]
+    for path in write_timeline(args.output, sightings, formats):
+        print(f"Linha do tempo gravada em {os.path.abspath(path)}")
+
+
+if __name__ == "__main__":
+    main()
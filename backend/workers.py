@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+import config
+import metrics
+
+
+class RecognitionPool:
+    """
+    Pool de threads para o trabalho pesado de reconhecimento.
+
+    Tira o OpenCV/dlib do event loop (que continua atendendo /health, /metrics
+    etc.) e mantém a contagem de itens na fila e em execução.
+    """
+
+    def __init__(self, max_workers: int = config.RECOGNITION_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="recognition")
+        self.queued = 0
+        self.in_flight = 0
+        self._waiting: Dict[int, float] = {}  # itens na fila -> instante em que entraram
+        self._lock = threading.Lock()
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Executa func em um worker e aguarda o resultado"""
+        loop = asyncio.get_running_loop()
+        enqueued_at = time.perf_counter()
+        state = {"started": False}
+        token = id(state)
+        self._enqueued(token, enqueued_at)
+
+        def task():
+            with self._lock:
+                if state.get("abandoned"):
+                    return None
+                state["started"] = True
+            self._started(token, time.perf_counter() - enqueued_at)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._finished()
+
+        try:
+            return await loop.run_in_executor(self.executor, task)
+        finally:
+            # Cancelado antes de começar: sai da fila e não roda mais
+            with self._lock:
+                abandoned = not state["started"]
+                state["abandoned"] = abandoned
+            if abandoned:
+                self._dequeued(token)
+
+    def outstanding(self) -> int:
+        """Itens na fila mais em execução"""
+        with self._lock:
+            return self.queued + self.in_flight
+
+    def oldest_wait(self) -> float:
+        """Há quanto tempo (s) o item mais antigo da fila espera por um worker (0 sem fila)"""
+        with self._lock:
+            oldest = min(self._waiting.values(), default=None)
+        return time.perf_counter() - oldest if oldest is not None else 0.0
+
+    def _enqueued(self, token: int, enqueued_at: float):
+        with self._lock:
+            self.queued += 1
+            self._waiting[token] = enqueued_at
+        metrics.QUEUE_DEPTH.inc()
+
+    def _dequeued(self, token: int):
+        with self._lock:
+            self.queued -= 1
+            self._waiting.pop(token, None)
+        metrics.QUEUE_DEPTH.dec()
+
+    def _started(self, token: int, wait_seconds: float):
+        with self._lock:
+            self.queued -= 1
+            self.in_flight += 1
+            self._waiting.pop(token, None)
+        metrics.QUEUE_DEPTH.dec()
+        metrics.IN_FLIGHT.inc()
+        metrics.QUEUE_WAIT.observe(wait_seconds)
+
+    def _finished(self):
+        with self._lock:
+            self.in_flight -= 1
+        metrics.IN_FLIGHT.dec()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+recognition_pool = RecognitionPool()
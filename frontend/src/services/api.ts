@@ -31,6 +31,21 @@ export interface User {
     is_active: boolean;
 }
 
+export interface RegistrationJob {
+    id: string;
+    name: string;
+    email: string;
+    access_level: AccessLevel;
+    status: 'queued' | 'running' | 'succeeded' | 'failed';
+    attempts: number;
+    message?: string;
+    retryable: boolean;
+    user_id?: number;
+    created_at: string;
+    updated_at: string;
+    finished_at?: string;
+}
+
 export interface UserUpdate{
     name?: string;
     access_level?: AccessLevel;
@@ -55,6 +70,8 @@ export interface DocumentAccessResponse{
 }
 
 
+export type RecognitionProfile = 'fast' | 'balanced' | 'accurate';
+
 export interface AccessResponse {
     access_granted: boolean;
     user_name?: string | null;
@@ -64,6 +81,18 @@ export interface AccessResponse {
     access_level?: AccessLevel;
     locked?: boolean;
     lock_remaining_seconds?: number;
+    retake?: boolean;
+    quality_reason?: string | null;
+    recognition_profile?: string | null;
+    degradation?: 'reduced' | 'minimal' | null;
+}
+
+export interface StreamDecision extends AccessResponse {
+    status: 'granted' | 'denied' | 'pending' | 'no_face' | 'retake' | 'locked' | 'shed' | 'error' | 'not_ready';
+    frame?: number;
+    retry_after?: number;
+    dropped?: number;
+    latency_ms?: number;
 }
 
 export interface AccessLog {
@@ -73,6 +102,10 @@ export interface AccessLog {
     timestamp: string;
     confidence_score: string | null;
     access_type?: 'facial_recognition' | 'document_access' | 'document_download' | 'lockout';
+    recognition_profile?: RecognitionProfile | null;
+    recognition_ms?: number | null;
+    camera?: string | null;
+    has_snapshot?: boolean;
 }
 
 export interface Stats {
@@ -84,6 +117,75 @@ export interface Stats {
     current_lockouts?: number;
 }
 
+export interface AttemptsPoint {
+    bucket: string;
+    granted: number;
+    denied: number;
+    total: number;
+}
+
+export interface TopUser {
+    user_id: number;
+    name: string | null;
+    granted: number;
+    denied: number;
+    total: number;
+}
+
+export interface DenialSpikes {
+    baseline_mean: number;
+    baseline_std: number;
+    threshold: number;
+    spikes: (AttemptsPoint & { excess: number })[];
+}
+
+export interface DocumentHeatmap {
+    days: string[];
+    documents: {
+        document_id: number;
+        title: string | null;
+        granted: number[];
+        denied: number[];
+        total: number;
+    }[];
+}
+
+export interface Camera {
+    id: number;
+    name: string;
+    source: string;
+    enabled: boolean;
+    priority: number;
+    max_fps: number | null;
+    profile: RecognitionProfile | null;
+    created_at?: string;
+    updated_at?: string;
+}
+
+export type CameraInput = Omit<Camera, 'id' | 'created_at' | 'updated_at'>;
+
+export interface CameraStats {
+    id: number;
+    name: string;
+    enabled: boolean;
+    priority: number;
+    max_fps: number;
+    profile: RecognitionProfile;
+    state: 'connecting' | 'running' | 'reconnecting' | 'stopped';
+    captured: number;
+    processed: number;
+    dropped: number;
+    stale: number;
+    unchanged: number;
+    errors: number;
+    decisions: number;
+    throughput_fps: number;
+    lag_ms: number | null;
+    last_lag_ms: number | null;
+    scheduler_wait_ms: number | null;
+    pool_share: number;
+}
+
 export interface LevelInfo{
     value: string;
     label: string;
@@ -100,18 +202,32 @@ export const apiService = {
         const response = await api.get<User[]>('/users');
         return response.data;
     },
-     registerUser: async (name: string, email: string, accessLevel: AccessLevel, imageFile: File): Promise<User> => {
+     registerUser: async (name: string, email: string, accessLevel: AccessLevel, imageFile: File): Promise<RegistrationJob> => {
         const formData = new FormData();
         formData.append('name', name);
         formData.append('email', email);
         formData.append('access_level', accessLevel);
         formData.append('image', imageFile);
 
-        const response = await api.post<User>('/users/register', formData, {
+        // O cadastro roda em segundo plano: acompanha o job até terminar
+        const response = await api.post<RegistrationJob>('/users/register', formData, {
             headers: {
                 'Content-Type': 'multipart/form-data',
             },
         });
+        let job = response.data;
+        while (job.status === 'queued' || job.status === 'running') {
+            await new Promise((resolve) => setTimeout(resolve, 1000));
+            job = await apiService.getRegistrationJob(job.id);
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.message || 'Falha no cadastro');
+        }
+        return job;
+    },
+
+    async getRegistrationJob(jobId: string): Promise<RegistrationJob> {
+        const response = await api.get<RegistrationJob>(`/users/register/jobs/${jobId}`);
         return response.data;
     },
 
@@ -125,9 +241,12 @@ export const apiService = {
     },
 
 
-    async checkAccess(imageFile: File): Promise<AccessResponse> {
+    async checkAccess(imageFile: File, profile?: RecognitionProfile): Promise<AccessResponse> {
     const formData = new FormData();
     formData.append('image', imageFile);
+    if (profile) {
+        formData.append('profile', profile);
+    }
 
     try {
         // validateStatus pra não jogar exceção automaticamente
@@ -236,15 +355,73 @@ export const apiService = {
         return response.data;
     },
 
+    getAccessSnapshotUrl(logId: number): string {
+        return `${API_BASE_URL}/access/logs/${logId}/snapshot`;
+    },
+
     async getStats(): Promise<Stats> {
         const response = await api.get<Stats>('/stats');
         return response.data;
     },
 
+    // Analytics (servidos pelos agregados por hora/dia)
+    async getAttemptsOverTime(granularity: 'hour' | 'day' = 'hour'): Promise<AttemptsPoint[]> {
+        const response = await api.get<AttemptsPoint[]>('/analytics/attempts', { params: { granularity } });
+        return response.data;
+    },
+
+    async getTopUsers(days: number = 7, limit: number = 10): Promise<TopUser[]> {
+        const response = await api.get<TopUser[]>('/analytics/top-users', { params: { days, limit } });
+        return response.data;
+    },
+
+    async getDenialSpikes(hours: number = 24): Promise<DenialSpikes> {
+        const response = await api.get<DenialSpikes>('/analytics/denial-spikes', { params: { hours } });
+        return response.data;
+    },
+
+    async getDocumentHeatmap(days: number = 30): Promise<DocumentHeatmap> {
+        const response = await api.get<DocumentHeatmap>('/analytics/documents/heatmap', { params: { days } });
+        return response.data;
+    },
+
+    // Câmeras registradas (cada uma ativa roda um pipeline de reconhecimento no servidor)
+    async getCameras(): Promise<Camera[]> {
+        const response = await api.get<Camera[]>('/cameras');
+        return response.data;
+    },
+
+    async createCamera(camera: CameraInput): Promise<Camera> {
+        const response = await api.post<Camera>('/cameras', camera);
+        return response.data;
+    },
+
+    async updateCamera(cameraId: number, changes: Partial<CameraInput>): Promise<Camera> {
+        const response = await api.put<Camera>(`/cameras/${cameraId}`, changes);
+        return response.data;
+    },
+
+    async deleteCamera(cameraId: number): Promise<void> {
+        await api.delete(`/cameras/${cameraId}`);
+    },
+
+    async getCameraStats(): Promise<{ scheduler_slots: number; cameras: CameraStats[] }> {
+        const response = await api.get('/cameras/stats');
+        return response.data;
+    },
+
     async healthCheck(): Promise<any> {
         const response = await api.get('/health');
         return response.data;
     },
+
+    // Verificação contínua: envie cada frame JPEG com socket.send(blob)
+    openAccessStream(onDecision: (decision: StreamDecision) => void): WebSocket {
+        const socket = new WebSocket(`${API_BASE_URL.replace(/^http/, 'ws')}/access/stream`);
+        socket.binaryType = 'arraybuffer';
+        socket.onmessage = (event) => onDecision(JSON.parse(event.data));
+        return socket;
+    },
 };
 
 export default apiService;